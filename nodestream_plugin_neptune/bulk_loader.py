@@ -0,0 +1,502 @@
+import asyncio
+import csv
+import gzip
+import json
+import math
+import numbers
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .columnar import MISSING, NON_FINITE_FLOAT_MESSAGE, ColumnarBatch, concat_batches
+from .ingest_query_builder import (
+    GENERIC_FROM_NODE_REF_NAME,
+    GENERIC_NODE_REF_NAME,
+    GENERIC_TO_NODE_REF_NAME,
+    generate_id_param_name,
+)
+from .node_ids import hash_id
+
+DEFAULT_ROWS_PER_FILE = 500_000
+DEFAULT_POLL_INTERVAL = 10.0
+
+NODES = "nodes"
+RELATIONSHIPS = "relationships"
+
+ID_COLUMN = ":ID"
+LABEL_COLUMN = ":LABEL"
+START_ID_COLUMN = ":START_ID"
+END_ID_COLUMN = ":END_ID"
+TYPE_COLUMN = ":TYPE"
+SYSTEM_COLUMNS = frozenset(
+    (ID_COLUMN, LABEL_COLUMN, START_ID_COLUMN, END_ID_COLUMN, TYPE_COLUMN)
+)
+
+LOAD_COMPLETED = "LOAD_COMPLETED"
+PENDING_LOAD_STATUSES = frozenset(
+    ("LOAD_NOT_STARTED", "LOAD_IN_QUEUE", "LOAD_IN_PROGRESS")
+)
+
+NODE_ID_PARAM_NAME = generate_id_param_name(GENERIC_NODE_REF_NAME)
+FROM_NODE_ID_PARAM_NAME = generate_id_param_name(GENERIC_FROM_NODE_REF_NAME)
+TO_NODE_ID_PARAM_NAME = generate_id_param_name(GENERIC_TO_NODE_REF_NAME)
+
+
+class BulkLoadError(Exception):
+    """Raised when a bulk load job does not complete successfully."""
+
+
+def _plain_value(value: Any) -> Any:
+    # The same conversions the parameters of upserts go through, so that bulk
+    # loaded properties hold the values the queries would have written.
+    if isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+        return value
+    return str(value)
+
+
+def _scalar_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "Bool"
+    if isinstance(value, int):
+        return "Long"
+    if isinstance(value, float):
+        return "Double"
+    return "String"
+
+
+def _is_empty(value: Any) -> bool:
+    return value is MISSING or value is None
+
+
+def column_type(values: Sequence[Any]) -> str:
+    """Returns the bulk load CSV type of a column of plain values.
+
+    Columns mixing integers and floats are Doubles and columns mixing any
+    other types are Strings. Lists make the column an array of the type of
+    their items.
+    """
+    types, is_array = set(), False
+    for value in values:
+        if _is_empty(value):
+            continue
+        if isinstance(value, (list, tuple)):
+            is_array = True
+            types.update(_scalar_type(item) for item in value if item is not None)
+        else:
+            types.add(_scalar_type(value))
+    if types == {"Long", "Double"}:
+        type_name = "Double"
+    elif len(types) == 1:
+        (type_name,) = types
+    else:
+        type_name = "String"
+    return f"{type_name}[]" if is_array else type_name
+
+
+def _format_scalar(value: Any, type_name: str) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if type_name == "Double":
+        return repr(float(value))
+    if type_name == "String" and not isinstance(value, str):
+        return json.dumps(value)
+    return str(value)
+
+
+def format_cell(value: Any, type_name: str) -> str:
+    """Formats a plain value for a column of `type_name`, empty when there is none."""
+    if _is_empty(value):
+        return ""
+    if not type_name.endswith("[]"):
+        return _format_scalar(value, type_name)
+    item_type = type_name[:-2]
+    items = value if isinstance(value, (list, tuple)) else (value,)
+    # Array items are separated by semicolons, which are escaped in the items.
+    return ";".join(
+        _format_scalar(item, item_type).replace(";", "\\;")
+        for item in items
+        if item is not None
+    )
+
+
+def _escape_property_name(name: str) -> str:
+    return name.replace(":", "\\:")
+
+
+def node_rows(labels: Sequence[str], parameters: ColumnarBatch) -> ColumnarBatch:
+    """Turns the parameters of a node upsert into the rows of a node file."""
+    columns = {
+        ID_COLUMN: parameters.column(NODE_ID_PARAM_NAME),
+        LABEL_COLUMN: [";".join(labels)] * len(parameters),
+    }
+    for name, column in parameters.columns.items():
+        if name != NODE_ID_PARAM_NAME:
+            columns[name] = column
+    return ColumnarBatch(columns, len(parameters), parameters.sparse)
+
+
+def relationship_rows(
+    type: str,
+    key_names: Sequence[str] | None,
+    parameters: ColumnarBatch,
+) -> ColumnarBatch:
+    """Turns the parameters of a relationship upsert into the rows of a relationship file.
+
+    Relationship ids are derived from the ids of their nodes, their type and
+    their key values, so that loading the same relationship again updates it
+    the way MERGE would. Without `key_names`, i.e. for relationships that are
+    always created, every row gets a new id.
+    """
+    from_ids = parameters.column(FROM_NODE_ID_PARAM_NAME)
+    to_ids = parameters.column(TO_NODE_ID_PARAM_NAME)
+    if key_names is None:
+        ids = [uuid.uuid4().hex for _ in range(len(parameters))]
+    else:
+        keys = [parameters.column(name) for name in key_names]
+        ids = [
+            hash_id(from_id, type, *key_values, to_id)
+            for from_id, to_id, *key_values in zip(from_ids, to_ids, *keys)
+        ]
+    columns = {
+        ID_COLUMN: ids,
+        START_ID_COLUMN: from_ids,
+        END_ID_COLUMN: to_ids,
+        TYPE_COLUMN: [type] * len(parameters),
+    }
+    for name, column in parameters.columns.items():
+        if name not in (FROM_NODE_ID_PARAM_NAME, TO_NODE_ID_PARAM_NAME):
+            columns[name] = column
+    return ColumnarBatch(columns, len(parameters), parameters.sparse)
+
+
+class BulkLoadFileWriter:
+    """Writes rows to openCypher bulk load CSV files.
+
+    Rows are kept per kind and group, e.g. the labels of nodes, until
+    `rows_per_file` of them are pending, and are then written to a file of
+    their own, gzipped if `compress` is set. Every file gets the header of
+    the columns its rows have, typed from their values.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        rows_per_file: int = DEFAULT_ROWS_PER_FILE,
+        compress: bool = True,
+    ) -> None:
+        if rows_per_file < 1:
+            raise ValueError("`rows_per_file` must be at least 1.")
+        self.directory = Path(directory)
+        self.rows_per_file = rows_per_file
+        self.compress = compress
+        self.pending: Dict[Tuple[str, str], List[ColumnarBatch]] = {}
+        self.pending_rows: Dict[Tuple[str, str], int] = {}
+        self.files: Dict[str, List[Path]] = {NODES: [], RELATIONSHIPS: []}
+        self.rows_written = 0
+
+    async def add(self, kind: str, group: str, rows: ColumnarBatch):
+        key = (kind, group)
+        self.pending.setdefault(key, []).append(rows)
+        self.pending_rows[key] = self.pending_rows.get(key, 0) + len(rows)
+        while self.pending_rows[key] >= self.rows_per_file:
+            pending = concat_batches(self.pending.pop(key))
+            self.pending[key] = [pending[self.rows_per_file :]]
+            self.pending_rows[key] = len(pending) - self.rows_per_file
+            await self.write(kind, pending[: self.rows_per_file])
+
+    async def write(self, kind: str, rows: ColumnarBatch):
+        suffix = ".csv.gz" if self.compress else ".csv"
+        path = self.directory / kind / f"{len(self.files[kind]):05d}{suffix}"
+        self.files[kind].append(path)
+        self.rows_written += len(rows)
+        # Writing and compressing files would otherwise hold up the event loop.
+        await asyncio.to_thread(self.write_file, path, rows)
+
+    def write_file(self, path: Path, rows: ColumnarBatch):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header, columns = [], []
+        for name, values in rows.columns.items():
+            values = [
+                value if _is_empty(value) else self._plain(value) for value in values
+            ]
+            if name in SYSTEM_COLUMNS:
+                header.append(name)
+                columns.append([format_cell(value, "String") for value in values])
+                continue
+            if all(_is_empty(value) for value in values):
+                # Rows of other files may have this property, these do not.
+                continue
+            type_name = column_type(values)
+            header.append(f"{_escape_property_name(name)}:{type_name}")
+            columns.append([format_cell(value, type_name) for value in values])
+
+        opener = gzip.open if self.compress else open
+        with opener(path, "wt", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file, lineterminator="\n")
+            writer.writerow(header)
+            writer.writerows(zip(*columns))
+
+    @staticmethod
+    def _plain(value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            return [None if item is None else _plain_value(item) for item in value]
+        return _plain_value(value)
+
+    async def close(self) -> Dict[str, List[Path]]:
+        """Writes the rows still pending and returns the files written per kind."""
+        for (kind, _), batches in list(self.pending.items()):
+            rows = concat_batches(batches)
+            if len(rows):
+                await self.write(kind, rows)
+        self.pending.clear()
+        self.pending_rows.clear()
+        return self.files
+
+
+class BulkLoadUploader(ABC):
+    """Puts bulk load files where the loader can read them from."""
+
+    @abstractmethod
+    async def upload(self, files: List[Path], folder: str) -> str:
+        """Uploads `files` under `folder` and returns the source to load them from."""
+        pass
+
+
+class LocalDirectoryUploader(BulkLoadUploader):
+    """Copies files into a local directory, e.g. to load them with a local stand-in."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+
+    async def upload(self, files: List[Path], folder: str) -> str:
+        target = self.directory / folder
+        target.mkdir(parents=True, exist_ok=True)
+        for file in files:
+            await asyncio.to_thread(shutil.copy, file, target / file.name)
+        return str(target)
+
+
+class S3Uploader(BulkLoadUploader):
+    """Uploads files under `prefix` in an S3 bucket."""
+
+    def __init__(
+        self, bucket: str, prefix: str = "", region: str = None, **client_kwargs
+    ) -> None:
+        from aiobotocore.session import get_session
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.region = region
+        self.session = get_session()
+        self.client_kwargs = client_kwargs
+
+    @classmethod
+    def from_source(cls, source: str, region: str = None, **client_kwargs):
+        bucket, _, prefix = source.removeprefix("s3://").partition("/")
+        return cls(bucket, prefix, region, **client_kwargs)
+
+    async def upload(self, files: List[Path], folder: str) -> str:
+        key_prefix = "/".join(part for part in (self.prefix, folder) if part)
+        async with self.session.create_client(
+            "s3", region_name=self.region, **self.client_kwargs
+        ) as client:
+            for file in files:
+                body = await asyncio.to_thread(file.read_bytes)
+                await client.put_object(
+                    Bucket=self.bucket, Key=f"{key_prefix}/{file.name}", Body=body
+                )
+        return f"s3://{self.bucket}/{key_prefix}/"
+
+
+class BulkLoadTrigger(ABC):
+    """Starts bulk load jobs and reports on their progress."""
+
+    @abstractmethod
+    async def start(self, source: str) -> str:
+        """Starts loading the files at `source` and returns the id of the load."""
+        pass
+
+    @abstractmethod
+    async def status(self, load_id: str) -> dict:
+        """Returns the overall status of a load, holding at least its `status`."""
+        pass
+
+
+class NeptuneLoaderTrigger(BulkLoadTrigger):
+    """Runs loads with the loader of the Neptune Database a connection talks to.
+
+    `loader_options` are passed on to the loader, e.g. `parallelism` or
+    `failOnError`.
+    """
+
+    def __init__(
+        self,
+        connection,
+        iam_role_arn: str,
+        s3_bucket_region: str,
+        loader_options: dict = None,
+    ) -> None:
+        self.connection = connection
+        self.iam_role_arn = iam_role_arn
+        self.s3_bucket_region = s3_bucket_region
+        self.loader_options = loader_options or {}
+
+    async def start(self, source: str) -> str:
+        client = await self.connection.client_pool.get()
+        response = await client.start_loader_job(
+            source=source,
+            format="opencypher",
+            s3BucketRegion=self.s3_bucket_region,
+            iamRoleArn=self.iam_role_arn,
+            **self.loader_options,
+        )
+        return response["payload"]["loadId"]
+
+    async def status(self, load_id: str) -> dict:
+        client = await self.connection.client_pool.get()
+        response = await client.get_loader_job_status(loadId=load_id)
+        return response["payload"]["overallStatus"]
+
+
+@dataclass(slots=True)
+class BulkLoadSettings:
+    """Settings of the bulk load write mode.
+
+    `source` is either an `s3://bucket/prefix` to upload files under or a
+    local directory to copy them to. Files are staged in `staging_directory`,
+    a temporary directory removed after a successful load by default.
+    """
+
+    source: str
+    iam_role_arn: str = None
+    s3_bucket_region: str = None
+    staging_directory: str = None
+    rows_per_file: int = DEFAULT_ROWS_PER_FILE
+    compress: bool = True
+    poll_interval: float = DEFAULT_POLL_INTERVAL
+    timeout: float = None
+    loader_options: dict = field(default_factory=dict)
+
+
+class BulkLoader:
+    """Stages nodes and relationships in files and loads them with a bulk load job.
+
+    Nodes are loaded first and relationships once the nodes they point at are
+    in the graph. Files are uploaded by `uploader` and loaded by `trigger`,
+    which are polled every `poll_interval` seconds until the load finishes or
+    `timeout` seconds went by.
+    """
+
+    def __init__(
+        self,
+        writer: BulkLoadFileWriter,
+        uploader: BulkLoadUploader,
+        trigger: BulkLoadTrigger,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        timeout: float = None,
+        remove_staged_files: bool = False,
+    ) -> None:
+        self.writer = writer
+        self.uploader = uploader
+        self.trigger = trigger
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.remove_staged_files = remove_staged_files
+        # Keeps the files of different runs apart when they share a source.
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.logger = getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_settings(cls, connection, settings: BulkLoadSettings):
+        if settings.source.startswith("s3://"):
+            uploader = S3Uploader.from_source(
+                settings.source, settings.s3_bucket_region or connection.region
+            )
+        else:
+            uploader = LocalDirectoryUploader(settings.source)
+        trigger = NeptuneLoaderTrigger(
+            connection,
+            settings.iam_role_arn,
+            settings.s3_bucket_region or connection.region,
+            settings.loader_options,
+        )
+        staging_directory = settings.staging_directory or mkdtemp(
+            prefix="nodestream-neptune-bulk-load-"
+        )
+        writer = BulkLoadFileWriter(
+            staging_directory, settings.rows_per_file, settings.compress
+        )
+        return cls(
+            writer,
+            uploader,
+            trigger,
+            settings.poll_interval,
+            settings.timeout,
+            remove_staged_files=settings.staging_directory is None,
+        )
+
+    async def add_nodes(self, labels: Sequence[str], parameters: ColumnarBatch):
+        await self.writer.add(NODES, ";".join(labels), node_rows(labels, parameters))
+
+    async def add_relationships(
+        self, type: str, key_names: Sequence[str] | None, parameters: ColumnarBatch
+    ):
+        rows = relationship_rows(type, key_names, parameters)
+        await self.writer.add(RELATIONSHIPS, type, rows)
+
+    async def load(self) -> List[dict]:
+        """Writes the pending rows, then uploads and loads every file written.
+
+        Returns the final status of each load.
+        """
+        files = await self.writer.close()
+        statuses = []
+        for kind in (NODES, RELATIONSHIPS):
+            if not files[kind]:
+                continue
+            source = await self.uploader.upload(files[kind], f"{self.run_id}/{kind}")
+            load_id = await self.trigger.start(source)
+            self.logger.info(
+                "Started bulk load",
+                extra=dict(load_id=load_id, source=source, files=len(files[kind])),
+            )
+            statuses.append(await self.wait(load_id))
+
+        if self.remove_staged_files:
+            shutil.rmtree(self.writer.directory, ignore_errors=True)
+        return statuses
+
+    async def wait(self, load_id: str) -> dict:
+        """Polls a load until it completes, raising a `BulkLoadError` if it does not."""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            status = await self.trigger.status(load_id)
+            state = status.get("status")
+            if state == LOAD_COMPLETED:
+                self.logger.info(
+                    "Bulk load completed", extra=dict(load_id=load_id, load=status)
+                )
+                return status
+            if state not in PENDING_LOAD_STATUSES:
+                raise BulkLoadError(f"Bulk load {load_id} ended with status {state}.")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise BulkLoadError(
+                    f"Bulk load {load_id} did not complete within {self.timeout}s."
+                )
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,169 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import (
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+)
+
+from .columnar import MISSING, ColumnarBatch, take_rows
+from .query import QueryBatch
+
+FINGERPRINT_CHANGES = "fingerprint"
+QUERY_CHANGES = "query"
+CHANGE_DETECTION_MODES = (FINGERPRINT_CHANGES, QUERY_CHANGES)
+DEFAULT_FINGERPRINT_CACHE_SIZE = 1_000_000
+DEFAULT_REFRESH_AFTER = 3600.0
+# `last_ingested_at` and the `last_ingested_by_<pipeline>_at` properties
+# nodestream sets on every object change on every write, whatever the data.
+INGESTION_TIMESTAMP_PREFIX = "last_ingested_"
+FINGERPRINT_DIGEST_SIZE = 8
+
+
+@dataclass(slots=True)
+class ChangeDetectionSettings:
+    mode: str = FINGERPRINT_CHANGES
+    cache_size: int = DEFAULT_FINGERPRINT_CACHE_SIZE
+    # Seconds after which unchanged objects are written again anyway, keeping
+    # their ingestion timestamps recent enough for TTLs. None never does.
+    refresh_after: float | None = DEFAULT_REFRESH_AFTER
+
+    def __post_init__(self):
+        if self.mode not in CHANGE_DETECTION_MODES:
+            raise ValueError(
+                f"`change_detection.mode` must be one of {', '.join(CHANGE_DETECTION_MODES)}"
+            )
+        if self.cache_size < 1:
+            raise ValueError("`change_detection.cache_size` must be at least 1")
+
+
+def _digest(items: list) -> bytes:
+    return blake2b(
+        repr(items).encode("utf-8"), digest_size=FINGERPRINT_DIGEST_SIZE
+    ).digest()
+
+
+def fingerprint(row: Mapping) -> bytes:
+    """Returns a digest of the values of `row`, leaving out its ingestion timestamps."""
+    return _digest(
+        sorted(
+            (name, value)
+            for name, value in row.items()
+            if not name.startswith(INGESTION_TIMESTAMP_PREFIX)
+        )
+    )
+
+
+def fingerprints(rows: Sequence[Mapping]) -> Iterator[bytes]:
+    """Yields the `fingerprint` of each row of `rows`."""
+    if not isinstance(rows, ColumnarBatch):
+        yield from map(fingerprint, rows)
+        return
+    # Read straight from the columns, in the order `fingerprint` sorts them,
+    # rather than building rows.
+    names = sorted(
+        name for name in rows.columns if not name.startswith(INGESTION_TIMESTAMP_PREFIX)
+    )
+    columns = [rows.columns[name] for name in names]
+    for values in zip(*columns) if columns else ((),) * len(rows):
+        items = list(zip(names, values))
+        if rows.sparse:
+            items = [item for item in items if item[1] is not MISSING]
+        yield _digest(items)
+
+
+def _keys(
+    query_stmt: str, rows: Sequence[Mapping], key_names: tuple
+) -> Iterator[Hashable]:
+    """Yields the key identifying the object of each row of `rows`."""
+    if not isinstance(rows, ColumnarBatch):
+        for row in rows:
+            yield (query_stmt, *(row.get(name) for name in key_names))
+        return
+    columns = [rows.column(name) for name in key_names]
+    for values in zip(*columns) if columns else ((),) * len(rows):
+        if rows.sparse:
+            values = (None if value is MISSING else value for value in values)
+        yield (query_stmt, *values)
+
+
+class FingerprintCache:
+    """Remembers a fingerprint of the values last written to each graph object, for up to `cache_size` objects.
+
+    Objects are identified by the statement writing them and the values of
+    their key parameters. Rows whose fingerprint did not change since the last
+    successful write of their object are dropped from batches, unless that
+    write is older than `refresh_after` seconds. The least recently written
+    objects are forgotten first, after which they are written again once.
+    """
+
+    def __init__(self, settings: ChangeDetectionSettings = None) -> None:
+        self.settings = settings or ChangeDetectionSettings()
+        self.entries: OrderedDict[Hashable, Tuple[bytes, float]] = OrderedDict()
+
+    def filter(
+        self, query_batch: QueryBatch, key_names: tuple
+    ) -> Tuple[QueryBatch, Dict[Hashable, bytes]]:
+        """Returns the rows of `query_batch` that changed, and their fingerprints by object."""
+        query_stmt = query_batch.query_statement
+        rows = query_batch.parameters
+        refresh_after = self.settings.refresh_after
+        now = time.monotonic()
+        entries = self.entries
+        changed: List[int] = []
+        pending: Dict[Hashable, bytes] = {}
+        for index, (key, digest) in enumerate(
+            zip(_keys(query_stmt, rows, key_names), fingerprints(rows))
+        ):
+            try:
+                entry = entries.get(key)
+            except TypeError:
+                # Unhashable key values cannot be remembered.
+                changed.append(index)
+                continue
+            if (
+                entry is not None
+                and entry[0] == digest
+                and (refresh_after is None or now - entry[1] < refresh_after)
+            ):
+                entries.move_to_end(key)
+                continue
+            changed.append(index)
+            pending[key] = digest
+
+        if len(changed) == len(rows):
+            return query_batch, pending
+        return QueryBatch(query_stmt, take_rows(rows, changed)), pending
+
+    def record(
+        self,
+        query_stmt: str,
+        partitions: Iterable[Sequence[Mapping]],
+        key_names: tuple,
+        pending: Dict[Hashable, bytes],
+    ):
+        """Remembers the fingerprints of the rows of the `partitions` that were written."""
+        now = time.monotonic()
+        entries = self.entries
+        for rows in partitions:
+            for key in _keys(query_stmt, rows, key_names):
+                try:
+                    digest = pending.get(key)
+                except TypeError:
+                    continue
+                if digest is None:
+                    continue
+                entries[key] = (digest, now)
+                entries.move_to_end(key)
+        while len(entries) > self.settings.cache_size:
+            entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
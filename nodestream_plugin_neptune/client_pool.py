@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any, AsyncContextManager, Callable, List
+
+DEFAULT_CLIENT_POOL_SIZE = 1
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+
+class ClientPool:
+    """A lazily opened, round-robin pool of aiobotocore clients.
+
+    Each client has its own HTTP connection pool, so spreading requests over
+    several clients raises the ceiling a single client puts on concurrent
+    requests. `create_client` is called with the index of the client being
+    created, which lets callers spread clients over several endpoints.
+    """
+
+    def __init__(
+        self,
+        create_client: Callable[[int], AsyncContextManager],
+        size: int = DEFAULT_CLIENT_POOL_SIZE,
+    ) -> None:
+        if size < 1:
+            raise ValueError("A client pool must hold at least one client.")
+        self.create_client = create_client
+        self.size = size
+        self.context_managers: List[AsyncContextManager] = []
+        self.clients: List[Any] = []
+        self._next = 0
+        self._open_lock = asyncio.Lock()
+
+    async def get(self):
+        """Returns the next client in the pool, opening the pool if needed."""
+        if not self.clients:
+            async with self._open_lock:
+                if not self.clients:
+                    await self._open()
+
+        client = self.clients[self._next % len(self.clients)]
+        self._next += 1
+        return client
+
+    async def _open(self):
+        context_managers, clients = [], []
+        try:
+            for index in range(self.size):
+                context_manager = self.create_client(index)
+                clients.append(await context_manager.__aenter__())
+                context_managers.append(context_manager)
+        except BaseException:
+            for context_manager in context_managers:
+                await context_manager.__aexit__(None, None, None)
+            raise
+        self.context_managers, self.clients = context_managers, clients
+
+    async def close(self):
+        if not self.clients:
+            return
+        self.clients = []
+        for context_manager in self.context_managers:
+            await context_manager.__aexit__(None, None, None)
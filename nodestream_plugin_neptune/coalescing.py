@@ -0,0 +1,70 @@
+from typing import Any, Dict, Hashable, Iterable, List, Sequence
+
+from .columnar import MISSING, ColumnarBatch
+
+Row = Dict[str, Any]
+
+
+def _group_indices(keys: Iterable[tuple]) -> Dict[Hashable, List[int]]:
+    groups: Dict[Hashable, List[int]] = {}
+    for index, key in enumerate(keys):
+        if MISSING in key or None in key:
+            # Rows without a complete key are never merged.
+            key = (MISSING, index)
+        groups.setdefault(key, []).append(index)
+    return groups
+
+
+def _coalesce_columnar(rows: ColumnarBatch, key_names: Sequence[str]):
+    groups = _group_indices(zip(*(rows.column(name) for name in key_names)))
+    if len(groups) == len(rows):
+        return rows
+
+    groups = list(groups.values())
+    merged = rows.take([group[0] for group in groups])
+    for position, group in enumerate(groups):
+        if len(group) == 1:
+            continue
+        for name, column in merged.columns.items():
+            source = rows.columns[name]
+            # The last row setting a property wins.
+            for index in reversed(group):
+                if source[index] is not MISSING:
+                    column[position] = source[index]
+                    break
+    return merged
+
+
+def _coalesce_dicts(rows: Sequence[Row], key_names: Sequence[str]):
+    groups = _group_indices(
+        tuple(row.get(name, MISSING) for name in key_names) for row in rows
+    )
+    if len(groups) == len(rows):
+        return rows
+
+    merged = []
+    for group in groups.values():
+        row = dict(rows[group[0]])
+        for index in group[1:]:
+            row.update(rows[index])
+        merged.append(row)
+    return merged
+
+
+def coalesce_rows(rows: Sequence[Row], key_names: Sequence[str]) -> Sequence[Row]:
+    """Merges the rows of a batch that write to the same graph object.
+
+    Rows sharing the values of all `key_names` are merged into one row, placed
+    where the first of them was, holding the properties of all of them; when
+    several rows set the same property, the last one wins. That is the state
+    the graph would end up in had the rows been written one after the other,
+    without the rows competing for the same vertex. `rows` is returned as is
+    when there is nothing to merge.
+    """
+    try:
+        if isinstance(rows, ColumnarBatch):
+            return _coalesce_columnar(rows, key_names)
+        return _coalesce_dicts(rows, key_names)
+    except TypeError:
+        # Unhashable key values, e.g. lists, cannot be grouped.
+        return rows
@@ -0,0 +1,232 @@
+import math
+import numbers
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping
+
+import numpy
+from pandas import Timestamp
+
+NON_FINITE_FLOAT_MESSAGE = "NaN and Infinity float values are not supported"
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+# Marks the rows of a column that do not have the property at all. It differs
+# from None: `SET n += param` removes properties set to null.
+MISSING = _Missing()
+
+_PLAIN_TYPES = frozenset((str, bool, int, type(None), _Missing))
+_NUMBER_TYPES = frozenset((str, bool, int, float, type(None), _Missing))
+
+
+def _convert_scalar(value: Any) -> Any:
+    # List properties are checked and converted item by item.
+    if isinstance(value, (list, tuple)):
+        return [_convert_scalar(item) for item in value]
+    # Timestamp and datetime are not valid json. Convert to POSIX timestamp instead.
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, numbers.Number) and not math.isfinite(value):
+        raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+    return value
+
+
+def convert_column(values: List[Any]) -> List[Any]:
+    """Converts the values of a column that JSON has no representation for.
+
+    The common cases are handled a column at a time: columns of strings and
+    integers are returned untouched, non-finite floats are looked for with a
+    single NumPy check and columns of pandas Timestamps are converted to POSIX
+    timestamps in one vectorized operation. Anything else is converted value
+    by value.
+    """
+    types = set(map(type, values))
+    if types <= _PLAIN_TYPES:
+        return values
+    if types <= _NUMBER_TYPES:
+        floats = numpy.fromiter((v for v in values if isinstance(v, float)), float)
+        if not numpy.isfinite(floats).all():
+            raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+        return values
+    if types == {Timestamp}:
+        nanoseconds = numpy.fromiter(
+            (value.value for value in values), numpy.int64, len(values)
+        )
+        return numpy.round(nanoseconds / 1e9, 6).tolist()
+    return [value if value is MISSING else _convert_scalar(value) for value in values]
+
+
+class ColumnarBatch(Sequence):
+    """The rows of a batch of parameters, stored one list per property.
+
+    Slicing a batch or taking some of its rows only slices its columns; row
+    dicts are only built when the batch is iterated or serialized.
+    """
+
+    __slots__ = ("columns", "length", "sparse")
+
+    def __init__(
+        self, columns: Dict[str, List[Any]], length: int, sparse: bool = False
+    ) -> None:
+        self.columns = columns
+        self.length = length
+        # Whether any column holds MISSING values.
+        self.sparse = sparse
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> "ColumnarBatch":
+        builder = ColumnarBatchBuilder()
+        for row in rows:
+            builder.add_row(row)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._with_columns(
+                {name: column[index] for name, column in self.columns.items()},
+                len(range(*index.indices(self.length))),
+            )
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("ColumnarBatch index out of range")
+        return {
+            name: column[index]
+            for name, column in self.columns.items()
+            if column[index] is not MISSING
+        }
+
+    def take(self, indices: List[int]) -> "ColumnarBatch":
+        """Returns a batch holding the rows at `indices`, in that order."""
+        return self._with_columns(
+            {
+                name: [column[index] for index in indices]
+                for name, column in self.columns.items()
+            },
+            len(indices),
+        )
+
+    def _with_columns(self, columns: Dict[str, List[Any]], length: int):
+        return ColumnarBatch(columns, length, self.sparse)
+
+    def column(self, name: str) -> List[Any]:
+        """Returns the values of a column, MISSING where a row does not have it."""
+        return self.columns.get(name, [MISSING] * self.length)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        names = tuple(self.columns)
+        rows = zip(*self.columns.values()) if names else ((),) * self.length
+        if not self.sparse:
+            for values in rows:
+                yield dict(zip(names, values))
+            return
+        for values in rows:
+            yield {
+                name: value
+                for name, value in zip(names, values)
+                if value is not MISSING
+            }
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ColumnarBatch, list, tuple)):
+            return len(self) == len(other) and all(
+                mine == theirs for mine, theirs in zip(self, other)
+            )
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"ColumnarBatch({self.to_rows()!r})"
+
+
+class ColumnarBatchBuilder:
+    """Assembles a `ColumnarBatch` row by row without building row dicts.
+
+    The values of a row can be added from several mappings; a later value for
+    the same property replaces an earlier one, like merging dicts would.
+    """
+
+    def __init__(self) -> None:
+        self.columns: Dict[str, List[Any]] = {}
+        self.length = 0
+        self.sparse = False
+
+    def add_value(self, name: str, value: Any):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = [MISSING] * self.length
+            self.sparse = self.sparse or self.length > 0
+        if len(column) > self.length:
+            column[self.length] = value
+        else:
+            column.append(value)
+
+    def add_values(self, values: Mapping[str, Any]):
+        index = self.length
+        columns = self.columns
+        for name, value in values.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [MISSING] * index
+                self.sparse = self.sparse or index > 0
+            if len(column) > index:
+                column[index] = value
+            else:
+                column.append(value)
+
+    def end_row(self):
+        self.length += 1
+        for column in self.columns.values():
+            if len(column) < self.length:
+                column.append(MISSING)
+                self.sparse = True
+
+    def add_row(self, *values: Mapping[str, Any]):
+        for mapping in values:
+            self.add_values(mapping)
+        self.end_row()
+
+    def build(self) -> ColumnarBatch:
+        columns = {
+            name: convert_column(column) for name, column in self.columns.items()
+        }
+        return ColumnarBatch(columns, self.length, self.sparse)
+
+
+def take_rows(rows: Sequence, indices: List[int]) -> Sequence:
+    """Returns the rows at `indices`, keeping them columnar if they are."""
+    if isinstance(rows, ColumnarBatch):
+        return rows.take(indices)
+    return [rows[index] for index in indices]
+
+
+def concat_batches(batches: List[Sequence]) -> Sequence:
+    """Concatenates batches of rows, keeping them columnar when they all are."""
+    if len(batches) == 1:
+        return batches[0]
+    if not all(isinstance(batch, ColumnarBatch) for batch in batches):
+        return [row for batch in batches for row in batch]
+
+    names = dict.fromkeys(name for batch in batches for name in batch.columns)
+    columns = {name: [] for name in names}
+    sparse = any(batch.sparse for batch in batches)
+    for batch in batches:
+        for name, column in columns.items():
+            values = batch.columns.get(name)
+            if values is None:
+                values, sparse = [MISSING] * batch.length, True
+            column.extend(values)
+    return ColumnarBatch(columns, sum(batch.length for batch in batches), sparse)
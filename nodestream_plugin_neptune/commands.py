@@ -0,0 +1,49 @@
+from cleo.helpers import argument, option
+from nodestream.cli.commands.nodestream_command import NodestreamCommand
+from nodestream.cli.commands.shared_options import JSON_OPTION, PROJECT_FILE_OPTION
+from nodestream.cli.operations import InitializeLogger, InitializeProject
+
+from .dead_letters import replay_dead_letters
+
+
+class NeptuneReplay(NodestreamCommand):
+    name = "neptune-replay"
+    description = "Replay dead letters of failed partitions against a Neptune target"
+    arguments = [
+        argument(
+            "paths",
+            "Dead letter files, or directories holding them, to replay",
+            multiple=True,
+        )
+    ]
+    options = [
+        PROJECT_FILE_OPTION,
+        JSON_OPTION,
+        option("target", "t", "The Neptune target to replay against", flag=False),
+    ]
+
+    async def handle_async(self):
+        await self.run_operation(InitializeLogger())
+        project = await self.run_operation(InitializeProject())
+        try:
+            target = project.get_target_by_name(self.option("target"))
+        except ValueError:
+            self.line_error(f"Unknown target: {self.option('target')}")
+            return 1
+
+        # The executor is the one pipelines write with, so replayed rows go
+        # through the same partitioning, retries and dead letter sink.
+        executor = target.connector.make_query_executor()
+        try:
+            rows = await replay_dead_letters(executor, self.argument("paths"))
+        finally:
+            await executor.finish()
+
+        self.line(f"<info>Replayed {rows} rows to {target.name}</info>")
+        dead_letters = getattr(executor, "dead_letters", None)
+        if dead_letters is not None and dead_letters.written:
+            self.line_error(
+                f"{dead_letters.written} partitions failed again, see {dead_letters.path}"
+            )
+            return 1
+        return 0
@@ -0,0 +1,103 @@
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, List, Sequence, Tuple
+
+from .columnar import MISSING, ColumnarBatch, take_rows
+from .ingest_query_builder import (
+    GENERIC_FROM_NODE_REF_NAME,
+    GENERIC_NODE_REF_NAME,
+    GENERIC_TO_NODE_REF_NAME,
+    generate_id_param_name,
+)
+
+CONFLICT_KEYS = tuple(
+    generate_id_param_name(name)
+    for name in (
+        GENERIC_NODE_REF_NAME,
+        GENERIC_FROM_NODE_REF_NAME,
+        GENERIC_TO_NODE_REF_NAME,
+    )
+)
+
+Row = Dict[str, Any]
+Partition = Sequence[Row]
+# A lane is a list of partitions that must be sent one after the other.
+Lane = List[Partition]
+
+
+def _row_ids(rows: Sequence[Row], keys: Tuple[str, ...]):
+    """Yields the vertex ids each row touches."""
+    if isinstance(rows, ColumnarBatch):
+        # Read the ids straight from the id columns rather than building rows.
+        columns = [rows.columns[key] for key in keys if key in rows.columns]
+        for values in zip(*columns) if columns else ((),) * len(rows):
+            yield [value for value in values if value is not MISSING]
+        return
+    for row in rows:
+        yield [row[key] for key in keys if key in row]
+
+
+def group_indices_by_hub(
+    rows: Sequence[Row], keys: Iterable[str] = CONFLICT_KEYS
+) -> List[List[int]]:
+    """Groups the indices of rows by the vertex id they touch that most rows touch.
+
+    Rows sharing that vertex, e.g. the relationships of a hub node or the
+    duplicates of a node, end up in the same group. Rows that only share a
+    less busy vertex may end up in different groups: grouping every row that
+    transitively touches another would put a whole batch of densely connected
+    rows into a single group. Indices keep their relative order inside each
+    group and groups are returned in the order they first appear in `rows`.
+    """
+    row_ids = list(_row_ids(rows, tuple(keys)))
+    degrees = Counter(id for ids in row_ids for id in set(ids))
+    groups: Dict[Hashable, List[int]] = {}
+    for index, ids in enumerate(row_ids):
+        if ids:
+            # The first id wins ties, so the grouping is deterministic.
+            anchor = ("id", max(ids, key=degrees.__getitem__))
+        else:
+            # Rows without ids cannot conflict with anything.
+            anchor = ("row", index)
+        groups.setdefault(anchor, []).append(index)
+    return list(groups.values())
+
+
+def group_rows_by_hub(
+    rows: Sequence[Row], keys: Iterable[str] = CONFLICT_KEYS
+) -> List[List[Row]]:
+    """Groups rows by the vertex id they touch that most rows touch, see `group_indices_by_hub`."""
+    return [[rows[i] for i in group] for group in group_indices_by_hub(rows, keys)]
+
+
+def partition_by_conflicts(
+    rows: Sequence[Row], partition_size: int, keys: Iterable[str] = CONFLICT_KEYS
+) -> List[Lane]:
+    """Splits `rows` into lanes of partitions that can be sent in parallel.
+
+    Rows are grouped by their busiest vertex with `group_indices_by_hub`.
+    Small groups are packed together into a single partition, while a group
+    larger than `partition_size` (e.g. every relationship of a hub node) is
+    split into several partitions of one lane, to be sent one after the other
+    instead of fighting over the hub with `ConcurrentModificationException`s.
+    Lanes may still share less busy vertices, whose conflicts are left to
+    retries so that rows that do not overlap keep running in parallel.
+    """
+    lanes: List[Lane] = []
+    current: List[int] = []
+    for group in group_indices_by_hub(rows, keys):
+        if len(group) > partition_size:
+            lanes.append(
+                [
+                    take_rows(rows, group[i : i + partition_size])
+                    for i in range(0, len(group), partition_size)
+                ]
+            )
+            continue
+        if len(current) + len(group) > partition_size:
+            lanes.append([take_rows(rows, current)])
+            current = []
+        current.extend(group)
+
+    if current:
+        lanes.append([take_rows(rows, current)])
+    return lanes
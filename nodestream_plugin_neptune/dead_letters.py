@@ -0,0 +1,163 @@
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List
+
+from .metrics import statement_tag
+from .query import QueryBatch
+from .retry_policy import ErrorCategory, classify_error
+from .serialization import serialize_parameters
+
+DEAD_LETTER_FILE_PREFIX = "dead-letters-"
+
+
+@dataclass(slots=True)
+class DeadLetter:
+    """The rows of a partition that could not be written, and why.
+
+    `query_statement` is the statement of the batch the rows came from, i.e.
+    without the UNWIND of the rows in front of it.
+    """
+
+    query_statement: str
+    rows: List[Any]
+    error: str
+    error_category: str
+    failed_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def for_failure(
+        cls, query_statement: str, rows: List[Any], error: Exception | None
+    ) -> "DeadLetter":
+        category = ErrorCategory.UNKNOWN if error is None else classify_error(error)
+        message = (
+            "Query failed" if error is None else f"{type(error).__name__}: {error}"
+        )
+        # Columnar batches are turned into the rows they would have been sent as.
+        return cls(query_statement, list(rows), message, category.value)
+
+    @property
+    def statement(self) -> str:
+        # Tagged as sent, like the `failed_rows` metric of the same rows.
+        return statement_tag(self.as_query_batch().as_query().query_statement)
+
+    def to_file_data(self) -> dict:
+        return {
+            "statement": self.statement,
+            "query": self.query_statement,
+            "error": self.error,
+            "error_category": self.error_category,
+            "failed_at": self.failed_at,
+            "rows": self.rows,
+        }
+
+    @classmethod
+    def from_file_data(cls, data: dict) -> "DeadLetter":
+        return cls(
+            query_statement=data["query"],
+            rows=data["rows"],
+            error=data["error"],
+            error_category=data["error_category"],
+            failed_at=data["failed_at"],
+        )
+
+    def as_query_batch(self) -> QueryBatch:
+        return QueryBatch(self.query_statement, self.rows)
+
+
+class DeadLetterSink:
+    """Receives the partitions that failed after all retries."""
+
+    def write(self, dead_letter: DeadLetter):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonlDeadLetterSink(DeadLetterSink):
+    """Appends dead letters to a JSON lines file in `directory`, gzipped if `compress` is set.
+
+    Each run writes to a file of its own, created with the first dead letter.
+    Rows are stored as they would have been sent, so replaying them sends the
+    same values.
+    """
+
+    def __init__(self, directory: str, compress: bool = False) -> None:
+        self.directory = Path(directory)
+        self.compress = compress
+        self.path: Path | None = None
+        self.file = None
+        self.written = 0
+        self.logger = getLogger(self.__class__.__name__)
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        name = (
+            f"{DEAD_LETTER_FILE_PREFIX}{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        )
+        self.path = self.directory / f"{name}{suffix}"
+        opener = gzip.open if self.compress else open
+        self.file = opener(self.path, "at", encoding="utf-8")
+
+    def write(self, dead_letter: DeadLetter):
+        if self.file is None:
+            self._open()
+        data = dead_letter.to_file_data()
+        try:
+            line = serialize_parameters(data)
+        except (TypeError, ValueError):
+            # Rows that cannot be encoded, e.g. holding NaN, are kept as
+            # faithfully as the standard library allows.
+            line = json.dumps(data, default=str)
+        self.file.write(line + "\n")
+        self.file.flush()
+        self.written += 1
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.logger.warning(
+            "Failed partitions were written to a dead letter file",
+            extra=dict(path=str(self.path), partitions=self.written),
+        )
+
+
+def dead_letter_files(paths: Iterable[str]) -> List[Path]:
+    """Returns the dead letter files at `paths`, looking into directories."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob(f"{DEAD_LETTER_FILE_PREFIX}*.jsonl*")))
+        else:
+            files.append(path)
+    return files
+
+
+def read_dead_letters(path: Path) -> Iterator[DeadLetter]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield DeadLetter.from_file_data(json.loads(line))
+
+
+async def replay_dead_letters(executor, paths: Iterable[str]) -> int:
+    """Sends the rows of the dead letters at `paths` again through `executor`.
+
+    Returns the number of rows replayed. Rows failing again end up in the
+    dead letter sink of the executor, if it has one.
+    """
+    rows = 0
+    for path in dead_letter_files(paths):
+        for dead_letter in read_dead_letters(path):
+            await executor.execute_batch(dead_letter.as_query_batch())
+            rows += len(dead_letter.rows)
+    return rows
@@ -0,0 +1,53 @@
+import time
+
+
+class RequestTimeoutError(TimeoutError):
+    """Raised when a single attempt at a request takes longer than its timeout."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request runs out of the time left before its deadline."""
+
+
+class Deadline:
+    """A point in time by which some work, e.g. all the requests of a batch, has to be done.
+
+    A deadline without `expires_at` never expires, which lets callers pass one
+    around whether or not a timeout was configured.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: float | None = None) -> None:
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float | None) -> "Deadline":
+        """Returns a deadline `seconds` from now, or one that never expires."""
+        if seconds is None:
+            return cls()
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float | None:
+        """Returns the seconds left before the deadline, None if there is none."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, limit: float | None = None) -> float | None:
+        """Returns how long the next step may take: `limit`, unless less time is left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        if limit is None:
+            return remaining
+        return min(limit, remaining)
+
+    def allows(self, seconds: float) -> bool:
+        """Returns whether `seconds` can still be waited without missing the deadline."""
+        remaining = self.remaining()
+        return remaining is None or seconds < remaining
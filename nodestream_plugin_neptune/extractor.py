@@ -1,24 +1,46 @@
-import json
+import asyncio
 from logging import getLogger
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from nodestream.pipeline.extractors import Extractor
 
 from .neptune_connector import NeptuneConnector
-from .neptune_query_executor import NeptuneQueryExecutor
+
+DEFAULT_PREFETCH_DEPTH = 1
+INITIAL_CURSOR = ""
+LAST_PAGE = None
 
 
 class NeptuneDBExtractor(Extractor):
+    """Extracts the records of a query page by page.
+
+    By default pages are requested with `$offset` and `$limit` parameters.
+    When `cursor_key` is set, the query is paginated by keyset instead: each
+    page is requested with the `$last_id` parameter set to the `cursor_key`
+    value of the last record of the previous page, e.g.
+
+        MATCH (n:Person) WHERE id(n) > $last_id
+        RETURN n, id(n) AS cursor ORDER BY id(n) LIMIT $limit
+
+    Keyset pagination costs the same for every page, while every page of an
+    offset paginated query costs more than the last one. Up to
+    `prefetch_depth` pages are fetched ahead while the current page is being
+    yielded. A page that fails is raised from `extract_records`, rather than
+    taken for the last page.
+    """
+
     @classmethod
     def from_file_data(
         cls,
         query: str,
         parameters: Optional[Dict[str, Any]] = None,
         limit: int = 100,
+        cursor_key: Optional[str] = None,
+        prefetch_depth: int = DEFAULT_PREFETCH_DEPTH,
         **connector_args
     ):
         connector = NeptuneConnector.from_file_data(**connector_args)
-        return cls(query, connector, parameters, limit)
+        return cls(query, connector, parameters, limit, cursor_key, prefetch_depth)
 
     def __init__(
         self,
@@ -26,31 +48,78 @@ class NeptuneDBExtractor(Extractor):
         connector: NeptuneConnector,
         parameters: Optional[Dict[str, Any]] = None,
         limit: int = 100,
+        cursor_key: Optional[str] = None,
+        prefetch_depth: int = DEFAULT_PREFETCH_DEPTH,
+        initial_cursor: Any = None,
     ) -> None:
+        if limit < 1 or prefetch_depth < 1:
+            raise ValueError("`limit` and `prefetch_depth` must be positive.")
         self.connector = connector
         self.query = query
         self.parameters = parameters or {}
         self.limit = limit
+        self.cursor_key = cursor_key
+        self.prefetch_depth = prefetch_depth
+        self.initial_cursor = (
+            INITIAL_CURSOR if initial_cursor is None else initial_cursor
+        )
         self.logger = getLogger(self.__class__.__name__)
 
-    async def extract_records(self):
-        # TODO: In the future, we should extract the database pagination logic from
-        # this class and move it to a GraphDatabaseExtractor class following the lead
-        # we have of the writer class.
-        offset = 0
-        executor: NeptuneQueryExecutor = self.connector.make_query_executor()
+    def first_page_params(self) -> Dict[str, Any]:
+        if self.cursor_key is not None:
+            return dict(
+                **self.parameters, limit=self.limit, last_id=self.initial_cursor
+            )
+        return dict(**self.parameters, limit=self.limit, offset=0)
+
+    def next_page_params(
+        self, params: Dict[str, Any], page: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        if self.cursor_key is not None:
+            return dict(params, last_id=page[-1][self.cursor_key])
+        return dict(params, offset=params["offset"] + self.limit)
 
-        params = dict(**self.parameters, limit=self.limit, offset=offset)
+    async def fetch_page(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
         self.logger.info(
             "Running query on Neptune Database",
             extra=dict(query=self.query, params=params),
         )
+        return [
+            record
+            async for record in self.connector.connection.stream(
+                self.query, params, read_only=True, raise_errors=True
+            )
+        ]
 
-        response = await executor.query(self.query, json.dumps(params))
+    async def fetch_pages(self, pages: asyncio.Queue):
+        params = self.first_page_params()
+        try:
+            while True:
+                page = await self.fetch_page(params)
+                if page:
+                    await pages.put(page)
+                if len(page) < self.limit:
+                    break
+                params = self.next_page_params(params, page)
+        except Exception as error:
+            # Hand the error over to the consumer rather than leaving it waiting.
+            await pages.put(error)
+            return
+        await pages.put(LAST_PAGE)
 
-        returned_records = []
-        if response:
-            returned_records = list(response["results"])
-
-        for item in returned_records:
-            yield item
+    async def extract_records(self):
+        # The queue bounds how many pages are held in memory ahead of the
+        # consumer, the fetching task blocks once it is full.
+        pages = asyncio.Queue(maxsize=self.prefetch_depth)
+        fetcher = asyncio.create_task(self.fetch_pages(pages))
+        try:
+            while True:
+                page = await pages.get()
+                if page is LAST_PAGE:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for item in page:
+                    yield item
+        finally:
+            fetcher.cancel()
@@ -1,11 +1,5 @@
-import math
-import numbers
-import re
-from datetime import datetime
-from functools import cache, wraps
-from typing import Iterable
-
-from cymple.builder import NodeAfterMergeAvailable, NodeAvailable, QueryBuilder
+from typing import Iterable, Iterator, List, Tuple
+
 from nodestream.databases.query_executor import (
     OperationOnNodeIdentity,
     OperationOnRelationshipIdentity,
@@ -13,31 +7,41 @@ from nodestream.databases.query_executor import (
 from nodestream.model import (
     Node,
     NodeCreationRule,
+    NodeIdentityShape,
     Relationship,
     RelationshipCreationRule,
     RelationshipIdentityShape,
     RelationshipWithNodes,
     TimeToLiveConfiguration,
 )
+from nodestream.schema import Schema
 from nodestream.schema.state import GraphObjectType
 from pandas import Timedelta, Timestamp
 
+from .change_detection import INGESTION_TIMESTAMP_PREFIX
+from .columnar import ColumnarBatchBuilder
+from .node_ids import (
+    COMPOSITE_NODE_IDS,
+    DEFAULT_NODE_ID_CACHE_SIZE,
+    HASHED_NODE_IDS,
+    NodeIdGenerator,
+)
 from .query import Query, QueryBatch
+from .query_templates import (
+    render_labels,
+    render_node,
+    render_parameter,
+    render_relationship,
+)
+from .statement_cache import SHARED_STATEMENT_CACHE, StatementCache
 
 GENERIC_NODE_REF_NAME = "node"
 GENERIC_FROM_NODE_REF_NAME = "from_node"
 GENERIC_TO_NODE_REF_NAME = "to_node"
 RELATIONSHIP_REF_NAME = "rel"
-PARAMETER_CORRECTION_REGEX = re.compile(r"\"(params.__\w+)\"")
-
-
-def correct_parameters(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        query = f(*args, **kwargs)
-        return PARAMETER_CORRECTION_REGEX.sub(r"\1", query)
-
-    return wrapper
+TTL_REF_NAME = "x"
+LAST_INGESTED_AT = "last_ingested_at"
+NODE_ID_PROPERTY = "~id"
 
 
 def generate_prefixed_param_name(property_name: str, prefix: str) -> str:
@@ -48,172 +52,205 @@ def generate_id_param_name(node_ref_name: str) -> str:
     return generate_prefixed_param_name("id", node_ref_name)
 
 
-def generate_properties_set_with_prefix(properties: Iterable[str], prefix: str):
-    return {
-        prop: f"param.{generate_prefixed_param_name(prop, prefix)}"
-        for prop in properties
-    }
-
-
-@cache
-def _match_node(
-    node_operation: OperationOnNodeIdentity,
-    node_id_param_name: str,
-    name=GENERIC_NODE_REF_NAME,
-) -> NodeAvailable:
-    identity = node_operation.node_identity
-    return (
-        QueryBuilder()
-        .match()
-        .node(
-            labels=identity.type,
-            ref_name=name,
-            properties={"`~id`": f"param.{node_id_param_name}"},
-            escape=False,
-        )
-    )
-
-
-@cache
-def _merge_node(
-    labels: str, node_id_param_name: str, name=GENERIC_NODE_REF_NAME
-) -> NodeAfterMergeAvailable:
-    return (
-        QueryBuilder()
-        .merge()
-        .node(
-            labels=labels,
-            ref_name=name,
-            properties={"`~id`": f"param.{node_id_param_name}"},
-            escape=False,
-        )
+def _node_with_id(
+    node_type: str, node_id_param_name: str, name=GENERIC_NODE_REF_NAME
+) -> str:
+    return render_node(
+        name, node_type, {NODE_ID_PROPERTY: f"param.{node_id_param_name}"}
     )
 
 
-@cache
-def _make_relationship(rel_identity: RelationshipIdentityShape):
-    keys = generate_properties_set_with_prefix(rel_identity.keys, None)
-    match_rel_query = (
-        QueryBuilder()
-        .merge()
-        .node(ref_name=GENERIC_FROM_NODE_REF_NAME)
-        .related_to(
-            ref_name=RELATIONSHIP_REF_NAME,
-            properties=keys,
-            label=rel_identity.type,
-            escape=False,
-        )
-        .node(ref_name=GENERIC_TO_NODE_REF_NAME)
-    )
-
-    return match_rel_query
+def _relationship_with_keys(rel_identity: RelationshipIdentityShape) -> str:
+    keys = {key: render_parameter(key) for key in rel_identity.keys}
+    rel = render_relationship(RELATIONSHIP_REF_NAME, rel_identity.type, keys)
+    return f"({GENERIC_FROM_NODE_REF_NAME})-{rel}->({GENERIC_TO_NODE_REF_NAME})"
 
 
-def _convert_unsupported_values(props: dict):
-    # Convert unsupported values.
-    # Due to the structure of our queries, all data must be passed as valid JSON.
-    for k, v in props.items():
-        # Timestamp and datetime are not valid json. Convert to POSIX timestamp instead.
-        if isinstance(v, (Timestamp, datetime)):
-            props[k] = v.timestamp()
-        elif isinstance(v, numbers.Number) and not math.isfinite(v):
-            raise ValueError("NaN and Infinity float values are not supported")
+def _set_changed_properties(ref_name: str, properties: str) -> str:
+    """Renders the end of an upsert, setting `properties` on `ref_name` only if any of them changed.
 
-    return props
+    The ingestion timestamps nodestream sets are not compared, but
+    `last_ingested_at` is refreshed whether or not anything changed so that
+    TTLs do not expire unchanged objects.
+    """
+    current = f"properties({ref_name})[key]"
+    # Comparing to null is null, so a property only one side has is told apart by nullness.
+    changed = f"coalesce({current} <> props[key], ({current} IS NULL) <> (props[key] IS NULL))"
+    return (
+        f"SET {ref_name}.{LAST_INGESTED_AT} = coalesce(param.{LAST_INGESTED_AT}, {ref_name}.{LAST_INGESTED_AT}) "
+        f"WITH {ref_name}, {properties} AS props "
+        f"WHERE any(key IN keys(props) WHERE NOT key STARTS WITH '{INGESTION_TIMESTAMP_PREFIX}' AND {changed}) "
+        f"SET {ref_name} += props"
+    )
 
 
 class NeptuneIngestQueryBuilder:
-    def __init__(self, include_label_in_id: bool = True):
+    def __init__(
+        self,
+        include_label_in_id: bool = True,
+        node_id_cache_size: int = DEFAULT_NODE_ID_CACHE_SIZE,
+        node_id_mode: str = COMPOSITE_NODE_IDS,
+        statement_cache: StatementCache = None,
+        compare_properties: bool = False,
+    ):
         self.include_label_in_id = include_label_in_id
+        self.node_ids = NodeIdGenerator(
+            include_label_in_id, node_id_cache_size, node_id_mode
+        )
+        # Hashed ids do not carry the key values, so they are stored as
+        # properties of the nodes instead.
+        self.store_key_values = node_id_mode == HASHED_NODE_IDS
+        self.statement_cache = (
+            statement_cache if statement_cache is not None else SHARED_STATEMENT_CACHE
+        )
+        # Whether upserts only set properties when any of them changed.
+        self.compare_properties = compare_properties
+        # The settings changing the statements rendered, part of every cache
+        # key so that builders with the same settings share their statements.
+        self.statement_settings = ("compare_properties",) if compare_properties else ()
 
-    @cache
-    @correct_parameters
     def generate_update_node_operation_query_statement(
         self,
         operation: OperationOnNodeIdentity,
     ) -> str:
         """Generate a query to update a node in the database given a node type and a match strategy."""
-
+        identity = operation.node_identity
+        # The node keys only matter to the ids, not to the statement.
+        key = (
+            self.statement_settings,
+            GraphObjectType.NODE,
+            identity.type,
+            identity.additional_types,
+            operation.node_creation_rule,
+        )
+        statement = self.statement_cache.get(key)
+        if statement is None:
+            statement = self._render_node_operation_query_statement(operation)
+            self.statement_cache.put(key, statement)
+        return statement
+
+    def _render_node_operation_query_statement(
+        self, operation: OperationOnNodeIdentity
+    ) -> str:
         node_id_param_name = generate_id_param_name(GENERIC_NODE_REF_NAME)
+        node = _node_with_id(operation.node_identity.type, node_id_param_name)
 
-        if operation.node_creation_rule == NodeCreationRule.EAGER:
-            merge_node = str(
-                _merge_node(
-                    operation.node_identity.type,
-                    node_id_param_name,
-                    GENERIC_NODE_REF_NAME,
+        if self.compare_properties:
+            properties = f"""removeKeyFromMap(param, "{node_id_param_name}")"""
+            if operation.node_creation_rule == NodeCreationRule.EAGER:
+                query = (
+                    f"MERGE {node} ON CREATE SET {GENERIC_NODE_REF_NAME} = {properties}"
+                )
+            else:
+                query = f"MATCH {node}"
+            # Labels are set before rows without changes are filtered out.
+            if operation.node_identity.additional_types:
+                additional_types = render_labels(
+                    operation.node_identity.additional_types
                 )
+                query += f" SET {GENERIC_NODE_REF_NAME}{additional_types}"
+            return (
+                f"{query} {_set_changed_properties(GENERIC_NODE_REF_NAME, properties)}"
             )
+
+        if operation.node_creation_rule == NodeCreationRule.EAGER:
             """
             At this time, Neptune doesn't support nested maps very well.
             We get an error trying to access inner maps in the parameters
-            of our openCypher query. 
+            of our openCypher query.
 
-            As such, node's properties and __node_id has to be kept at 
+            As such, node's properties and __node_id has to be kept at
             the same level.
 
-            As a work around, we use removeKeyFromMap() to remove __node_id before 
+            As a work around, we use removeKeyFromMap() to remove __node_id before
             setting node's properties. removeKeyFromMap() Neptune specific.
             """
             on_create = f"""ON CREATE SET {GENERIC_NODE_REF_NAME} = removeKeyFromMap(param, "{node_id_param_name}")"""
             on_match = f"""ON MATCH SET {GENERIC_NODE_REF_NAME} += removeKeyFromMap(param, "{node_id_param_name}")"""
-            query = f"{merge_node} {on_create} {on_match}"
+            query = f"MERGE {node} {on_create} {on_match}"
         else:
-            query = str(_match_node(operation, node_id_param_name))
+            query = f"MATCH {node}"
             query += f""" SET {GENERIC_NODE_REF_NAME} += removeKeyFromMap(param, "{node_id_param_name}")"""
 
         if operation.node_identity.additional_types:
-            additional_types = ":".join(operation.node_identity.additional_types)
-            query += f" SET {GENERIC_NODE_REF_NAME}:{additional_types}"
+            additional_types = render_labels(operation.node_identity.additional_types)
+            query += f" SET {GENERIC_NODE_REF_NAME}{additional_types}"
 
         return query
 
     def generate_update_node_operation_params(self, node: Node) -> dict:
         """Generate the parameters for a query to update a node in the database."""
 
-        node_props = {**self.generate_node_key_params(node), **node.properties}
-        node_props = _convert_unsupported_values(node_props)
-
-        return node_props
+        # Values JSON cannot represent, like timestamps, are converted when the
+        # parameters are serialized by the connection.
+        if self.store_key_values:
+            return {
+                **self.generate_node_key_params(node),
+                **node.key_values,
+                **node.properties,
+            }
+        return {**self.generate_node_key_params(node), **node.properties}
 
     def generate_node_key_params(self, node: Node, name=GENERIC_NODE_REF_NAME) -> dict:
         """Generate the parameters for a query to update a node in the database."""
 
+        return {generate_prefixed_param_name("id", name): self.generate_node_id(node)}
+
+    def generate_node_id(self, node: Node) -> str:
+        """Generate the `~id` of a node from its key values."""
+
         # Todo: What if no keys were given? Maybe let neptune decides.
         # On uniqueness and keys in Neptune, see Schema Constraints in https://docs.aws.amazon.com/neptune/latest/userguide/migration-compatibility.html
-        composite_key = "_".join(
-            [f"{k}:{node.key_values[k] or ''}" for k in sorted(node.key_values)]
-        )
-
-        if self.include_label_in_id:
-            composite_key = f"{node.type}_{composite_key}"
-        return {generate_prefixed_param_name("id", name): composite_key}
+        return self.node_ids.generate_id(node)
 
-    @cache
-    @correct_parameters
     def generate_update_relationship_operation_query_statement(
         self, operation: OperationOnRelationshipIdentity
     ) -> str:
         """Generate a query to update a relationship in the database given a relationship operation."""
+        key = (
+            self.statement_settings,
+            GraphObjectType.RELATIONSHIP,
+            operation.from_node.node_identity.type,
+            operation.to_node.node_identity.type,
+            operation.relationship_identity,
+            operation.relationship_creation_rule,
+        )
+        statement = self.statement_cache.get(key)
+        if statement is None:
+            statement = self._render_relationship_operation_query_statement(operation)
+            self.statement_cache.put(key, statement)
+        return statement
+
+    def _render_relationship_operation_query_statement(
+        self, operation: OperationOnRelationshipIdentity
+    ) -> str:
         from_node_id_param_name = generate_id_param_name(GENERIC_FROM_NODE_REF_NAME)
-        match_from_node_segment = _match_node(
-            operation.from_node, from_node_id_param_name, GENERIC_FROM_NODE_REF_NAME
+        from_node = _node_with_id(
+            operation.from_node.node_identity.type,
+            from_node_id_param_name,
+            GENERIC_FROM_NODE_REF_NAME,
         )
 
         to_node_id_param_name = generate_id_param_name(GENERIC_TO_NODE_REF_NAME)
-        match_to_node_segment = _match_node(
-            operation.to_node, to_node_id_param_name, GENERIC_TO_NODE_REF_NAME
+        to_node = _node_with_id(
+            operation.to_node.node_identity.type,
+            to_node_id_param_name,
+            GENERIC_TO_NODE_REF_NAME,
         )
 
-        match_to_node_segment = str(match_to_node_segment).replace("MATCH", ",")
-
-        merge_rel_segment = _make_relationship(operation.relationship_identity)
+        match_nodes_segment = f"MATCH {from_node} , {to_node}"
+        rel = _relationship_with_keys(operation.relationship_identity)
 
         if operation.relationship_creation_rule == RelationshipCreationRule.CREATE:
-            create_rel_segment = str(merge_rel_segment).replace("MERGE", "CREATE")
             set_properties_segment = f"""SET {RELATIONSHIP_REF_NAME} += removeKeyFromMap(removeKeyFromMap(param, "{from_node_id_param_name}"), "{to_node_id_param_name}")"""
 
-            return f"{match_from_node_segment} {match_to_node_segment} {create_rel_segment} {set_properties_segment}"
+            return f"{match_nodes_segment} CREATE {rel} {set_properties_segment}"
+
+        if self.compare_properties:
+            properties = f"""removeKeyFromMap(removeKeyFromMap(param, "{from_node_id_param_name}"), "{to_node_id_param_name}")"""
+            on_create = f"ON CREATE SET {RELATIONSHIP_REF_NAME} = {properties}"
+            set_changed = _set_changed_properties(RELATIONSHIP_REF_NAME, properties)
+            return f"{match_nodes_segment} MERGE {rel} {on_create} {set_changed}"
 
         # At this time, Neptune doesn't support nested maps very well.
         # See comments in generate_update_node_operation_query_statement()
@@ -221,12 +258,71 @@ class NeptuneIngestQueryBuilder:
 
         on_match = f"""ON MATCH SET {RELATIONSHIP_REF_NAME} += removeKeyFromMap(removeKeyFromMap(param, "{from_node_id_param_name}"), "{to_node_id_param_name}")"""
 
-        return f"{match_from_node_segment} {match_to_node_segment} {merge_rel_segment} {on_create} {on_match}"
+        return f"{match_nodes_segment} MERGE {rel} {on_create} {on_match}"
+
+    def generate_operation_query_statement(
+        self, operation: OperationOnNodeIdentity | OperationOnRelationshipIdentity
+    ) -> str:
+        if isinstance(operation, OperationOnNodeIdentity):
+            return self.generate_update_node_operation_query_statement(operation)
+        return self.generate_update_relationship_operation_query_statement(operation)
+
+    def schema_operations(
+        self, schema: Schema
+    ) -> Iterator[OperationOnNodeIdentity | OperationOnRelationshipIdentity]:
+        """Yields an upsert operation per creation rule for the node types and adjacencies of `schema`."""
+        for node_type in schema.nodes:
+            shape = NodeIdentityShape(node_type.name, tuple(sorted(node_type.keys)))
+            for rule in NodeCreationRule:
+                yield OperationOnNodeIdentity(shape, rule)
+        for adjacency in schema.adjacencies:
+            if not schema.has_relationship_of_type(adjacency.relationship_type):
+                continue
+            keys = schema.get_relationship_type_by_name(
+                adjacency.relationship_type
+            ).keys
+            for rule in RelationshipCreationRule:
+                yield OperationOnRelationshipIdentity(
+                    from_node=self._matched_node(adjacency.from_node_type),
+                    to_node=self._matched_node(adjacency.to_node_type),
+                    relationship_identity=RelationshipIdentityShape(
+                        adjacency.relationship_type, tuple(sorted(keys))
+                    ),
+                    relationship_creation_rule=rule,
+                )
+
+    def warm_statement_cache(self, schema: Schema) -> int:
+        """Renders the upsert statements of the node types and adjacencies of `schema` ahead of time.
+
+        Returns the number of statements that were not cached yet.
+        """
+        return self._render_schema_statements(schema)[1]
+
+    def schema_statements(self, schema: Schema) -> List[str]:
+        """Returns the distinct upsert statements of `schema`, warming the statement cache with them."""
+        return self._render_schema_statements(schema)[0]
+
+    def _render_schema_statements(self, schema: Schema) -> Tuple[List[str], int]:
+        cache = self.statement_cache
+        # Only lookups made while ingesting count towards the hit rate.
+        hits, misses = cache.hits, cache.misses
+        statements = dict.fromkeys(
+            self.generate_operation_query_statement(operation)
+            for operation in self.schema_operations(schema)
+        )
+        rendered = cache.misses - misses
+        cache.hits, cache.misses = hits, misses
+        return list(statements), rendered
+
+    def _matched_node(self, node_type: str) -> OperationOnNodeIdentity:
+        return OperationOnNodeIdentity(
+            NodeIdentityShape(node_type, ()), NodeCreationRule.MATCH_ONLY
+        )
 
     def generate_update_rel_params(self, rel: Relationship) -> dict:
         """Generate the parameters for a query to update a relationship in the database."""
 
-        return _convert_unsupported_values({**rel.key_values, **rel.properties})
+        return {**rel.key_values, **rel.properties}
 
     def generate_update_rel_between_nodes_params(
         self, rel: RelationshipWithNodes
@@ -250,8 +346,18 @@ class NeptuneIngestQueryBuilder:
         """Generate a batch of queries to update nodes in the database in the same way of the same type."""
         query = self.generate_update_node_operation_query_statement(operation=operation)
 
-        params = [self.generate_update_node_operation_params(node) for node in nodes]
-        return QueryBatch(query, params)
+        # Rows are assembled column by column so that timestamps and floats
+        # can be converted and checked a whole column at a time.
+        node_id_param_name = generate_id_param_name(GENERIC_NODE_REF_NAME)
+        nodes = list(nodes)
+        params = ColumnarBatchBuilder()
+        for node, node_id in zip(nodes, self.node_ids.generate_ids(nodes)):
+            params.add_value(node_id_param_name, node_id)
+            if self.store_key_values:
+                params.add_values(node.key_values)
+            params.add_values(node.properties)
+            params.end_row()
+        return QueryBatch(query, params.build())
 
     def generate_batch_update_relationship_query_batch(
         self,
@@ -262,46 +368,84 @@ class NeptuneIngestQueryBuilder:
         query_stmt = self.generate_update_relationship_operation_query_statement(
             operation
         )
-        params = [
-            self.generate_update_rel_between_nodes_params(rel) for rel in relationships
-        ]
-
-        return QueryBatch(query_stmt, params)
+        from_node_id_param_name = generate_id_param_name(GENERIC_FROM_NODE_REF_NAME)
+        to_node_id_param_name = generate_id_param_name(GENERIC_TO_NODE_REF_NAME)
+        relationships = list(relationships)
+        from_node_ids = self.node_ids.generate_ids(
+            rel.from_node for rel in relationships
+        )
+        to_node_ids = self.node_ids.generate_ids(rel.to_node for rel in relationships)
+        params = ColumnarBatchBuilder()
+        for rel, from_node_id, to_node_id in zip(
+            relationships, from_node_ids, to_node_ids
+        ):
+            params.add_values(rel.relationship.key_values)
+            params.add_values(rel.relationship.properties)
+            params.add_value(from_node_id_param_name, from_node_id)
+            params.add_value(to_node_id_param_name, to_node_id)
+            params.end_row()
+
+        return QueryBatch(query_stmt, params.build())
 
     def generate_ttl_query_from_configuration(
         self, config: TimeToLiveConfiguration
     ) -> Query:
-        earliest_allowed_time = Timestamp.utcnow() - Timedelta(
-            hours=config.expiry_in_hours
-        )
-        params = _convert_unsupported_values(
-            {"earliest_allowed_time": earliest_allowed_time}
-        )
+        params = self._ttl_parameters(config)
         if config.custom_query is not None:
             return Query(config.custom_query, params)
 
-        query_builder = QueryBuilder()
-        ref_name = "x"
+        return Query(f"{self._ttl_match(config)} {self._ttl_delete(config)}", params)
 
-        if config.graph_object_type == GraphObjectType.NODE:
-            query_builder = query_builder.match().node(
-                labels=config.object_type, ref_name=ref_name
-            )
-        else:
-            query_builder = (
-                query_builder.match()
-                .node()
-                .related_to(label=config.object_type, ref_name=ref_name)
-                .node()
-            )
+    def generate_ttl_batch_query_from_configuration(
+        self, config: TimeToLiveConfiguration, batch_size: int
+    ) -> Query:
+        """Returns a query deleting up to `batch_size` expired objects, returning how many it deleted."""
+        return Query(
+            f"{self._ttl_match(config)} WITH {TTL_REF_NAME} LIMIT $batch_size "
+            f"{self._ttl_delete(config)} RETURN count(*) AS deleted",
+            {**self._ttl_parameters(config), "batch_size": batch_size},
+        )
 
-        query_builder = query_builder.where_literal(
-            f"{ref_name}.last_ingested_at <= $earliest_allowed_time"
+    def generate_ttl_id_scan_query_from_configuration(
+        self, config: TimeToLiveConfiguration, batch_size: int
+    ) -> Query:
+        """Returns a query reading the ids of up to `batch_size` expired objects after `$last_id`, in order."""
+        return Query(
+            f"{self._ttl_match(config)} AND id({TTL_REF_NAME}) > $last_id "
+            f"RETURN id({TTL_REF_NAME}) AS id ORDER BY id({TTL_REF_NAME}) LIMIT $batch_size",
+            {**self._ttl_parameters(config), "batch_size": batch_size, "last_id": ""},
         )
 
+    def generate_ttl_delete_by_ids_query_from_configuration(
+        self, config: TimeToLiveConfiguration
+    ) -> Query:
+        """Returns a query deleting the objects with the ids in `$ids` that are still expired."""
+        return Query(
+            f"UNWIND $ids AS expired_id {self._ttl_match(config)} "
+            f"AND id({TTL_REF_NAME}) = expired_id {self._ttl_delete(config)} "
+            "RETURN count(*) AS deleted",
+            {**self._ttl_parameters(config), "ids": []},
+        )
+
+    def _ttl_parameters(self, config: TimeToLiveConfiguration) -> dict:
+        earliest_allowed_time = Timestamp.utcnow() - Timedelta(
+            hours=config.expiry_in_hours
+        )
+        return {"earliest_allowed_time": earliest_allowed_time.timestamp()}
+
+    def _ttl_match(self, config: TimeToLiveConfiguration) -> str:
         if config.graph_object_type == GraphObjectType.NODE:
-            query_builder = query_builder.detach_delete(ref_name)
+            pattern = render_node(TTL_REF_NAME, config.object_type)
         else:
-            query_builder = query_builder.delete(ref_name)
+            rel = render_relationship(TTL_REF_NAME, config.object_type)
+            pattern = f"()-{rel}->()"
+
+        return (
+            f"MATCH {pattern} "
+            f"WHERE {TTL_REF_NAME}.{LAST_INGESTED_AT} <= $earliest_allowed_time"
+        )
 
-        return Query(str(query_builder), params)
+    def _ttl_delete(self, config: TimeToLiveConfiguration) -> str:
+        if config.graph_object_type == GraphObjectType.NODE:
+            return f"DETACH DELETE {TTL_REF_NAME}"
+        return f"DELETE {TTL_REF_NAME}"
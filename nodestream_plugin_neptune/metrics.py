@@ -0,0 +1,263 @@
+import hashlib
+import random
+import socket
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .statement_cache import StatementCache
+
+DEFAULT_STATSD_HOST = "localhost"
+DEFAULT_STATSD_PORT = 8125
+DEFAULT_STATSD_PREFIX = "nodestream.neptune"
+HISTOGRAM_RESERVOIR_SIZE = 1024
+STATEMENT_TAG_CACHE_SIZE = 10_000
+
+Tags = Optional[Dict[str, str]]
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+# Statements include the queries of hooks, so the tags are not kept forever.
+_STATEMENT_TAGS = StatementCache(STATEMENT_TAG_CACHE_SIZE)
+
+
+def statement_tag(query_stmt: str) -> str:
+    """Returns a short, stable hash identifying a query statement in metric tags."""
+    tag = _STATEMENT_TAGS.get(query_stmt)
+    if tag is None:
+        tag = hashlib.sha1(query_stmt.encode("utf-8")).hexdigest()[:12]
+        _STATEMENT_TAGS.put(query_stmt, tag)
+    return tag
+
+
+def _key(name: str, tags: Tags) -> MetricKey:
+    return name, tuple(sorted(tags.items())) if tags else ()
+
+
+def _format_key(key: MetricKey) -> str:
+    name, tags = key
+    if not tags:
+        return name
+    return f"{name}[{','.join(f'{k}={v}' for k, v in tags)}]"
+
+
+class MetricsSink:
+    """Receives every metric recorded through `Metrics`.
+
+    The base class ignores everything, subclasses override the kinds of metrics
+    they are interested in. `timing` values are in seconds.
+    """
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None):
+        pass
+
+    def gauge(self, name: str, value: float, tags: Tags = None):
+        pass
+
+    def histogram(self, name: str, value: float, tags: Tags = None):
+        pass
+
+    def timing(self, name: str, seconds: float, tags: Tags = None):
+        pass
+
+    def close(self):
+        pass
+
+
+@dataclass(slots=True)
+class Histogram:
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+    samples: List[float] = field(default_factory=list)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        # Reservoir sampling keeps the percentiles representative of every
+        # observation while holding a bounded number of them.
+        if len(self.samples) < HISTOGRAM_RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < HISTOGRAM_RESERVOIR_SIZE:
+                self.samples[index] = value
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else 0.0,
+        }
+
+
+class MetricsRegistry(MetricsSink):
+    """Keeps counters, gauges and histograms in memory."""
+
+    def __init__(self) -> None:
+        self.counters: Dict[MetricKey, float] = {}
+        self.gauges: Dict[MetricKey, float] = {}
+        self.histograms: Dict[MetricKey, Histogram] = {}
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None):
+        key = _key(name, tags)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, tags: Tags = None):
+        self.gauges[_key(name, tags)] = value
+
+    def histogram(self, name: str, value: float, tags: Tags = None):
+        key = _key(name, tags)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    timing = histogram
+
+    def counter_value(self, name: str, tags: Tags = None) -> float:
+        return self.counters.get(_key(name, tags), 0)
+
+    def histogram_for(self, name: str, tags: Tags = None) -> Optional[Histogram]:
+        return self.histograms.get(_key(name, tags))
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            "counters": {_format_key(k): v for k, v in self.counters.items()},
+            "gauges": {_format_key(k): v for k, v in self.gauges.items()},
+            "histograms": {
+                _format_key(k): h.summary() for k, h in self.histograms.items()
+            },
+        }
+
+
+class StatsdSink(MetricsSink):
+    """Sends metrics to a StatsD agent over UDP, with DogStatsD style tags.
+
+    Sending is fire and forget: a missing agent never slows down or fails the
+    ingestion.
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_STATSD_HOST,
+        port: int = DEFAULT_STATSD_PORT,
+        prefix: str = DEFAULT_STATSD_PREFIX,
+    ) -> None:
+        self.address = (host, port)
+        self.prefix = f"{prefix}." if prefix else ""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def format(self, name: str, value: float, kind: str, tags: Tags) -> bytes:
+        line = f"{self.prefix}{name}:{value:g}|{kind}"
+        if tags:
+            line += "|#" + ",".join(f"{k}:{v}" for k, v in sorted(tags.items()))
+        return line.encode("utf-8")
+
+    def send(self, name: str, value: float, kind: str, tags: Tags):
+        try:
+            self.socket.sendto(self.format(name, value, kind, tags), self.address)
+        except OSError:
+            pass
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None):
+        self.send(name, value, "c", tags)
+
+    def gauge(self, name: str, value: float, tags: Tags = None):
+        self.send(name, value, "g", tags)
+
+    def histogram(self, name: str, value: float, tags: Tags = None):
+        self.send(name, value, "h", tags)
+
+    def timing(self, name: str, seconds: float, tags: Tags = None):
+        self.send(name, seconds * 1000, "ms", tags)
+
+    def close(self):
+        self.socket.close()
+
+
+class Metrics:
+    """Records the timings and counts of what the plugin does.
+
+    Every metric is kept in an in-process `registry` and forwarded to the
+    additional `sinks`. With `log_summary`, a summary of the registry is logged
+    when the metrics are closed at the end of the ingestion, which is usually
+    enough to tell whether time goes into building queries or waiting on
+    Neptune. Metrics shared by several users, e.g. the executors of every
+    pipeline writing through a connection, are only closed once each user
+    that called `acquire` called `close`.
+    """
+
+    @classmethod
+    def from_settings(
+        cls,
+        log_summary: bool = False,
+        statsd: dict = None,
+        sinks: Iterable[MetricsSink] = (),
+    ):
+        sinks = list(sinks)
+        if statsd is not None:
+            sinks.append(StatsdSink(**statsd))
+        return cls(sinks=sinks, log_summary=log_summary)
+
+    def __init__(
+        self, sinks: Iterable[MetricsSink] = (), log_summary: bool = False
+    ) -> None:
+        self.registry = MetricsRegistry()
+        self.sinks: List[MetricsSink] = [self.registry, *sinks]
+        self.log_summary = log_summary
+        self.users = 0
+        self.logger = getLogger(self.__class__.__name__)
+
+    def acquire(self):
+        """Registers one more user, which is expected to `close` the metrics once done."""
+        self.users += 1
+
+    def increment(self, name: str, value: float = 1, tags: Tags = None):
+        for sink in self.sinks:
+            sink.increment(name, value, tags)
+
+    def gauge(self, name: str, value: float, tags: Tags = None):
+        for sink in self.sinks:
+            sink.gauge(name, value, tags)
+
+    def histogram(self, name: str, value: float, tags: Tags = None):
+        for sink in self.sinks:
+            sink.histogram(name, value, tags)
+
+    def timing(self, name: str, seconds: float, tags: Tags = None):
+        for sink in self.sinks:
+            sink.timing(name, seconds, tags)
+
+    @contextmanager
+    def timer(self, name: str, tags: Tags = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - start, tags)
+
+    def close(self):
+        if self.users > 1:
+            self.users -= 1
+            return
+        self.users = 0
+        if self.log_summary:
+            self.logger.info("Neptune metrics summary", extra=self.registry.summary())
+        for sink in self.sinks:
+            sink.close()
@@ -1,37 +1,87 @@
 import asyncio
-import json
-import random
+import math
+import time
 from abc import ABC, abstractmethod
+from itertools import count
 from logging import getLogger
+from typing import AsyncIterator
 
 import botocore
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
 
+from .client_pool import DEFAULT_CLIENT_POOL_SIZE, ClientPool
+from .deadline import Deadline, DeadlineExceededError, RequestTimeoutError
+from .metrics import Metrics, statement_tag
+from .partition_sizer import estimate_parameter_bytes
+from .request_scheduler import RequestScheduler
+from .result_stream import iter_records_from_payload
+from .retry_policy import RetryPolicy, classify_error, is_idempotent
+from .serialization import convert_parameters, serialize_parameters
+
+
+class QueryFailedError(Exception):
+    """Raised by `NeptuneConnection.stream(..., raise_errors=True)` when its query failed."""
+
 
 class NeptuneConnection(ABC):
+    reader_pool: ClientPool | None = None
+    in_flight_requests: int = 0
+    # Seconds a single attempt at a request may take, on top of botocore's own timeouts.
+    request_timeout: float | None = None
+
     @property
     def logger(self):
         return getLogger(self.__class__.__name__)
 
-    async def execute(self, query_stmt: str, parameters) -> dict | None:
+    @property
+    def client(self):
+        clients = self.client_pool.clients
+        return clients[0] if clients else None
+
+    @property
+    def boto_context_manager(self):
+        context_managers = self.client_pool.context_managers
+        return context_managers[0] if context_managers else None
+
+    async def execute(
+        self,
+        query_stmt: str,
+        parameters,
+        on_retry=None,
+        on_error=None,
+        read_only: bool = False,
+        keep_payload: bool = False,
+        deadline: Deadline = None,
+    ) -> dict | None:
+        """
+        Executes `query_stmt` with retries, returning the response or None if the query failed.
+
+        Unless `keep_payload` is set, any streamed response payload is closed without being read.
+        Use `records()` to read the records of a response kept open this way, or `stream()` to do both.
+        Attempts and the waits between them are cut short so that the query is given up by `deadline`.
+        """
         response: dict | None = None
-        max_retries = 3
-        retry_delay = 1
 
-        if self.client is None:
-            self.boto_context_manager = self._create_boto_client()
-            self.client = await self.boto_context_manager.__aenter__()
+        # Read-only traffic is spread over the reader endpoints when there are any.
+        pool = self.reader_pool if read_only and self.reader_pool else self.client_pool
+        client = await pool.get()
 
         try:
-            if self.client is not None:
+            if client is not None:
                 try:
+                    # Encode the parameters once rather than on every attempt.
+                    # Rows that cannot be encoded fail like any other query.
+                    with self.metrics.timer("parameter_serialization"):
+                        parameters = self._prepare_parameters(parameters)
                     response = await self.__retry(
                         func=lambda: self.__attempt_query(
-                            self.client, query_stmt, parameters
+                            client, query_stmt, parameters
                         ),
-                        max_retries=max_retries,
-                        delay=retry_delay,
-                        exceptions=self._get_retryable_exceptions(self.client),
+                        conflict_exceptions=self._get_retryable_exceptions(client),
+                        idempotent=is_idempotent(query_stmt),
+                        on_retry=on_retry,
+                        deadline=deadline or Deadline(),
                     )
 
                 except botocore.exceptions.EndpointConnectionError as e:
@@ -41,25 +91,72 @@ class NeptuneConnection(ABC):
                         self.logger.error(child_error)
                     except Exception:
                         pass
+                    if on_error is not None:
+                        on_error(e)
                 except (
                     botocore.exceptions.NoCredentialsError,
-                    self.client.exceptions.AccessDeniedException,
+                    client.exceptions.AccessDeniedException,
                 ) as e:
                     self.logger.error(f"\nUnexpected error: {e}.")
+                    if on_error is not None:
+                        on_error(e)
                 except Exception as e:
                     self.logger.error(
                         f"\nUnexpected error: {e} for query: {query_stmt}."
                     )
-            if response is not None and response.get("payload"):
+                    if on_error is not None:
+                        on_error(e)
+            if not keep_payload and response is not None and response.get("payload"):
                 response["payload"].close()
             return response
         except botocore.exceptions.NoRegionError as e:
             self.logger.error(f"\nUnexpected error: {e}.")
 
+    async def stream(
+        self,
+        query_stmt: str,
+        parameters,
+        read_only: bool = False,
+        raise_errors: bool = False,
+    ) -> AsyncIterator[dict]:
+        """Executes `query_stmt` and yields the records it returns one at a time.
+
+        A failed query yields no records, just like a query matching nothing,
+        unless `raise_errors` is set, in which case `QueryFailedError` is raised.
+        Readers paging through results should set it, so that a failed page is
+        not taken for the last one.
+        """
+        errors = []
+        response = await self.execute(
+            query_stmt,
+            parameters,
+            on_error=errors.append,
+            read_only=read_only,
+            keep_payload=True,
+        )
+        if response is None:
+            if raise_errors:
+                raise QueryFailedError(f"Query failed: {query_stmt}") from (
+                    errors[-1] if errors else None
+                )
+            return
+        async for record in self.records(response):
+            yield record
+
+    @abstractmethod
+    def records(self, response: dict) -> AsyncIterator[dict]:
+        """Yields the records of a response returned by `execute(..., keep_payload=True)`."""
+        pass
+
     @abstractmethod
     def _create_boto_client(self):
         pass
 
+    @abstractmethod
+    def _prepare_parameters(self, parameters):
+        """Converts query parameters into what the client expects them as."""
+        pass
+
     @abstractmethod
     async def _execute_query(
         self, client, query_stmt: str, parameters: str
@@ -86,11 +183,21 @@ class NeptuneConnection(ABC):
         Raises:
             Exception: Any exception thrown from the client when attempting queries.
         """
-        response = await self._execute_query(
-            client,
-            query_stmt=query_stmt,
-            parameters=parameters,
-        )
+        metrics = self.metrics
+        tags = {"statement": statement_tag(query_stmt)}
+        self.in_flight_requests += 1
+        metrics.gauge("in_flight_requests", self.in_flight_requests)
+        start = time.perf_counter()
+        try:
+            response = await self._execute_query(
+                client,
+                query_stmt=query_stmt,
+                parameters=parameters,
+            )
+        finally:
+            metrics.timing("request_latency", time.perf_counter() - start, tags)
+            self.in_flight_requests -= 1
+            metrics.gauge("in_flight_requests", self.in_flight_requests)
 
         code = response["ResponseMetadata"]["HTTPStatusCode"]
         if code != 200:
@@ -98,54 +205,107 @@ class NeptuneConnection(ABC):
 
         return response
 
-    async def __retry(self, func, max_retries: int, exceptions, delay=0):
+    async def __retry(
+        self,
+        func,
+        conflict_exceptions=(),
+        idempotent: bool = True,
+        on_retry=None,
+        deadline: Deadline = None,
+    ):
         """
-        Retries a function `func` up to `attempts` times on encountering exceptions in `exceptions`.
-        Waits for `delay` seconds between retries.
+        Retries a function `func` for as long as `self.retry_policy` and `deadline` allow it.
 
         Args:
-            max_retries: int
-                Number of retry attempts.
-            exceptions: (Exception...)
-                Exceptions to catch and retry on (tuple of exception types).
-            delay: int
-                Delay in seconds between retries.
             func: function
                 Function to be retried.
+            conflict_exceptions: (Exception...)
+                Client specific exception types signaling a conflicting concurrent modification.
+            idempotent: bool, optional
+                Whether `func` can safely be called again after timing out on the client side.
+            on_retry: function, optional
+                Called with the caught exception every time the function is about to be retried.
+            deadline: Deadline, optional
+                When to give up. Every attempt is limited to the time left, as is the wait before the next one.
 
         Returns: dict | None
             The return value of the successful function call.
 
         Raises:
-            Exception: The last encountered exception if all retries fail.
+            Exception: The last encountered exception if the error is not retryable or all retries fail.
         """
+        policy = self.retry_policy
+        policy.budget.record_request()
+        deadline = deadline or Deadline()
+        delay = None
 
-        for attempt in range(1, max_retries + 1):
+        for attempt in count(1):
             try:
-                return await func()
-            except exceptions as e:
-                if attempt < max_retries:
+                return await self.__attempt_within(func, deadline)
+            except Exception as e:
+                category = classify_error(e, conflict_exceptions)
+                self.metrics.increment("errors", tags={"category": category.value})
+                if not policy.should_retry(category, attempt, idempotent):
+                    if category in policy.retry_on:
+                        self.logger.exception(
+                            f"Query failed on attempt {attempt}/{policy.max_attempts} with {category.value} "
+                            f"error: {e} Max retries reached or retry budget exhausted."
+                        )
+                    raise e
+
+                delay = policy.next_delay(delay)
+                if not deadline.allows(delay):
                     self.logger.warning(
-                        f"Query failed on attempt {attempt}/{max_retries} with error: {e} "
-                        f"Retrying in {delay}s."
-                    )
-                    await asyncio.sleep(delay + random.uniform(0, 0.5))
-                    delay *= 2
-                    continue  # retry on conflict exception
-                else:
-                    self.logger.exception(
-                        f"Query failed on attempt {attempt}/{max_retries} with error: {e} "
-                        f"Max retries reached."
+                        f"Query failed on attempt {attempt}/{policy.max_attempts} with {category.value} "
+                        f"error: {e} No time is left before its deadline to retry it."
                     )
-                    raise e
+                    raise DeadlineExceededError(
+                        "Deadline exceeded before the query could be retried."
+                    ) from e
+
+                if on_retry is not None:
+                    on_retry(e)
+                self.metrics.increment("retries", tags={"category": category.value})
+                self.logger.warning(
+                    f"Query failed on attempt {attempt}/{policy.max_attempts} with {category.value} "
+                    f"error: {e} Retrying in {delay:.2f}s."
+                )
+                await asyncio.sleep(delay)
+
+    async def __attempt_within(self, func, deadline: Deadline):
+        """Calls `func`, cancelling it once `self.request_timeout` or `deadline` is reached."""
+        if deadline.expired:
+            raise DeadlineExceededError("Deadline exceeded before the query was sent.")
+        timeout = deadline.timeout(self.request_timeout)
+        if timeout is None:
+            return await func()
+        try:
+            return await asyncio.wait_for(func(), timeout)
+        except asyncio.TimeoutError as e:
+            if deadline.expired:
+                raise DeadlineExceededError(
+                    f"Deadline exceeded while waiting {timeout:.2f}s for the query."
+                ) from e
+            raise RequestTimeoutError(
+                f"Query did not complete within {timeout:.2f}s."
+            ) from e
 
     @abstractmethod
     def _get_retryable_exceptions(self):
         pass
 
+    def _make_client_config(self, client_kwargs: dict, max_pool_connections: int):
+        # Each pooled client gets its own HTTP connection pool sized to its share
+        # of the requests allowed in flight.
+        pool_config = AioConfig(max_pool_connections=max_pool_connections)
+        config = client_kwargs.pop("config", None)
+        return config.merge(pool_config) if config is not None else pool_config
+
     async def close(self):
-        if self.boto_context_manager is not None:
-            await self.boto_context_manager.__aexit__(None, None, None)
+        await self.client_pool.close()
+        if self.reader_pool is not None:
+            await self.reader_pool.close()
+        self.metrics.close()
 
 
 class NeptuneDBConnection(NeptuneConnection):
@@ -162,19 +322,50 @@ class NeptuneDBConnection(NeptuneConnection):
             )
         return cls(host=host, region=region, **client_kwargs)
 
-    def __init__(self, host: str, region: str = None, **client_kwargs) -> None:
+    def __init__(
+        self,
+        host: str,
+        region: str = None,
+        scheduler: RequestScheduler = None,
+        retry_policy: RetryPolicy = None,
+        metrics: Metrics = None,
+        client_pool_size: int = DEFAULT_CLIENT_POOL_SIZE,
+        max_pool_connections: int = None,
+        reader_endpoints: list[str] = None,
+        request_timeout: float = None,
+        **client_kwargs,
+    ) -> None:
         self.host = host
+        self.request_timeout = request_timeout
         self.boto_session = get_session()
         self.region = region
+        self.scheduler = scheduler or RequestScheduler()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics = metrics or Metrics()
+        self.client_config = self._make_client_config(
+            client_kwargs,
+            max_pool_connections
+            or math.ceil(self.scheduler.max_in_flight / client_pool_size),
+        )
         self.client_kwargs = client_kwargs
-        self.client = None
-        self.boto_context_manager = None
+        self.reader_endpoints = reader_endpoints or []
+        self.client_pool = ClientPool(
+            lambda _: self._create_boto_client(), client_pool_size
+        )
+        if self.reader_endpoints:
+            self.reader_pool = ClientPool(
+                lambda index: self._create_boto_client(
+                    self.reader_endpoints[index % len(self.reader_endpoints)]
+                ),
+                max(client_pool_size, len(self.reader_endpoints)),
+            )
 
-    def _create_boto_client(self):
+    def _create_boto_client(self, endpoint_url: str = None):
         return self.boto_session.create_client(
             "neptunedata",
-            endpoint_url=self.host,
+            endpoint_url=endpoint_url or self.host,
             region_name=self.region,
+            config=self.client_config,
             **self.client_kwargs,
         )
 
@@ -187,12 +378,23 @@ class NeptuneDBConnection(NeptuneConnection):
             },
         )
 
+        self.metrics.histogram("bytes_sent", len(query_stmt) + len(parameters))
+
         return await client.execute_open_cypher_query(
             openCypherQuery=query_stmt,
-            # Use json.dumps() to warp dict's key/values in double quotes.
-            parameters=json.dumps(parameters),
+            parameters=parameters,
         )
 
+    def _prepare_parameters(self, parameters) -> str:
+        # The Neptune Database API takes the parameters as a JSON string.
+        return serialize_parameters(parameters)
+
+    async def records(self, response: dict) -> AsyncIterator[dict]:
+        # The Neptune Database API returns results as a document that botocore
+        # has already decoded, so there is nothing left to stream.
+        for record in response.get("results", ()):
+            yield record
+
     def _get_retryable_exceptions(self, client):
         return (client.exceptions.ConcurrentModificationException,)
 
@@ -200,7 +402,12 @@ class NeptuneDBConnection(NeptuneConnection):
 class NeptuneAnalyticsConnection(NeptuneConnection):
     @classmethod
     def from_configuration(
-        cls, graph_id: str, host: str = None, region: str = None, **client_kwargs
+        cls,
+        graph_id: str,
+        host: str = None,
+        region: str = None,
+        reader_endpoints: list[str] = None,
+        **client_kwargs,
     ):
         if graph_id is None:
             raise ValueError(
@@ -210,19 +417,47 @@ class NeptuneAnalyticsConnection(NeptuneConnection):
             raise ValueError(
                 "A `host` should not be used with Neptune Analytics, `graph_id=<Graph Identifier>` should be used instead. If using Neptune Database, set `mode='database'."
             )
+        if reader_endpoints:
+            raise ValueError(
+                "`reader_endpoints` are only supported with Neptune Database, set `mode='database'`."
+            )
         return cls(graph_id=graph_id, region=region, **client_kwargs)
 
-    def __init__(self, graph_id: str, region: str = None, **client_kwargs) -> None:
+    def __init__(
+        self,
+        graph_id: str,
+        region: str = None,
+        scheduler: RequestScheduler = None,
+        retry_policy: RetryPolicy = None,
+        metrics: Metrics = None,
+        client_pool_size: int = DEFAULT_CLIENT_POOL_SIZE,
+        max_pool_connections: int = None,
+        request_timeout: float = None,
+        **client_kwargs,
+    ) -> None:
         self.graph_id = graph_id
+        self.request_timeout = request_timeout
         self.boto_session = get_session()
         self.region = region
+        self.scheduler = scheduler or RequestScheduler()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics = metrics or Metrics()
+        self.client_config = self._make_client_config(
+            client_kwargs,
+            max_pool_connections
+            or math.ceil(self.scheduler.max_in_flight / client_pool_size),
+        )
         self.client_kwargs = client_kwargs
-        self.client = None
-        self.boto_context_manager = None
+        self.client_pool = ClientPool(
+            lambda _: self._create_boto_client(), client_pool_size
+        )
 
     def _create_boto_client(self):
         return self.boto_session.create_client(
-            "neptune-graph", region_name=self.region, **self.client_kwargs
+            "neptune-graph",
+            region_name=self.region,
+            config=self.client_config,
+            **self.client_kwargs,
         )
 
     async def _execute_query(self, client, query_stmt: str, parameters):
@@ -234,6 +469,11 @@ class NeptuneAnalyticsConnection(NeptuneConnection):
             },
         )
 
+        # botocore encodes the parameters itself, so their size is estimated.
+        self.metrics.histogram(
+            "bytes_sent", len(query_stmt) + estimate_parameter_bytes(parameters)
+        )
+
         return await client.execute_query(
             graphIdentifier=self.graph_id,
             queryString=query_stmt,
@@ -241,5 +481,14 @@ class NeptuneAnalyticsConnection(NeptuneConnection):
             parameters=parameters,
         )
 
+    def _prepare_parameters(self, parameters) -> dict:
+        # The Neptune Analytics API takes the parameters as a document that
+        # botocore encodes itself.
+        return convert_parameters(parameters)
+
+    async def records(self, response: dict) -> AsyncIterator[dict]:
+        async for record in iter_records_from_payload(response["payload"]):
+            yield record
+
     def _get_retryable_exceptions(self, client):
         return (client.exceptions.ConflictException,)
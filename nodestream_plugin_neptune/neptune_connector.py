@@ -1,11 +1,43 @@
+from logging import getLogger
+
 from nodestream.databases.copy import TypeRetriever
 from nodestream.databases.database_connector import DatabaseConnector, QueryExecutor
 from nodestream.schema.migrations import Migrator
 
+from .bulk_loader import BulkLoader, BulkLoadSettings
+from .change_detection import (
+    FINGERPRINT_CHANGES,
+    QUERY_CHANGES,
+    ChangeDetectionSettings,
+    FingerprintCache,
+)
+from .client_pool import DEFAULT_CLIENT_POOL_SIZE
+from .dead_letters import JsonlDeadLetterSink
 from .ingest_query_builder import NeptuneIngestQueryBuilder
+from .metrics import Metrics
 from .neptune_connection import NeptuneAnalyticsConnection, NeptuneDBConnection
 from .neptune_migrator import NeptuneMigrator
-from .neptune_query_executor import NeptuneQueryExecutor
+from .neptune_query_executor import (
+    NeptuneBulkLoadQueryExecutor,
+    NeptuneQueryExecutor,
+)
+from .node_ids import COMPOSITE_NODE_IDS, DEFAULT_NODE_ID_CACHE_SIZE
+from .partition_sizer import AdaptivePartitionSizer
+from .precompilation import (
+    PrecompiledStatements,
+    PrecompileSettings,
+    precompile_statements,
+    read_schema,
+)
+from .request_scheduler import (
+    DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+    DEFAULT_MAX_QUEUED_REQUESTS,
+    RequestScheduler,
+)
+from .retry_policy import RetryPolicy
+from .statement_cache import StatementCache
+from .ttl import BatchedTimeToLive, TimeToLiveSettings
+from .write_buffer import WriteBufferSettings
 
 
 class NeptuneConnector(DatabaseConnector, alias="neptune"):
@@ -23,7 +55,30 @@ class NeptuneConnector(DatabaseConnector, alias="neptune"):
         host: str = None,
         graph_id: str = None,
         include_label_in_id: bool = True,
+        node_id_cache_size: int = DEFAULT_NODE_ID_CACHE_SIZE,
+        node_id_mode: str = COMPOSITE_NODE_IDS,
+        statement_cache_size: int = None,
         region: str = None,
+        partition_sizing: dict = None,
+        conflict_aware_partitioning: bool = True,
+        coalesce_writes: bool = True,
+        write_buffer: dict = None,
+        max_in_flight_requests: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+        max_queued_requests: int = DEFAULT_MAX_QUEUED_REQUESTS,
+        retry_policy: dict = None,
+        request_timeout: float = None,
+        batch_timeout: float = None,
+        dead_letters: dict = None,
+        time_to_live: dict = None,
+        precompile: dict = None,
+        change_detection: dict = None,
+        metrics: dict = None,
+        client_pool_size: int = DEFAULT_CLIENT_POOL_SIZE,
+        max_pool_connections: int = None,
+        reader_endpoints: list = None,
+        type_retrieval: dict = None,
+        migration: dict = None,
+        bulk_load: dict = None,
         **client_kwargs
     ):
         """
@@ -37,19 +92,131 @@ class NeptuneConnector(DatabaseConnector, alias="neptune"):
             Used with mode="analytics", specify the graph identifier of the target Neptune Analytics graph
         include_label_in_id : bool, optional
             Sets if the labels should be included in generated node ids. Default is True
+        node_id_cache_size : int, optional
+            Number of recently generated node ids kept in memory. Default is 100000
+        node_id_mode : str, optional
+            Either "composite", for ids concatenating the type and key values of nodes, or "hashed",
+            for fixed-length digests of them with the key values stored as node properties. Default is "composite"
+        statement_cache_size : int, optional
+            Number of rendered query statements kept in a cache of this connector's own. By default, statements
+            are kept in a cache of 10000 statements shared by all connectors
         region : str
             Sets the region of the Neptune graph
+        partition_sizing : dict, optional
+            Settings for the adaptive partition sizer used to split batches into requests, e.g.
+            `initial_size`, `min_size`, `max_size`, `target_latency`, `max_payload_bytes` or
+            `adaptive: false` to always use `initial_size`
+        conflict_aware_partitioning : bool, optional
+            Sets if rows sharing their busiest node id should be sent in the same or serialized requests. Default is True
+        coalesce_writes : bool, optional
+            Sets if rows of a batch writing to the same node or relationship should be merged into one row,
+            the last row winning for properties set by several of them. Default is True
+        write_buffer : dict, optional
+            Enables buffering the rows of upserts across calls, written per query statement once
+            `max_rows` rows or `max_bytes` bytes are buffered or the oldest row waited `max_latency` seconds
+        max_in_flight_requests : int, optional
+            Maximum number of requests sent to the graph concurrently. Default is 10
+        max_queued_requests : int, optional
+            Maximum number of requests waiting for an in-flight slot before writers are held back. Default is 100
+        retry_policy : dict, optional
+            Settings for retrying failed queries, e.g. `max_attempts`, `base_delay`, `max_delay`,
+            the error categories to `retry_on` and `split_on`, `budget_ratio` and
+            `budget_min_retries_per_second`
+        request_timeout : float, optional
+            Seconds after which a single attempt at a request is cancelled and retried as a `request_timeout` error
+        batch_timeout : float, optional
+            Seconds the requests of a batch may take in total, retries included. Partitions that did not complete
+            by then are given up and reported
+        dead_letters : dict, optional
+            Enables writing the rows of partitions that failed for good to JSON lines files in `directory`,
+            gzipped with `compress: true`, from which `nodestream neptune-replay` can send them again
+        time_to_live : dict, optional
+            Settings for deleting expired objects in batches: the `batch_size` of each delete, the `pause` in seconds
+            between batches and the `concurrency` of batches over disjoint pages of ids
+        precompile : dict, optional
+            Renders and checks the upsert and TTL statements of every type in the `schema` file when the connector
+            is created. With `warm_plan_cache: true`, each upsert statement is also sent once without rows before
+            the first write, so Neptune has planned it by the time the first batch arrives
+        change_detection : dict, optional
+            Skips writing objects whose properties did not change. With the "fingerprint" `mode`, rows are dropped
+            when a digest of their values matches the one of the last write of their object, kept for up to
+            `cache_size` objects and for `refresh_after` seconds. With the "query" `mode`, upserts compare the
+            properties in the query and only set them if any changed
+        metrics : dict, optional
+            Settings for the metrics recorded while ingesting, e.g. `log_summary: true` to log a summary
+            when the ingestion finishes or `statsd` with the `host`, `port` and `prefix` of a StatsD agent
+        client_pool_size : int, optional
+            Number of boto clients requests are spread across. Default is 1
+        max_pool_connections : int, optional
+            Size of each client's HTTP connection pool. Defaults to the client's share of `max_in_flight_requests`
+        reader_endpoints : list, optional
+            Used with mode="database", reader endpoints that read-only extractor queries are spread across
+        type_retrieval : dict, optional
+            Settings for reading types out of the graph with `nodestream copy`, e.g. `page_size`,
+            `prefetch_depth`, `parallelism` or `keyset_pagination: false`
+        migration : dict, optional
+            Settings for running migrations over every node or relationship of a type, e.g. the
+            `chunk_size` of the chunks they are run in and the `concurrency` of the chunks
+        bulk_load : dict, optional
+            Used with mode="database", writes nodes and relationships to openCypher bulk load files that are
+            loaded with the Neptune bulk loader when the ingestion finishes instead of upserting them. Takes the
+            `source` to upload the files to, the `iam_role_arn` and `s3_bucket_region` of the loader,
+            `rows_per_file`, `compress`, `poll_interval`, `timeout` and extra `loader_options`
         client_kwargs : optional
             Additional keyword arguments to be passed to the boto3 client constructor
         """
-
+        change_detection = (
+            ChangeDetectionSettings(**change_detection)
+            if change_detection is not None
+            else None
+        )
         return cls(
             mode=mode,
             host=host,
             graph_id=graph_id,
-            ingest_query_builder=NeptuneIngestQueryBuilder(include_label_in_id),
+            ingest_query_builder=NeptuneIngestQueryBuilder(
+                include_label_in_id,
+                node_id_cache_size,
+                node_id_mode,
+                statement_cache=(
+                    StatementCache(statement_cache_size)
+                    if statement_cache_size is not None
+                    else None
+                ),
+                compare_properties=(
+                    change_detection is not None
+                    and change_detection.mode == QUERY_CHANGES
+                ),
+            ),
             region=region,
-            **client_kwargs
+            partition_sizer=AdaptivePartitionSizer(**(partition_sizing or {})),
+            conflict_aware_partitioning=conflict_aware_partitioning,
+            coalesce_writes=coalesce_writes,
+            write_buffer=(
+                WriteBufferSettings(**write_buffer)
+                if write_buffer is not None
+                else None
+            ),
+            scheduler=RequestScheduler(max_in_flight_requests, max_queued_requests),
+            retry_policy=RetryPolicy(**(retry_policy or {})),
+            request_timeout=request_timeout,
+            batch_timeout=batch_timeout,
+            dead_letters=dead_letters,
+            time_to_live=TimeToLiveSettings(**(time_to_live or {})),
+            precompile=(
+                PrecompileSettings(**precompile) if precompile is not None else None
+            ),
+            change_detection=change_detection,
+            metrics=Metrics.from_settings(**(metrics or {})),
+            client_pool_size=client_pool_size,
+            max_pool_connections=max_pool_connections,
+            reader_endpoints=reader_endpoints,
+            type_retrieval=type_retrieval,
+            migration=migration,
+            bulk_load=(
+                BulkLoadSettings(**bulk_load) if bulk_load is not None else None
+            ),
+            **client_kwargs,
         )
 
     def __init__(
@@ -59,6 +226,18 @@ class NeptuneConnector(DatabaseConnector, alias="neptune"):
         host: str = None,
         graph_id: str = None,
         region: str = None,
+        partition_sizer: AdaptivePartitionSizer = None,
+        conflict_aware_partitioning: bool = True,
+        coalesce_writes: bool = True,
+        write_buffer: WriteBufferSettings = None,
+        batch_timeout: float = None,
+        dead_letters: dict = None,
+        time_to_live: TimeToLiveSettings = None,
+        precompile: PrecompileSettings = None,
+        change_detection: ChangeDetectionSettings = None,
+        type_retrieval: dict = None,
+        migration: dict = None,
+        bulk_load: BulkLoadSettings = None,
         **client_kwargs
     ) -> None:
         if mode == "database":
@@ -71,23 +250,94 @@ class NeptuneConnector(DatabaseConnector, alias="neptune"):
             )
         else:
             raise ValueError("`mode` must be either 'database' or 'analytics'")
+        if bulk_load is not None and mode != "database":
+            raise ValueError("`bulk_load` is only supported with `mode='database'`.")
 
         self.mode = mode
         self.host = host
         self.graph_id = graph_id
         self.region = region
         self.ingest_query_builder = ingest_query_builder
+        self.partition_sizer = partition_sizer or AdaptivePartitionSizer()
+        self.conflict_aware_partitioning = conflict_aware_partitioning
+        self.coalesce_writes = coalesce_writes
+        self.write_buffer = write_buffer
+        self.batch_timeout = batch_timeout
+        self.dead_letters = dead_letters
+        self.time_to_live = time_to_live
+        self.type_retrieval = type_retrieval or {}
+        self.migration = migration or {}
+        self.bulk_load = bulk_load
+        # Shared by the executors of every pipeline writing through this connector.
+        self.fingerprints = (
+            FingerprintCache(change_detection)
+            if change_detection is not None
+            and change_detection.mode == FINGERPRINT_CHANGES
+            else None
+        )
+        self.precompile = precompile
+        self.precompiled = (
+            self._precompile_statements(precompile.schema)
+            if precompile is not None
+            else None
+        )
+
+    def _precompile_statements(self, schema_path: str) -> PrecompiledStatements:
+        precompiled = precompile_statements(
+            read_schema(schema_path),
+            self.ingest_query_builder,
+            BatchedTimeToLive(
+                self.connection, self.ingest_query_builder, self.time_to_live
+            ),
+        )
+        getLogger(self.__class__.__name__).info(
+            "Precompiled the statements of the schema",
+            extra=dict(
+                schema=schema_path,
+                upserts=len(precompiled.upserts),
+                ttls=len(precompiled.ttls),
+            ),
+        )
+        return precompiled
+
+    def _plan_cache_statements(self):
+        if self.precompiled is None or not self.precompile.warm_plan_cache:
+            return None
+        return list(self.precompiled.upserts)
 
     def make_query_executor(self) -> QueryExecutor:
-        return NeptuneQueryExecutor(
+        # Every executor closes the connection when it finishes, the metrics
+        # must outlive all but the last of them.
+        self.connection.metrics.acquire()
+        settings = dict(
             connection=self.connection,
             ingest_query_builder=self.ingest_query_builder,
+            partition_sizer=self.partition_sizer,
+            conflict_aware_partitioning=self.conflict_aware_partitioning,
+            coalesce_writes=self.coalesce_writes,
+            write_buffer=self.write_buffer,
+            batch_timeout=self.batch_timeout,
+            dead_letters=(
+                JsonlDeadLetterSink(**self.dead_letters)
+                if self.dead_letters is not None
+                else None
+            ),
+            time_to_live=self.time_to_live,
+            plan_cache_statements=self._plan_cache_statements(),
+            fingerprints=self.fingerprints,
         )
+        if self.bulk_load is not None:
+            # The queries run once the load completed use the same settings.
+            return NeptuneBulkLoadQueryExecutor(
+                bulk_loader=BulkLoader.from_settings(self.connection, self.bulk_load),
+                **settings,
+            )
+        return NeptuneQueryExecutor(**settings)
 
     def make_type_retriever(self) -> TypeRetriever:
         from .type_retriever import NeptuneDBTypeRetriever
 
-        return NeptuneDBTypeRetriever(self)
+        return NeptuneDBTypeRetriever(self, **self.type_retrieval)
 
     def make_migrator(self) -> Migrator:
-        return NeptuneMigrator(self.connection)
+        return NeptuneMigrator(self.connection, **self.migration)
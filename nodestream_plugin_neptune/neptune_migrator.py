@@ -1,3 +1,9 @@
+import asyncio
+import hashlib
+import json
+from collections import deque
+from dataclasses import dataclass, field
+from logging import getLogger
 from typing import List
 
 from nodestream.schema.migrations import (
@@ -29,44 +35,238 @@ from nodestream.schema.migrations.operations import (
     RenameRelationshipType,
 )
 
-from .neptune_connection import NeptuneConnection
+from .neptune_connection import NeptuneConnection, QueryFailedError
 
 LIST_MIGRATIONS_QUERY = "MATCH (m:__NodestreamMigration__) RETURN m.name as name"
 MARK_MIGRATION_AS_EXECUTED_QUERY = "MERGE (:__NodestreamMigration__ {name: $name})"
 
-DROP_ALL_NODES_OF_TYPE_FORMAT = "MATCH (n:`{type}`) DETACH DELETE n"
-DROP_ALL_RELATIONSHIPS_OF_TYPE_FORMAT = "MATCH ()-[r:`{type}`]->() DELETE r"
+LOAD_CHECKPOINT_QUERY = "MATCH (c:__NodestreamMigrationCheckpoint__ {operation: $operation}) RETURN c.last_id as last_id, c.done as done"
+SAVE_CHECKPOINT_QUERY = "MERGE (c:__NodestreamMigrationCheckpoint__ {operation: $operation}) SET c.last_id = $last_id, c.done = $done"
+CLEAR_CHECKPOINTS_QUERY = "MATCH (c:__NodestreamMigrationCheckpoint__) WHERE c.operation STARTS WITH $prefix DELETE c"
 
-SET_NODE_PROPERTY_FORMAT = "MATCH (n:`{node_type}`) SET n.`{property_name}` = coalesce(n.`{property_name}`, $value)"
-SET_RELATIONSHIP_PROPERTY_FORMAT = "MATCH ()-[r:`{relationship_type}`]->() SET r.`{property_name}` = coalesce(r.`{property_name}`, $value)"
+DEFAULT_MIGRATION_CHUNK_SIZE = 1000
+DEFAULT_MIGRATION_CONCURRENCY = 4
 
-RENAME_NODE_PROPERTY_FORMAT = "MATCH (n:`{node_type}`) SET n.`{new_property_name}` = n.`{old_property_name}` REMOVE n.`{old_property_name}`"
-RENAME_RELATIONSHIP_PROPERTY_FORMAT = "MATCH ()-[r:`{relationship_type}`]->() SET r.`{new_property_name}` = r.`{old_property_name}` REMOVE r.`{old_property_name}`"
+# Operations are run over the ids of the objects they touch, a page at a time.
+# Pages are read in id order from where the previous one ended, so the chunks
+# of an operation never share objects and can run concurrently.
+SCAN_NODES_FORMAT = "MATCH (n:`{type}`) WHERE id(n) > $last_id{filter} RETURN id(n) as id ORDER BY id(n) LIMIT $limit"
+SCAN_RELATIONSHIPS_FORMAT = "MATCH ()-[r:`{type}`]->() WHERE id(r) > $last_id{filter} RETURN id(r) as id ORDER BY id(r) LIMIT $limit"
+NODE_CHUNK_FORMAT = (
+    "UNWIND $ids AS chunk_id MATCH (n:`{type}`) WHERE id(n) = chunk_id{filter} {action}"
+)
+RELATIONSHIP_CHUNK_FORMAT = "UNWIND $ids AS chunk_id MATCH (n)-[r:`{type}`]->(m) WHERE id(r) = chunk_id{filter} {action}"
+
+DROP_NODE_ACTION = "DETACH DELETE n"
+DROP_RELATIONSHIP_ACTION = "DELETE r"
+
+SET_NODE_PROPERTY_FILTER = " AND n.`{property_name}` IS NULL"
+SET_NODE_PROPERTY_ACTION = "SET n.`{property_name}` = $value"
+SET_RELATIONSHIP_PROPERTY_FILTER = " AND r.`{property_name}` IS NULL"
+SET_RELATIONSHIP_PROPERTY_ACTION = "SET r.`{property_name}` = $value"
 
-RENAME_NODE_TYPE = "MATCH (n:`{old_type}`) SET n:`{new_type}` REMOVE n:`{old_type}`"
-RENAME_REL_TYPE = "MATCH (n)-[r:`{old_type}`]->(m) CREATE (n)-[r2:`{new_type}`]->(m) SET r2 += r WITH r DELETE r"
+NODE_HAS_PROPERTY_FILTER = " AND n.`{property_name}` IS NOT NULL"
+RELATIONSHIP_HAS_PROPERTY_FILTER = " AND r.`{property_name}` IS NOT NULL"
 
-DROP_REL_PROPERTY_FORMAT = (
-    "MATCH ()-[r:`{relationship_type}`]->() REMOVE r.`{property_name}`"
+RENAME_NODE_PROPERTY_ACTION = "SET n.`{new_property_name}` = n.`{old_property_name}` REMOVE n.`{old_property_name}`"
+RENAME_RELATIONSHIP_PROPERTY_ACTION = "SET r.`{new_property_name}` = r.`{old_property_name}` REMOVE r.`{old_property_name}`"
+
+RENAME_NODE_TYPE_ACTION = "SET n:`{new_type}` REMOVE n:`{old_type}`"
+RENAME_RELATIONSHIP_TYPE_ACTION = (
+    "CREATE (n)-[r2:`{new_type}`]->(m) SET r2 += r WITH r DELETE r"
 )
-DROP_NODE_PROPERTY_FORMAT = "MATCH (n:`{node_type}`) REMOVE n.`{property_name}`"
+
+DROP_NODE_PROPERTY_ACTION = "REMOVE n.`{property_name}`"
+DROP_RELATIONSHIP_PROPERTY_ACTION = "REMOVE r.`{property_name}`"
+
+
+class MigrationChunkError(Exception):
+    """Raised when chunks of a migration operation failed.
+
+    The operation stops at the first failing chunk and can be resumed from
+    its last checkpoint by running the migration again.
+    """
+
+
+@dataclass(slots=True)
+class ChunkedStatement:
+    """An operation over every node or relationship of a type, run in chunks."""
+
+    scan_query: str
+    chunk_query: str
+    parameters: dict = field(default_factory=dict)
+
+    @classmethod
+    def over_nodes(
+        cls, type: str, action: str, filter: str = "", parameters: dict = None
+    ) -> "ChunkedStatement":
+        return cls(
+            SCAN_NODES_FORMAT.format(type=type, filter=filter),
+            NODE_CHUNK_FORMAT.format(type=type, filter=filter, action=action),
+            parameters or {},
+        )
+
+    @classmethod
+    def over_relationships(
+        cls, type: str, action: str, filter: str = "", parameters: dict = None
+    ) -> "ChunkedStatement":
+        return cls(
+            SCAN_RELATIONSHIPS_FORMAT.format(type=type, filter=filter),
+            RELATIONSHIP_CHUNK_FORMAT.format(type=type, filter=filter, action=action),
+            parameters or {},
+        )
+
+
+def operation_fingerprint(operation) -> str:
+    data = json.dumps(operation.to_file_data(), sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:12]
 
 
 class NeptuneMigrator(OperationTypeRoutingMixin, Migrator):
-    def __init__(self, database_connection: NeptuneConnection) -> None:
+    """Runs migrations against a Neptune graph.
+
+    Operations touching every node or relationship of a type are run in
+    chunks of `chunk_size` objects, up to `concurrency` chunks at a time. The
+    id of the last object of the chunks completed so far is checkpointed in
+    the graph, so that a migration interrupted midway resumes where it left
+    off when it is run again.
+    """
+
+    def __init__(
+        self,
+        database_connection: NeptuneConnection,
+        chunk_size: int = DEFAULT_MIGRATION_CHUNK_SIZE,
+        concurrency: int = DEFAULT_MIGRATION_CONCURRENCY,
+    ) -> None:
+        if chunk_size < 1 or concurrency < 1:
+            raise ValueError("`chunk_size` and `concurrency` must be positive.")
         self.database_connection = database_connection
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.migration: Migration | None = None
+        self.logger = getLogger(self.__class__.__name__)
+
+    async def execute_migration(self, migration: Migration) -> None:
+        # Checkpoints are kept per migration, so that the same operation in
+        # two migrations does not share one.
+        self.migration = migration
+        try:
+            await super().execute_migration(migration)
+        finally:
+            self.migration = None
 
     async def mark_migration_as_executed(self, migration: Migration) -> None:
         await self.database_connection.execute(
             MARK_MIGRATION_AS_EXECUTED_QUERY, {"name": migration.name}
         )
+        await self.database_connection.execute(
+            CLEAR_CHECKPOINTS_QUERY, {"prefix": f"{migration.name}/"}
+        )
 
     async def get_completed_migrations(self, graph: MigrationGraph) -> List[Migration]:
         return [
             graph.get_migration(record["name"])
-            for record in await self.database_connection.execute(LIST_MIGRATIONS_QUERY)
+            async for record in self.database_connection.stream(
+                LIST_MIGRATIONS_QUERY, {}
+            )
         ]
 
+    def checkpoint_key(self, operation) -> str:
+        fingerprint = operation_fingerprint(operation)
+        if self.migration is None:
+            return fingerprint
+        return f"{self.migration.name}/{fingerprint}"
+
+    async def load_checkpoint(self, key: str) -> dict | None:
+        async for record in self.database_connection.stream(
+            LOAD_CHECKPOINT_QUERY, {"operation": key}, raise_errors=True
+        ):
+            return record
+        return None
+
+    async def save_checkpoint(self, key: str, last_id: str, done: bool = False):
+        response = await self.database_connection.execute(
+            SAVE_CHECKPOINT_QUERY,
+            {"operation": key, "last_id": last_id, "done": done},
+        )
+        if response is None:
+            raise MigrationChunkError(
+                f"Saving the checkpoint of `{key}` after id {last_id!r} failed, "
+                "it resumes from its previous checkpoint when run again."
+            )
+
+    async def scan(self, statement: ChunkedStatement, last_id: str) -> List[str]:
+        """Returns the ids of the next chunk, raising if the scan failed."""
+        parameters = {**statement.parameters, "last_id": last_id}
+        parameters["limit"] = self.chunk_size
+        return [
+            record["id"]
+            async for record in self.database_connection.stream(
+                statement.scan_query, parameters, raise_errors=True
+            )
+        ]
+
+    async def execute_chunk(self, statement: ChunkedStatement, ids: List[str]) -> bool:
+        response = await self.database_connection.execute(
+            statement.chunk_query, {**statement.parameters, "ids": ids}
+        )
+        return response is not None
+
+    async def execute_chunked(self, operation, statement: ChunkedStatement) -> None:
+        """Runs `statement` a chunk at a time, resuming from the checkpoint of `operation`."""
+        key = self.checkpoint_key(operation)
+        checkpoint = await self.load_checkpoint(key)
+        if checkpoint is not None and checkpoint.get("done"):
+            return
+        last_id = saved_id = (checkpoint or {}).get("last_id") or ""
+        # Chunks in the order they were scanned, with the last id of each.
+        pending = deque()
+        chunks = 0
+        try:
+            while True:
+                try:
+                    ids = await self.scan(statement, last_id)
+                except QueryFailedError as error:
+                    # Not finding the next chunk is not the same as there
+                    # being none, the checkpoint must not be marked done.
+                    raise MigrationChunkError(
+                        f"Scan of `{operation.describe()}` failed, "
+                        f"it resumes after id {saved_id!r} when run again."
+                    ) from error
+                if ids:
+                    last_id = ids[-1]
+                    chunk = asyncio.create_task(self.execute_chunk(statement, ids))
+                    pending.append((chunk, last_id))
+                    chunks += 1
+                # Wait for the oldest chunk once enough are in flight, or for
+                # all of them once everything was scanned.
+                while pending and (len(pending) >= self.concurrency or not ids):
+                    chunk, chunk_last_id = pending.popleft()
+                    if not await chunk:
+                        raise MigrationChunkError(
+                            f"Chunk of `{operation.describe()}` failed, "
+                            f"it resumes after id {chunk_last_id!r} when run again."
+                        )
+                    # Every chunk before this one completed, so the operation
+                    # can resume after it.
+                    await self.save_checkpoint(key, chunk_last_id)
+                    saved_id = chunk_last_id
+                if not ids:
+                    break
+        finally:
+            for chunk, _ in pending:
+                chunk.cancel()
+
+        await self.save_checkpoint(key, last_id, done=True)
+        if self.migration is None:
+            await self.database_connection.execute(
+                CLEAR_CHECKPOINTS_QUERY, {"prefix": key}
+            )
+        self.logger.info(
+            "Ran migration operation in chunks",
+            extra=dict(operation=operation.describe(), chunks=chunks),
+        )
+
     async def execute_create_node_type(self, _: CreateNodeType) -> None:
         # Neptune does not need us to do anything here.
         pass
@@ -76,47 +276,61 @@ class NeptuneMigrator(OperationTypeRoutingMixin, Migrator):
         pass
 
     async def execute_drop_node_type(self, operation: DropNodeType) -> None:
-        query = DROP_ALL_NODES_OF_TYPE_FORMAT.format(type=operation.name)
-        await self.database_connection.execute(query, {})
+        statement = ChunkedStatement.over_nodes(operation.name, DROP_NODE_ACTION)
+        await self.execute_chunked(operation, statement)
 
     async def execute_drop_relationship_type(
         self, operation: DropRelationshipType
     ) -> None:
-        query = DROP_ALL_RELATIONSHIPS_OF_TYPE_FORMAT.format(type=operation.name)
-        await self.database_connection.execute(query, {})
+        statement = ChunkedStatement.over_relationships(
+            operation.name, DROP_RELATIONSHIP_ACTION
+        )
+        await self.execute_chunked(operation, statement)
 
     async def execute_rename_node_property(self, operation: RenameNodeProperty) -> None:
-        query = RENAME_NODE_PROPERTY_FORMAT.format(
-            node_type=operation.node_type,
-            old_property_name=operation.old_property_name,
-            new_property_name=operation.new_property_name,
+        statement = ChunkedStatement.over_nodes(
+            operation.node_type,
+            RENAME_NODE_PROPERTY_ACTION.format(
+                old_property_name=operation.old_property_name,
+                new_property_name=operation.new_property_name,
+            ),
+            NODE_HAS_PROPERTY_FILTER.format(property_name=operation.old_property_name),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_rename_relationship_property(
         self, operation: RenameRelationshipProperty
     ) -> None:
-        query = RENAME_RELATIONSHIP_PROPERTY_FORMAT.format(
-            relationship_type=operation.relationship_type,
-            old_property_name=operation.old_property_name,
-            new_property_name=operation.new_property_name,
+        statement = ChunkedStatement.over_relationships(
+            operation.relationship_type,
+            RENAME_RELATIONSHIP_PROPERTY_ACTION.format(
+                old_property_name=operation.old_property_name,
+                new_property_name=operation.new_property_name,
+            ),
+            RELATIONSHIP_HAS_PROPERTY_FILTER.format(
+                property_name=operation.old_property_name
+            ),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_rename_node_type(self, operation: RenameNodeType) -> None:
-        query = RENAME_NODE_TYPE.format(
-            old_type=operation.old_type, new_type=operation.new_type
+        statement = ChunkedStatement.over_nodes(
+            operation.old_type,
+            RENAME_NODE_TYPE_ACTION.format(
+                old_type=operation.old_type, new_type=operation.new_type
+            ),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_rename_relationship_type(
         self, operation: RenameRelationshipType
     ) -> None:
-        # Rename all rels of the old type to the new type.
-        query = RENAME_REL_TYPE.format(
-            old_type=operation.old_type, new_type=operation.new_type
+        # Relationships cannot be retyped, they are recreated with the new type.
+        statement = ChunkedStatement.over_relationships(
+            operation.old_type,
+            RENAME_RELATIONSHIP_TYPE_ACTION.format(new_type=operation.new_type),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_add_additional_node_property_index(
         self, _: AddAdditionalNodePropertyIndex
@@ -143,34 +357,55 @@ class NeptuneMigrator(OperationTypeRoutingMixin, Migrator):
         pass
 
     async def execute_add_node_property(self, operation: AddNodeProperty) -> None:
-        query = SET_NODE_PROPERTY_FORMAT.format(
-            node_type=operation.node_type, property_name=operation.property_name
+        if operation.default is None:
+            # Setting properties to null leaves them unset.
+            return
+        statement = ChunkedStatement.over_nodes(
+            operation.node_type,
+            SET_NODE_PROPERTY_ACTION.format(property_name=operation.property_name),
+            SET_NODE_PROPERTY_FILTER.format(property_name=operation.property_name),
+            {"value": operation.default},
         )
-        await self.database_connection.execute(query, {"value": operation.default})
+        await self.execute_chunked(operation, statement)
 
     async def execute_add_relationship_property(
         self, operation: AddRelationshipProperty
     ) -> None:
-        query = SET_RELATIONSHIP_PROPERTY_FORMAT.format(
-            relationship_type=operation.relationship_type,
-            property_name=operation.property_name,
+        if operation.default is None:
+            return
+        statement = ChunkedStatement.over_relationships(
+            operation.relationship_type,
+            SET_RELATIONSHIP_PROPERTY_ACTION.format(
+                property_name=operation.property_name
+            ),
+            SET_RELATIONSHIP_PROPERTY_FILTER.format(
+                property_name=operation.property_name
+            ),
+            {"value": operation.default},
         )
-        await self.database_connection.execute(query, {"value": operation.default})
+        await self.execute_chunked(operation, statement)
 
     async def execute_drop_node_property(self, operation: DropNodeProperty) -> None:
-        query = DROP_NODE_PROPERTY_FORMAT.format(
-            node_type=operation.node_type, property_name=operation.property_name
+        statement = ChunkedStatement.over_nodes(
+            operation.node_type,
+            DROP_NODE_PROPERTY_ACTION.format(property_name=operation.property_name),
+            NODE_HAS_PROPERTY_FILTER.format(property_name=operation.property_name),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_drop_relationship_property(
         self, operation: DropRelationshipProperty
     ) -> None:
-        query = DROP_REL_PROPERTY_FORMAT.format(
-            relationship_type=operation.relationship_type,
-            property_name=operation.property_name,
+        statement = ChunkedStatement.over_relationships(
+            operation.relationship_type,
+            DROP_RELATIONSHIP_PROPERTY_ACTION.format(
+                property_name=operation.property_name
+            ),
+            RELATIONSHIP_HAS_PROPERTY_FILTER.format(
+                property_name=operation.property_name
+            ),
         )
-        await self.database_connection.execute(query, {})
+        await self.execute_chunked(operation, statement)
 
     async def execute_node_key_extended(self, operation: NodeKeyExtended) -> None:
         as_add_property = AddNodeProperty(
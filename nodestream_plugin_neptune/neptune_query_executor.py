@@ -1,6 +1,8 @@
 import asyncio
+import time
+from functools import partial
 from logging import getLogger
-from typing import Iterable
+from typing import Iterable, List
 
 from nodestream.databases.query_executor import (
     OperationOnNodeIdentity,
@@ -10,13 +12,40 @@ from nodestream.databases.query_executor import (
 from nodestream.model import (
     IngestionHook,
     Node,
+    NodeCreationRule,
+    RelationshipCreationRule,
     RelationshipWithNodes,
     TimeToLiveConfiguration,
 )
 
-from .ingest_query_builder import NeptuneIngestQueryBuilder
+from .bulk_loader import BulkLoader
+from .change_detection import FingerprintCache
+from .coalescing import coalesce_rows
+from .conflict_partitioner import partition_by_conflicts
+from .dead_letters import DeadLetter, DeadLetterSink
+from .deadline import Deadline, DeadlineExceededError
+from .ingest_query_builder import (
+    GENERIC_FROM_NODE_REF_NAME,
+    GENERIC_NODE_REF_NAME,
+    GENERIC_TO_NODE_REF_NAME,
+    NeptuneIngestQueryBuilder,
+    generate_id_param_name,
+)
+from .metrics import statement_tag
 from .neptune_connection import NeptuneConnection
-from .query import Query, QueryBatch
+from .partition_sizer import AdaptivePartitionSizer, estimate_payload_bytes
+from .precompilation import MalformedStatementError
+from .query import Query, QueryBatch, batch_statement
+from .retry_policy import ErrorCategory, classify_error, is_idempotent
+from .statement_cache import StatementCache
+from .ttl import BatchedTimeToLive, TimeToLiveSettings
+from .write_buffer import WriteBuffer, WriteBufferSettings
+
+NODE_KEY_NAMES = (generate_id_param_name(GENERIC_NODE_REF_NAME),)
+RELATIONSHIP_ENDPOINT_KEY_NAMES = (
+    generate_id_param_name(GENERIC_FROM_NODE_REF_NAME),
+    generate_id_param_name(GENERIC_TO_NODE_REF_NAME),
+)
 
 
 class NeptuneQueryExecutor(QueryExecutor):
@@ -24,82 +53,514 @@ class NeptuneQueryExecutor(QueryExecutor):
         self,
         connection: NeptuneConnection,
         ingest_query_builder: NeptuneIngestQueryBuilder,
+        partition_sizer: AdaptivePartitionSizer = None,
+        conflict_aware_partitioning: bool = True,
+        coalesce_writes: bool = True,
+        write_buffer: WriteBufferSettings = None,
+        batch_timeout: float = None,
+        dead_letters: DeadLetterSink = None,
+        time_to_live: TimeToLiveSettings = None,
+        plan_cache_statements: List[str] = None,
+        fingerprints: FingerprintCache = None,
     ) -> None:
         self.database_connection = connection
         self.ingest_query_builder = ingest_query_builder
+        self.partition_sizer = partition_sizer or AdaptivePartitionSizer()
+        self.conflict_aware_partitioning = conflict_aware_partitioning
+        self.coalesce_writes = coalesce_writes
+        # Seconds all the requests of a batch may take, retries included.
+        self.batch_timeout = batch_timeout
+        # Where the rows of partitions that failed for good are kept, if anywhere.
+        self.dead_letters = dead_letters
+        self.time_to_live = BatchedTimeToLive(
+            connection, ingest_query_builder, time_to_live
+        )
+        # Skips rows that would write the same values again, if set.
+        self.fingerprints = fingerprints
+        # Upsert statements sent once without rows before the first write.
+        self.plan_cache_statements = plan_cache_statements
+        # Without settings, every upsert is written right away.
+        self.write_buffer = (
+            WriteBuffer(self._write_batch, write_buffer)
+            if write_buffer is not None
+            else None
+        )
         self.logger = getLogger(self.__class__.__name__)
 
     async def upsert_nodes_in_bulk_with_same_operation(
         self, operation: OperationOnNodeIdentity, nodes: Iterable[Node]
     ):
-        batched_query = (
-            self.ingest_query_builder.generate_batch_update_node_operation_batch(
-                operation, nodes
+        with self.database_connection.metrics.timer("query_build"):
+            batched_query = (
+                self.ingest_query_builder.generate_batch_update_node_operation_batch(
+                    operation, nodes
+                )
             )
-        )
-        await self.execute_batch(batched_query)
+        await self._write(batched_query, NODE_KEY_NAMES)
 
     async def upsert_relationships_in_bulk_of_same_operation(
         self,
         shape: OperationOnRelationshipIdentity,
         relationships: Iterable[RelationshipWithNodes],
     ):
-        queries = (
-            self.ingest_query_builder.generate_batch_update_relationship_query_batch(
+        with self.database_connection.metrics.timer("query_build"):
+            queries = self.ingest_query_builder.generate_batch_update_relationship_query_batch(
                 shape, relationships
             )
+        await self._write(
+            queries, self._relationship_key_names(shape), is_relationship=True
+        )
+
+    def _relationship_key_names(self, shape: OperationOnRelationshipIdentity):
+        """Returns the params identifying a relationship, or None if rows must not be merged."""
+        # Relationships created with CREATE are meant to be duplicated.
+        if shape is None or (
+            shape.relationship_creation_rule == RelationshipCreationRule.CREATE
+        ):
+            return None
+        return (*RELATIONSHIP_ENDPOINT_KEY_NAMES, *shape.relationship_identity.keys)
+
+    def _coalesce(self, query_batch: QueryBatch, key_names: tuple) -> QueryBatch:
+        """Merges the rows of a batch writing to the same node or relationship."""
+        if not self.coalesce_writes:
+            return query_batch
+        rows = query_batch.parameters
+        coalesced = coalesce_rows(rows, key_names)
+        if coalesced is rows:
+            return query_batch
+        self.database_connection.metrics.increment(
+            "coalesced_rows", len(rows) - len(coalesced)
+        )
+        return QueryBatch(query_batch.query_statement, coalesced)
+
+    async def _write(
+        self,
+        query_batch: QueryBatch,
+        key_names: tuple | None,
+        is_relationship: bool = False,
+    ):
+        if self.plan_cache_statements:
+            statements, self.plan_cache_statements = self.plan_cache_statements, None
+            await self.warm_plan_cache(statements)
+        if self.write_buffer is not None:
+            await self.write_buffer.add(query_batch, key_names, is_relationship)
+        else:
+            await self._write_batch(query_batch, key_names)
+
+    async def _write_batch(self, query_batch: QueryBatch, key_names: tuple | None):
+        if key_names is None:
+            await self.execute_batch(query_batch)
+            return
+
+        query_batch = self._coalesce(query_batch, key_names)
+        if self.fingerprints is None:
+            await self.execute_batch(query_batch)
+            return
+
+        query_stmt = query_batch.query_statement
+        rows = len(query_batch.parameters)
+        query_batch, pending = self.fingerprints.filter(query_batch, key_names)
+        unchanged = rows - len(query_batch.parameters)
+        if unchanged:
+            self.database_connection.metrics.increment(
+                "unchanged_rows", unchanged, {"statement": statement_tag(query_stmt)}
+            )
+        if not query_batch.parameters:
+            return
+        written = []
+        await self.execute_batch(query_batch, written=written)
+        self.fingerprints.record(query_stmt, written, key_names, pending)
+
+    async def flush(self):
+        """Writes the rows held back by the write buffer, if there is one."""
+        if self.write_buffer is not None:
+            await self.write_buffer.flush()
+
+    async def warm_plan_cache(self, statements: List[str]):
+        """Sends each of `statements` once with no rows, so Neptune plans them before the first batch.
+
+        Raises `MalformedStatementError` if Neptune rejects a statement as invalid.
+        """
+        source = object()
+        with self.database_connection.metrics.timer("plan_cache_warm_up"):
+            await asyncio.gather(
+                *(
+                    self.database_connection.scheduler.run(
+                        source, partial(self._warm_statement, statement)
+                    )
+                    for statement in statements
+                )
+            )
+
+    async def _warm_statement(self, statement: str):
+        query = QueryBatch(statement, []).as_query()
+        errors = []
+        response = await self.database_connection.execute(
+            query.query_statement, query.parameters, on_error=errors.append
+        )
+        if response is not None or not errors:
+            return
+        error = errors[-1]
+        if classify_error(error) == ErrorCategory.BAD_REQUEST:
+            raise MalformedStatementError(
+                f"Neptune rejected statement: {statement}"
+            ) from error
+        # Anything else, e.g. throttling, only means the plan is not cached yet.
+        self.logger.warning(
+            "Could not warm the query plan of a statement",
+            extra=dict(query=statement, error=str(error)),
         )
-        await self.execute_batch(queries)
 
     async def perform_ttl_op(self, config: TimeToLiveConfiguration):
+        # Expire objects only once every pending write has landed.
+        await self.flush()
+        if config.custom_query is None:
+            await self.time_to_live.expire(config)
+            return
+        # Custom queries are run as they are, they cannot be split into batches.
         query = self.ingest_query_builder.generate_ttl_query_from_configuration(config)
         await self.execute(query)
 
     async def execute_hook(self, hook: IngestionHook):
+        await self.flush()
         query_string, params = hook.as_cypher_query_and_parameters()
         await self.execute(Query(query_string, params))
 
-    def _split_parameters(self, parameters: list):
+    def _split_parameters(self, query_stmt: str, parameters: list):
         """
-        Our current understanding is that a partition_size of 100 - 200
-        per batch request will yield the best results. Though this is not a hard rule.
+        Splits `parameters` into partitions sized by the partition sizer.
 
-        More investigation on performance is needed.
+        The best partition size depends heavily on the statement: wide nodes with
+        many properties time out long before thin relationship rows do. The sizer
+        keeps a separate size per statement and adjusts it from the latency,
+        payload size and conflicts observed on previous requests.
         """
-        partition_size = 150
+        partition_size = self.partition_sizer.partition_size(query_stmt)
 
         for i in range(0, len(parameters), partition_size):
             yield {"params": parameters[i : i + partition_size]}
 
-    async def execute(self, query: Query, log_result: bool = False):
-        query_stmt = query.query_statement
+    def _split_parameters_into_lanes(self, query_stmt: str, parameters: list):
+        """
+        Splits `parameters` into lanes of partitions.
+
+        Partitions of different lanes can be sent concurrently while the
+        partitions of a single lane are sent one after the other. With conflict
+        aware partitioning, rows touching the same vertex share a lane so that
+        parallel requests do not fight over it.
+        """
+        if not self.conflict_aware_partitioning:
+            for partition in self._split_parameters(query_stmt, parameters):
+                yield [partition]
+            return
+
+        partition_size = self.partition_sizer.partition_size(query_stmt)
+        for lane in partition_by_conflicts(parameters, partition_size):
+            yield [{"params": partition} for partition in lane]
+
+    async def _execute_lane(
+        self,
+        query_stmt: str,
+        lane: list,
+        log_result: bool = False,
+        deadline: Deadline = None,
+        incomplete: list = None,
+        written: list = None,
+    ):
+        results = []
+        for parameters in lane:
+            if deadline is not None and deadline.expired:
+                # Not worth sending, the batch will have been given up by then.
+                rows = parameters["params"]
+                if incomplete is not None:
+                    incomplete.append(rows)
+                self._dead_letter(
+                    query_stmt, rows, DeadlineExceededError("Partition was not sent.")
+                )
+                continue
+            results.append(
+                await self._execute_partition(
+                    query_stmt, parameters, log_result, deadline, incomplete, written
+                )
+            )
+        return results
+
+    async def _execute_partition(
+        self,
+        query_stmt: str,
+        parameters: dict,
+        log_result: bool = False,
+        deadline: Deadline = None,
+        incomplete: list = None,
+        written: list = None,
+    ):
+        rows = parameters["params"]
+        self.database_connection.metrics.histogram("rows_per_request", len(rows))
+        errors = []
+        start = time.perf_counter()
+        response = await self.database_connection.execute(
+            query_stmt,
+            parameters,
+            on_retry=lambda error: self._record_retry(query_stmt, error),
+            on_error=errors.append,
+            keep_payload=log_result,
+            deadline=deadline,
+        )
+        latency = time.perf_counter() - start
 
-        result = await self.database_connection.execute(query_stmt, query.parameters)
+        if response is not None:
+            self.partition_sizer.record_success(
+                query_stmt, len(rows), latency, estimate_payload_bytes(rows)
+            )
+            if written is not None:
+                written.append(rows)
+            if log_result:
+                async for record in self.database_connection.records(response):
+                    self._log_record(record, query_stmt)
+            return response
 
-        if log_result:
-            for record in result.records:
-                self.logger.info(
-                    "Gathered Query Results",
-                    extra=dict(**record, query=query.query_statement),
+        error = errors[-1] if errors else None
+        category = None if error is None else classify_error(error)
+        if category == ErrorCategory.DEADLINE_EXCEEDED:
+            # A deadline that is too tight says nothing about how big
+            # partitions should be.
+            if incomplete is not None:
+                incomplete.append(rows)
+            self._dead_letter(query_stmt, rows, error)
+            return None
+
+        if category == ErrorCategory.CONFLICT:
+            self.partition_sizer.record_conflict(query_stmt)
+        # Only errors the server reported say partitions are too big, not
+        # e.g. a malformed row or a client-side timeout.
+        elif category is not None and (
+            self.database_connection.retry_policy.reports_overload(category)
+        ):
+            self.partition_sizer.record_failure(query_stmt)
+
+        if (
+            error is not None
+            and len(rows) > 1
+            and self.database_connection.retry_policy.should_split(
+                error, is_idempotent(query_stmt)
+            )
+        ):
+            # The request either failed on the server, committing nothing, or
+            # timed out on the client with a statement that is safe to run
+            # again, so the halves can be sent again on their own. Halving until
+            # the failing rows are found means only those rows end up failing
+            # instead of the whole partition.
+            middle = len(rows) // 2
+            self.logger.warning(
+                "Partition failed, retrying it in halves",
+                extra=dict(rows=len(rows), query=query_stmt),
+            )
+            for half in (rows[:middle], rows[middle:]):
+                await self._execute_partition(
+                    query_stmt,
+                    {"params": half},
+                    log_result,
+                    deadline,
+                    incomplete,
+                    written,
                 )
+            return None
+
+        self._dead_letter(query_stmt, rows, error)
+        return None
+
+    def _dead_letter(self, query_stmt: str, rows: list, error: Exception | None):
+        self.database_connection.metrics.increment(
+            "failed_rows", len(rows), {"statement": statement_tag(query_stmt)}
+        )
+        if self.dead_letters is not None:
+            # Dead letters are replayed as batches, which put the UNWIND in
+            # front of their statement again.
+            self.dead_letters.write(
+                DeadLetter.for_failure(batch_statement(query_stmt), rows, error)
+            )
 
-    async def execute_batch(self, query_batch: QueryBatch, log_result: bool = False):
+    def _record_retry(self, query_stmt: str, error: Exception):
+        # Only conflicts say partitions are too big. Throttling, server errors
+        # and timeouts shrink the size once, if the partition fails for good.
+        if classify_error(error) == ErrorCategory.CONFLICT:
+            self.partition_sizer.record_conflict(query_stmt)
+            self.database_connection.metrics.increment(
+                "conflicts", tags={"statement": statement_tag(query_stmt)}
+            )
+
+    def _log_record(self, record: dict, query_stmt: str):
+        self.logger.info(
+            "Gathered Query Results",
+            extra=dict(**record, query=query_stmt),
+        )
+
+    async def _execute_query(self, query: Query, log_result: bool):
+        query_stmt = query.query_statement
+        if not log_result:
+            return await self.database_connection.execute(query_stmt, query.parameters)
+
+        async for record in self.database_connection.stream(
+            query_stmt, query.parameters
+        ):
+            self._log_record(record, query_stmt)
+
+    async def execute(self, query: Query, log_result: bool = False):
+        await self.database_connection.scheduler.run(
+            object(), partial(self._execute_query, query, log_result)
+        )
+
+    async def execute_batch(
+        self, query_batch: QueryBatch, log_result: bool = False, written: list = None
+    ):
+        """Sends the rows of `query_batch` in partitions.
+
+        With a `batch_timeout`, partitions still running or not yet sent when
+        it expires are given up. Their rows are returned, one list per
+        partition, and are logged and counted in the `incomplete_rows` metric.
+        The rows of the partitions that were written are added to `written`,
+        if given.
+        """
         query: Query = query_batch.as_query()
 
         query_stmt = query.query_statement
-        requests = (
-            self.database_connection.execute(query_stmt, parameters)
-            for parameters in self._split_parameters(query.parameters["params"])
+        deadline = Deadline.after(self.batch_timeout)
+        incomplete = []
+
+        # Each call is its own scheduling source so that concurrent batches share
+        # the in-flight slots fairly. Submitting one lane at a time lets the
+        # scheduler hold us back while its queue is full.
+        source = object()
+        requests = []
+        for lane in self._split_parameters_into_lanes(
+            query_stmt, query.parameters["params"]
+        ):
+            request = await self.database_connection.scheduler.submit(
+                source,
+                partial(
+                    self._execute_lane,
+                    query_stmt,
+                    lane,
+                    log_result,
+                    deadline,
+                    incomplete,
+                    written,
+                ),
+            )
+            requests.append(request)
+
+        await asyncio.gather(*requests)
+        if incomplete:
+            self._report_incomplete(query_stmt, incomplete)
+        return incomplete
+
+    def _report_incomplete(self, query_stmt: str, incomplete: list):
+        rows = sum(len(partition) for partition in incomplete)
+        tags = {"statement": statement_tag(query_stmt)}
+        metrics = self.database_connection.metrics
+        metrics.increment("incomplete_partitions", len(incomplete), tags)
+        metrics.increment("incomplete_rows", rows, tags)
+        self.logger.error(
+            "Batch deadline exceeded before all of its partitions completed",
+            extra=dict(
+                partitions=len(incomplete),
+                rows=rows,
+                timeout=self.batch_timeout,
+                query=query_stmt,
+            ),
         )
 
-        result = await asyncio.gather(*requests)
+    def _report_statement_cache(self):
+        cache = getattr(self.ingest_query_builder, "statement_cache", None)
+        if not isinstance(cache, StatementCache):
+            return
+        info = cache.info()
+        metrics = self.database_connection.metrics
+        metrics.gauge("statement_cache_hits", info.hits)
+        metrics.gauge("statement_cache_misses", info.misses)
+        metrics.gauge("statement_cache_evictions", info.evictions)
+        metrics.gauge("statement_cache_size", info.size)
+
+    async def finish(self):
+        if self.write_buffer is not None:
+            await self.write_buffer.close()
+        if self.dead_letters is not None:
+            self.dead_letters.close()
+        self._report_statement_cache()
+        await self.database_connection.close()
+
+
+class NeptuneBulkLoadQueryExecutor(NeptuneQueryExecutor):
+    """Writes upserts to bulk load files that are loaded when the ingestion finishes.
+
+    The rows are the parameters the upserts would have been sent with, so
+    nodes get the same ids and properties as they would with queries. Only
+    eagerly created nodes are loaded, since the loader creates every node it
+    is given. The upserts of nodes that may only update existing nodes, TTL
+    operations and hooks are run with queries once the load completed.
+    """
+
+    def __init__(
+        self,
+        connection: NeptuneConnection,
+        ingest_query_builder: NeptuneIngestQueryBuilder,
+        bulk_loader: BulkLoader,
+        **kwargs,
+    ) -> None:
+        super().__init__(connection, ingest_query_builder, **kwargs)
+        self.bulk_loader = bulk_loader
+        self.deferred_operations = []
 
-        if log_result:
-            for record in result.records:
-                self.logger.info(
-                    "Gathered Query Results",
-                    extra=dict(**record, query=query.query_statement),
+    async def upsert_nodes_in_bulk_with_same_operation(
+        self, operation: OperationOnNodeIdentity, nodes: Iterable[Node]
+    ):
+        if operation.node_creation_rule != NodeCreationRule.EAGER:
+            # Deferred, so that they update the nodes the load creates.
+            self.deferred_operations.append(
+                partial(
+                    super().upsert_nodes_in_bulk_with_same_operation,
+                    operation,
+                    list(nodes),
                 )
+            )
+            return
+        identity = operation.node_identity
+        batch = self.ingest_query_builder.generate_batch_update_node_operation_batch(
+            operation, nodes
+        )
+        await self.bulk_loader.add_nodes(
+            (identity.type, *identity.additional_types), batch.parameters
+        )
+
+    async def upsert_relationships_in_bulk_of_same_operation(
+        self,
+        shape: OperationOnRelationshipIdentity,
+        relationships: Iterable[RelationshipWithNodes],
+    ):
+        batch = (
+            self.ingest_query_builder.generate_batch_update_relationship_query_batch(
+                shape, relationships
+            )
+        )
+        await self.bulk_loader.add_relationships(
+            shape.relationship_identity.type,
+            self._relationship_key_names(shape),
+            batch.parameters,
+        )
+
+    async def perform_ttl_op(self, config: TimeToLiveConfiguration):
+        self.deferred_operations.append(partial(super().perform_ttl_op, config))
+
+    async def execute_hook(self, hook: IngestionHook):
+        query_string, params = hook.as_cypher_query_and_parameters()
+        self.deferred_operations.append(
+            partial(self.execute, Query(query_string, params))
+        )
 
     async def finish(self):
-        await self.database_connection.close()
+        try:
+            await self.bulk_loader.load()
+            for operation in self.deferred_operations:
+                await operation()
+        finally:
+            await super().finish()
@@ -0,0 +1,145 @@
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import blake2b
+from operator import itemgetter
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+from nodestream.model import Node
+
+DEFAULT_NODE_ID_CACHE_SIZE = 100_000
+COMPOSITE_NODE_IDS = "composite"
+HASHED_NODE_IDS = "hashed"
+NODE_ID_MODES = (COMPOSITE_NODE_IDS, HASHED_NODE_IDS)
+# 128 bit digests, i.e. 32 hex characters.
+HASHED_NODE_ID_DIGEST_SIZE = 16
+
+
+def _encode_unknown(value: Any) -> dict:
+    # Values JSON has no representation for are told apart from strings by their type.
+    return {"type": type(value).__qualname__, "repr": repr(value)}
+
+
+def hash_id(*parts: Any) -> str:
+    """Returns a 32 character BLAKE2b digest of `parts`.
+
+    The parts are encoded as JSON, so that different parts never hash the same
+    text: `"a_b"` and `"a", "b"`, or `None`, `""` and `0`, all get different ids.
+    """
+    encoded = json.dumps(parts, default=_encode_unknown, separators=(",", ":"))
+    digest = blake2b(encoded.encode("utf-8"), digest_size=HASHED_NODE_ID_DIGEST_SIZE)
+    return digest.hexdigest()
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@dataclass(slots=True, frozen=True)
+class IdFormat:
+    """How the ids of nodes of one type with one set of keys are generated."""
+
+    template: str
+    # Returns the key values of a node, sorted by key name.
+    values_of: Callable[[Mapping[str, Any]], Tuple]
+
+
+class NodeIdGenerator:
+    """Generates the `~id` of nodes from their type and key values.
+
+    Ids look like `Person_first_name:Jane_last_name:Doe`, the keys being
+    sorted by name and the type prefix being left out unless
+    `include_label_in_id`. The sorted keys and the format of the ids are worked
+    out once per node type and set of keys, and recently generated ids are kept
+    in an LRU cache of `cache_size` entries, since the same nodes come back
+    over and over as the endpoints of relationships.
+
+    With the "hashed" `mode`, ids are a digest of the type, key names and key
+    values of nodes made by `hash_id` instead, which keeps them to 32
+    characters however long the key values are.
+    """
+
+    def __init__(
+        self,
+        include_label_in_id: bool = True,
+        cache_size: int = DEFAULT_NODE_ID_CACHE_SIZE,
+        mode: str = COMPOSITE_NODE_IDS,
+    ) -> None:
+        if mode not in NODE_ID_MODES:
+            raise ValueError(
+                f"`node_id_mode` must be one of {', '.join(NODE_ID_MODES)}"
+            )
+        self.include_label_in_id = include_label_in_id
+        self.mode = mode
+        self.formats: Dict[Tuple[str, frozenset], IdFormat] = {}
+        # Typed, so that e.g. `1` and `True` do not share an entry.
+        self._cached_format_id = lru_cache(maxsize=cache_size, typed=True)(
+            self.format_id
+        )
+
+    def format_for(self, type: str, keys: AbstractSet[str]) -> IdFormat:
+        shape = (type, frozenset(keys))
+        id_format = self.formats.get(shape)
+        if id_format is None:
+            sorted_keys = sorted(keys)
+            if self.mode == HASHED_NODE_IDS:
+                # Hashed along with the key values, see `format_id`.
+                template = json.dumps(
+                    [type if self.include_label_in_id else None, sorted_keys]
+                )
+            else:
+                template = "_".join(f"{_escape(str(key))}:{{}}" for key in sorted_keys)
+                if self.include_label_in_id:
+                    template = f"{_escape(str(type))}_{template}"
+            if not sorted_keys:
+                # Nodes without keys get the bare type prefix, e.g. `Person_`.
+                values_of = lambda key_values: ()  # noqa: E731
+            elif len(sorted_keys) == 1:
+                (key,) = sorted_keys
+                values_of = lambda key_values: (key_values[key],)  # noqa: E731
+            else:
+                values_of = itemgetter(*sorted_keys)
+            id_format = IdFormat(template, values_of)
+            self.formats[shape] = id_format
+        return id_format
+
+    def format_id(self, template: str, *values) -> str:
+        if self.mode == HASHED_NODE_IDS:
+            return hash_id(template, *values)
+        if not all(values):
+            # Falsy key values, e.g. None, are left empty.
+            values = [value or "" for value in values]
+        return template.format(*values)
+
+    def generate_ids(self, nodes: Iterable[Node]) -> List[str]:
+        """Generates the ids of many nodes at once."""
+        ids = []
+        append = ids.append
+        cached_format_id = self._cached_format_id
+        last_type, last_size, id_format = None, None, None
+        for node in nodes:
+            key_values = node.key_values
+            values = None
+            # Nodes of a batch nearly always share their type and keys, in
+            # which case the values are read with the previous format.
+            if node.type == last_type and len(key_values) == last_size:
+                try:
+                    values = id_format.values_of(key_values)
+                except KeyError:
+                    pass
+            if values is None:
+                id_format = self.format_for(node.type, key_values.keys())
+                last_type, last_size = node.type, len(key_values)
+                values = id_format.values_of(key_values)
+            try:
+                append(cached_format_id(id_format.template, *values))
+            except TypeError:
+                # Unhashable key values cannot be cached.
+                append(self.format_id(id_format.template, *values))
+        return ids
+
+    def generate_id(self, node: Node) -> str:
+        return self.generate_ids((node,))[0]
+
+    def cache_info(self):
+        return self._cached_format_id.cache_info()
@@ -0,0 +1,143 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+DEFAULT_INITIAL_PARTITION_SIZE = 150
+DEFAULT_MIN_PARTITION_SIZE = 10
+DEFAULT_MAX_PARTITION_SIZE = 2000
+DEFAULT_TARGET_LATENCY_SECONDS = 1.0
+DEFAULT_MAX_PAYLOAD_BYTES = 1024 * 1024
+DEFAULT_GROWTH_STEP = 50
+DEFAULT_BACKOFF_FACTOR = 0.5
+ROW_SIZE_SMOOTHING = 0.2
+ROW_SIZE_SAMPLE = 3
+
+
+def estimate_payload_bytes(rows: List[Dict[str, Any]]) -> int:
+    """Estimates the serialized size of `rows` by sampling the first few rows.
+
+    Serializing every row just to measure it would double the CPU cost of a
+    request, so only a small sample is encoded and extrapolated.
+    """
+    if not rows:
+        return 0
+    sample = rows[:ROW_SIZE_SAMPLE]
+    sample_bytes = sum(len(json.dumps(row, default=str)) for row in sample)
+    return sample_bytes * len(rows) // len(sample)
+
+
+def estimate_parameter_bytes(parameters: Any) -> int:
+    """Estimates the serialized size of the `parameters` of a query.
+
+    Lists, e.g. the rows of a batch, are estimated with
+    `estimate_payload_bytes`, other values are encoded.
+    """
+    if isinstance(parameters, dict):
+        return sum(
+            len(key) + estimate_parameter_bytes(value)
+            for key, value in parameters.items()
+        )
+    if isinstance(parameters, list):
+        return estimate_payload_bytes(parameters)
+    return len(json.dumps(parameters, default=str))
+
+
+@dataclass(slots=True)
+class PartitionSizeState:
+    size: int
+    bytes_per_row: float = 0.0
+    successes: int = 0
+    conflicts: int = 0
+    failures: int = 0
+
+
+class AdaptivePartitionSizer:
+    """Tracks how many UNWIND rows to send per request for each query statement.
+
+    The size of each statement follows an additive-increase,
+    multiplicative-decrease scheme: every fast request grows the size by
+    `growth_step` rows, while slow requests, timeouts and conflicts shrink it.
+    The size is also capped so that a single request stays under
+    `max_payload_bytes` based on the observed bytes per row.
+    """
+
+    def __init__(
+        self,
+        initial_size: int = DEFAULT_INITIAL_PARTITION_SIZE,
+        min_size: int = DEFAULT_MIN_PARTITION_SIZE,
+        max_size: int = DEFAULT_MAX_PARTITION_SIZE,
+        target_latency: float = DEFAULT_TARGET_LATENCY_SECONDS,
+        max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+        growth_step: int = DEFAULT_GROWTH_STEP,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        adaptive: bool = True,
+    ) -> None:
+        if not 0 < min_size <= initial_size <= max_size:
+            raise ValueError(
+                "Partition sizes must satisfy 0 < min_size <= initial_size <= max_size."
+            )
+        if not 0 < backoff_factor < 1:
+            raise ValueError("`backoff_factor` must be between 0 and 1.")
+
+        self.initial_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self.growth_step = growth_step
+        self.backoff_factor = backoff_factor
+        self.adaptive = adaptive
+        self.states: Dict[str, PartitionSizeState] = {}
+
+    def state_for(self, query_stmt: str) -> PartitionSizeState:
+        state = self.states.get(query_stmt)
+        if state is None:
+            state = self.states[query_stmt] = PartitionSizeState(self.initial_size)
+        return state
+
+    def partition_size(self, query_stmt: str) -> int:
+        return self.state_for(query_stmt).size
+
+    def record_success(
+        self, query_stmt: str, rows: int, latency: float, payload_bytes: int
+    ):
+        state = self.state_for(query_stmt)
+        state.successes += 1
+        if not self.adaptive or rows == 0:
+            return
+
+        row_bytes = payload_bytes / rows
+        if state.bytes_per_row:
+            state.bytes_per_row += ROW_SIZE_SMOOTHING * (
+                row_bytes - state.bytes_per_row
+            )
+        else:
+            state.bytes_per_row = row_bytes
+
+        # Only grow when the request was actually full sized. A small tail
+        # partition says nothing about how the statement behaves at the
+        # current size.
+        if latency > self.target_latency:
+            scale = max(self.backoff_factor, self.target_latency / latency)
+            self._resize(state, int(state.size * scale))
+        elif rows >= state.size:
+            self._resize(state, state.size + self.growth_step)
+        else:
+            self._resize(state, state.size)
+
+    def record_conflict(self, query_stmt: str):
+        state = self.state_for(query_stmt)
+        state.conflicts += 1
+        if self.adaptive:
+            self._resize(state, int(state.size * self.backoff_factor))
+
+    def record_failure(self, query_stmt: str):
+        state = self.state_for(query_stmt)
+        state.failures += 1
+        if self.adaptive:
+            self._resize(state, int(state.size * self.backoff_factor))
+
+    def _resize(self, state: PartitionSizeState, size: int):
+        if state.bytes_per_row:
+            size = min(size, int(self.max_payload_bytes / state.bytes_per_row))
+        state.size = max(self.min_size, min(self.max_size, size))
@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+from nodestream.model import TimeToLiveConfiguration
+from nodestream.schema import Schema
+from nodestream.schema.state import GraphObjectType
+
+from .ingest_query_builder import NeptuneIngestQueryBuilder
+from .ttl import BatchedTimeToLive
+
+CLOSING_DELIMITERS = {")": "(", "]": "[", "}": "{"}
+QUOTES = ("'", '"', "`")
+
+
+class MalformedStatementError(ValueError):
+    """Raised when a statement rendered ahead of ingestion is not well formed."""
+
+
+@dataclass(slots=True)
+class PrecompileSettings:
+    # Path to a schema YAML file, in the format of nodestream's type overrides files.
+    schema: str
+    # Whether to send every upsert statement once, without rows, before the first write.
+    warm_plan_cache: bool = False
+
+
+@dataclass(slots=True)
+class PrecompiledStatements:
+    upserts: List[str] = field(default_factory=list)
+    ttls: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.upserts) + len(self.ttls)
+
+
+def check_statement(statement: str):
+    """Raises `MalformedStatementError` unless the quotes and brackets of `statement` are balanced."""
+    delimiters = []
+    quote = None
+    escaped = False
+    for index, character in enumerate(statement):
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif character == "\\" and quote != "`":
+                escaped = True
+            elif character == quote:
+                # A doubled backtick closes and reopens the name, which balances out.
+                quote = None
+            continue
+        if character in QUOTES:
+            quote = character
+        elif character in "([{":
+            delimiters.append(character)
+        elif character in CLOSING_DELIMITERS:
+            if not delimiters or delimiters.pop() != CLOSING_DELIMITERS[character]:
+                raise MalformedStatementError(
+                    f"Unbalanced '{character}' at {index} in statement: {statement}"
+                )
+    if quote is not None:
+        raise MalformedStatementError(f"Unterminated quote in statement: {statement}")
+    if delimiters:
+        raise MalformedStatementError(
+            f"Unclosed '{delimiters[-1]}' in statement: {statement}"
+        )
+
+
+def precompile_statements(
+    schema: Schema,
+    ingest_query_builder: NeptuneIngestQueryBuilder,
+    time_to_live: BatchedTimeToLive,
+) -> PrecompiledStatements:
+    """Renders and checks the upsert and TTL statements of every type in `schema`.
+
+    Upsert statements are kept in the statement cache of the builder, so the
+    first batch of each shape does not have to render its statement.
+    """
+    precompiled = PrecompiledStatements(
+        upserts=ingest_query_builder.schema_statements(schema)
+    )
+    for graph_object_type, types in (
+        (GraphObjectType.NODE, schema.nodes),
+        (GraphObjectType.RELATIONSHIP, schema.relationships),
+    ):
+        for object_type in types:
+            config = TimeToLiveConfiguration(graph_object_type, object_type.name)
+            precompiled.ttls.extend(time_to_live.statements(config))
+
+    for statement in (*precompiled.upserts, *precompiled.ttls):
+        check_statement(statement)
+    return precompiled
+
+
+def read_schema(path: str) -> Schema:
+    return Schema.read_from_file(Path(path))
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, Sequence
 
 UNWIND_COMMIT_QUERY = """
 UNWIND $params as param
@@ -19,7 +19,8 @@ class Query:
 @dataclass(slots=True, frozen=True)
 class QueryBatch:
     query_statement: str
-    parameters: List[Dict[str, Any]]
+    # Usually a `ColumnarBatch`, which only builds row dicts when serialized.
+    parameters: Sequence[Dict[str, Any]]
 
     def as_query(self) -> Query:
         return Query(
@@ -28,3 +29,8 @@ class QueryBatch:
                 "params": self.parameters,
             },
         )
+
+
+def batch_statement(query_stmt: str) -> str:
+    """Returns the statement of the `QueryBatch` whose `as_query()` has `query_stmt`."""
+    return query_stmt.removeprefix(UNWIND_COMMIT_QUERY)
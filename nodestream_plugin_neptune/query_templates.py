@@ -0,0 +1,51 @@
+import re
+from typing import Iterable, Mapping
+
+PLAIN_NAME_REGEX = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def escape_name(name: str) -> str:
+    """Returns `name` as an openCypher name, quoted with backticks unless it is a plain identifier."""
+    if PLAIN_NAME_REGEX.fullmatch(name):
+        return name
+    return "`" + name.replace("`", "``") + "`"
+
+
+def render_labels(labels: Iterable[str]) -> str:
+    """Renders labels as they follow a variable, e.g. `:A:B`."""
+    return "".join(f":{escape_name(label)}" for label in labels)
+
+
+def render_properties(properties: Mapping[str, str]) -> str:
+    """Renders a map of property names to the expressions they are set to, e.g. `{k : param.k}`."""
+    entries = ", ".join(
+        f"{escape_name(name)} : {expression}" for name, expression in properties.items()
+    )
+    return f"{{{entries}}}"
+
+
+def render_node(
+    ref_name: str, label: str = None, properties: Mapping[str, str] = None
+) -> str:
+    """Renders a node pattern, e.g. `(node: Person {`~id` : param.__node_id})`."""
+    pattern = ref_name
+    if label is not None:
+        pattern += f": {escape_name(label)}"
+    if properties:
+        pattern += f" {render_properties(properties)}"
+    return f"({pattern})"
+
+
+def render_relationship(
+    ref_name: str, type: str, properties: Mapping[str, str] = None
+) -> str:
+    """Renders a relationship pattern, e.g. `[rel: KNOWS {since : param.since}]`."""
+    pattern = f"{ref_name}: {escape_name(type)}"
+    if properties:
+        pattern += f" {render_properties(properties)}"
+    return f"[{pattern}]"
+
+
+def render_parameter(name: str, map_name: str = "param") -> str:
+    """Renders a reference to a key of a parameter map, e.g. `param.name`."""
+    return f"{map_name}.{escape_name(name)}"
@@ -0,0 +1,102 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 10
+DEFAULT_MAX_QUEUED_REQUESTS = 100
+
+
+class RequestScheduler:
+    """Limits the number of requests in flight against a Neptune graph.
+
+    Requests are queued per `source` (typically one source per `upsert_*` call)
+    and in-flight slots are handed out round-robin across sources, so one large
+    batch cannot starve the others. When more than `max_queued` requests are
+    waiting for a slot, `submit` blocks until the queue drains, which slows the
+    caller down instead of letting it pile up an unbounded number of requests.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+        max_queued: int = DEFAULT_MAX_QUEUED_REQUESTS,
+    ) -> None:
+        if max_in_flight < 1 or max_queued < 1:
+            raise ValueError("`max_in_flight` and `max_queued` must be positive.")
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self.queued = 0
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._space_waiters: deque = deque()
+
+    async def submit(
+        self, source: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        """Queues `func` to run once a slot is free and returns its future.
+
+        Waits while the queue is full. The returned future resolves to the
+        result of `func()`.
+        """
+        loop = asyncio.get_running_loop()
+        while self.queued >= self.max_queued:
+            waiter = loop.create_future()
+            self._space_waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._space_waiters:
+                    self._space_waiters.remove(waiter)
+
+        ticket = loop.create_future()
+        self._queues.setdefault(source, deque()).append(ticket)
+        self.queued += 1
+        self._dispatch()
+
+        request = asyncio.ensure_future(self._run(ticket, func))
+        request.add_done_callback(lambda _: self._finish(ticket))
+        return request
+
+    async def run(self, source: Hashable, func: Callable[[], Awaitable[Any]]):
+        """Runs `func` under the in-flight limit and returns its result."""
+        return await (await self.submit(source, func))
+
+    async def _run(self, ticket: asyncio.Future, func: Callable[[], Awaitable[Any]]):
+        await ticket
+        return await func()
+
+    def _finish(self, ticket: asyncio.Future):
+        # The request may be cancelled before it ever waited on its ticket, so
+        # slot bookkeeping happens here rather than inside `_run`.
+        if not ticket.done():
+            ticket.cancel()
+        elif not ticket.cancelled():
+            self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self._queues:
+            source, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(source)
+            else:
+                del self._queues[source]
+
+            self.queued -= 1
+            self._wake_space_waiter()
+            if ticket.cancelled():
+                continue
+
+            self.in_flight += 1
+            ticket.set_result(None)
+
+    def _wake_space_waiter(self):
+        while self._space_waiters:
+            waiter = self._space_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
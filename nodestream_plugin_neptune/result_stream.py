@@ -0,0 +1,87 @@
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Dict
+
+RESULTS_KEY = "results"
+JSON_WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class ResultStreamError(ValueError):
+    """Raised when a query response payload is not a well formed result document."""
+
+
+async def iter_json_array_items(
+    chunks: AsyncIterator[bytes], key: str = RESULTS_KEY
+) -> AsyncIterator[Any]:
+    """Yields the items of the `key` array of a JSON document one at a time.
+
+    The document is read from `chunks` incrementally and every item is
+    decoded as soon as it is complete, so only the item being decoded is kept
+    in memory rather than the whole response body.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    array_start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+    buffer = ""
+    in_array = False
+    exhausted = False
+    chunk_iterator = chunks.__aiter__()
+
+    async def read_more() -> bool:
+        nonlocal buffer, exhausted
+        try:
+            chunk = await chunk_iterator.__anext__()
+        except StopAsyncIteration:
+            buffer += text_decoder.decode(b"", final=True)
+            exhausted = True
+            return False
+        buffer += text_decoder.decode(chunk)
+        return True
+
+    while not in_array:
+        match = array_start.search(buffer)
+        if match is not None:
+            buffer = buffer[match.end() :]
+            in_array = True
+        elif not await read_more():
+            raise ResultStreamError(f"Response payload has no `{key}` array.")
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_WHITESPACE + ",":
+            position += 1
+        if position == len(buffer):
+            buffer, position = "", 0
+            if not await read_more():
+                raise ResultStreamError("Response payload ended unexpectedly.")
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            item, end = None, None
+
+        # A value running up to the end of the buffer might still be cut short,
+        # e.g. a number split across two chunks, so only accept it once we can
+        # see what follows it.
+        if end is None or (end == len(buffer) and not exhausted):
+            buffer, position = buffer[position:], 0
+            if not await read_more() and end is None:
+                raise ResultStreamError("Response payload ended unexpectedly.")
+            continue
+
+        yield item
+        position = end
+
+
+async def iter_records_from_payload(payload) -> AsyncIterator[Dict[str, Any]]:
+    """Streams the records of a query response payload and closes it afterwards."""
+    try:
+        async for record in iter_json_array_items(payload.iter_chunks()):
+            yield record
+    finally:
+        payload.close()
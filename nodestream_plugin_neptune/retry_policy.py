@@ -0,0 +1,232 @@
+import random
+import re
+import time
+from enum import Enum
+from typing import Dict, Iterable, Tuple, Type
+
+import botocore
+
+from .deadline import DeadlineExceededError, RequestTimeoutError
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 20.0
+DEFAULT_BUDGET_RATIO = 0.1
+DEFAULT_BUDGET_MIN_RETRIES_PER_SECOND = 10.0
+DEFAULT_BUDGET_MAX_BALANCE = 100.0
+
+
+class ErrorCategory(str, Enum):
+    CONFLICT = "conflict"
+    THROTTLING = "throttling"
+    TIMEOUT = "timeout"
+    LIMIT_EXCEEDED = "limit_exceeded"
+    SERVER_ERROR = "server_error"
+    READ_TIMEOUT = "read_timeout"
+    REQUEST_TIMEOUT = "request_timeout"
+    DEADLINE_EXCEEDED = "deadline_exceeded"
+    CONNECTION = "connection"
+    BAD_REQUEST = "bad_request"
+    AUTH = "auth"
+    UNKNOWN = "unknown"
+
+
+DEFAULT_RETRY_ON = (
+    ErrorCategory.CONFLICT,
+    ErrorCategory.THROTTLING,
+    ErrorCategory.SERVER_ERROR,
+    ErrorCategory.REQUEST_TIMEOUT,
+)
+# Only errors a smaller partition can avoid are worth splitting on. Other
+# errors, e.g. a malformed statement, fail every half just the same.
+DEFAULT_SPLIT_ON = (
+    ErrorCategory.TIMEOUT,
+    ErrorCategory.LIMIT_EXCEEDED,
+    ErrorCategory.READ_TIMEOUT,
+)
+
+# Errors raised on the client side, after which the request may still have
+# committed on the server.
+UNCERTAIN_OUTCOME = frozenset(
+    (ErrorCategory.READ_TIMEOUT, ErrorCategory.REQUEST_TIMEOUT)
+)
+# Errors raised on the client side, which say nothing about how much work
+# the server was given.
+CLIENT_SIDE = UNCERTAIN_OUTCOME | frozenset(
+    (ErrorCategory.DEADLINE_EXCEEDED, ErrorCategory.CONNECTION)
+)
+# `CREATE` clauses, leaving out the `ON CREATE SET` of `MERGE`.
+CREATE_CLAUSE_REGEX = re.compile(r"(?<!ON )\bCREATE\b", re.IGNORECASE)
+
+ERROR_CODE_CATEGORIES = {
+    "ConcurrentModificationException": ErrorCategory.CONFLICT,
+    "ConflictException": ErrorCategory.CONFLICT,
+    "ThrottlingException": ErrorCategory.THROTTLING,
+    "TooManyRequestsException": ErrorCategory.THROTTLING,
+    "TimeLimitExceededException": ErrorCategory.TIMEOUT,
+    "ClientTimeoutException": ErrorCategory.TIMEOUT,
+    "MemoryLimitExceededException": ErrorCategory.LIMIT_EXCEEDED,
+    "QueryLimitExceededException": ErrorCategory.LIMIT_EXCEEDED,
+    "QueryTooLargeException": ErrorCategory.LIMIT_EXCEEDED,
+    "AccessDeniedException": ErrorCategory.AUTH,
+}
+
+
+def classify_error(
+    error: Exception, conflict_exceptions: Tuple[Type[Exception], ...] = ()
+) -> ErrorCategory:
+    """Sorts an exception raised while running a query into an `ErrorCategory`."""
+    if conflict_exceptions and isinstance(error, conflict_exceptions):
+        return ErrorCategory.CONFLICT
+    if isinstance(error, DeadlineExceededError):
+        return ErrorCategory.DEADLINE_EXCEEDED
+    if isinstance(error, RequestTimeoutError):
+        return ErrorCategory.REQUEST_TIMEOUT
+    if isinstance(error, botocore.exceptions.ReadTimeoutError):
+        return ErrorCategory.READ_TIMEOUT
+    if isinstance(
+        error,
+        (
+            botocore.exceptions.EndpointConnectionError,
+            botocore.exceptions.ConnectionError,
+        ),
+    ):
+        return ErrorCategory.CONNECTION
+    if isinstance(error, botocore.exceptions.NoCredentialsError):
+        return ErrorCategory.AUTH
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        if code in ERROR_CODE_CATEGORIES:
+            return ERROR_CODE_CATEGORIES[code]
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if status == 429:
+            return ErrorCategory.THROTTLING
+        if status >= 500:
+            return ErrorCategory.SERVER_ERROR
+        if status >= 400:
+            return ErrorCategory.BAD_REQUEST
+    return ErrorCategory.UNKNOWN
+
+
+def is_idempotent(query_stmt: str) -> bool:
+    """Returns whether running `query_stmt` twice has the same effect as running it once.
+
+    Statements that `CREATE` objects create them again every time they run,
+    while `MATCH`, `MERGE`, `SET` and `DELETE` find what the first run did.
+    """
+    return CREATE_CLAUSE_REGEX.search(query_stmt) is None
+
+
+class RetryBudget:
+    """A token bucket limiting retries to a fraction of all requests.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, on top
+    of a floor of `min_retries_per_second`. Once the bucket is empty, failed
+    requests are not retried, so retries cannot multiply the load on a cluster
+    that is already degraded.
+    """
+
+    def __init__(
+        self,
+        ratio: float = DEFAULT_BUDGET_RATIO,
+        min_retries_per_second: float = DEFAULT_BUDGET_MIN_RETRIES_PER_SECOND,
+        max_balance: float = DEFAULT_BUDGET_MAX_BALANCE,
+    ) -> None:
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_balance = max_balance
+        self.balance = min(max_balance, min_retries_per_second)
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.last_refill = now - self.last_refill, now
+        self._deposit(elapsed * self.min_retries_per_second)
+
+    def _deposit(self, tokens: float):
+        self.balance = min(self.max_balance, self.balance + tokens)
+
+    def record_request(self):
+        self._deposit(self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+_RETRY_BUDGETS: Dict[Tuple[float, float], RetryBudget] = {}
+
+
+def get_retry_budget(
+    ratio: float = DEFAULT_BUDGET_RATIO,
+    min_retries_per_second: float = DEFAULT_BUDGET_MIN_RETRIES_PER_SECOND,
+) -> RetryBudget:
+    """Returns the process-wide retry budget with the given settings."""
+    key = (ratio, min_retries_per_second)
+    if key not in _RETRY_BUDGETS:
+        _RETRY_BUDGETS[key] = RetryBudget(ratio, min_retries_per_second)
+    return _RETRY_BUDGETS[key]
+
+
+class RetryPolicy:
+    """Decides which failed queries are retried, and how long to wait in between.
+
+    Errors are sorted into categories by `classify_error`. Errors in `retry_on`
+    are retried up to `max_attempts` times, as long as the process-wide retry
+    budget allows it, waiting with decorrelated jitter between attempts. When a
+    partition of a batch fails with an error in `split_on`, the executor splits
+    it and resends the halves so that only the failing rows end up failing.
+    Requests that timed out on the client side may have committed, so they
+    are only retried or split when their statement is idempotent.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        retry_on: Iterable[str] = DEFAULT_RETRY_ON,
+        split_on: Iterable[str] = DEFAULT_SPLIT_ON,
+        budget_ratio: float = DEFAULT_BUDGET_RATIO,
+        budget_min_retries_per_second: float = DEFAULT_BUDGET_MIN_RETRIES_PER_SECOND,
+    ) -> None:
+        if max_attempts < 1:
+            raise ValueError("`max_attempts` must be at least 1.")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = frozenset(ErrorCategory(category) for category in retry_on)
+        self.split_on = frozenset(ErrorCategory(category) for category in split_on)
+        self.budget = get_retry_budget(budget_ratio, budget_min_retries_per_second)
+
+    def should_retry(
+        self, category: ErrorCategory, attempt: int, idempotent: bool = True
+    ) -> bool:
+        return (
+            category in self.retry_on
+            and (idempotent or category not in UNCERTAIN_OUTCOME)
+            and attempt < self.max_attempts
+            and self.budget.try_withdraw()
+        )
+
+    def should_split(self, error: Exception, idempotent: bool = True) -> bool:
+        category = classify_error(error)
+        return category in self.split_on and (
+            idempotent or category not in UNCERTAIN_OUTCOME
+        )
+
+    def reports_overload(self, category: ErrorCategory) -> bool:
+        """Whether the server failed a request with an error that is retried
+        or split on, i.e. one that smaller partitions may avoid."""
+        return (
+            category in self.retry_on or category in self.split_on
+        ) and category not in CLIENT_SIDE
+
+    def next_delay(self, previous_delay: float | None) -> float:
+        # Decorrelated jitter, see
+        # https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        previous_delay = previous_delay or self.base_delay
+        return min(self.max_delay, random.uniform(self.base_delay, previous_delay * 3))
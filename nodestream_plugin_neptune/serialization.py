@@ -0,0 +1,124 @@
+import json
+import math
+import numbers
+from datetime import datetime
+from typing import Any
+
+import numpy
+
+from .columnar import NON_FINITE_FLOAT_MESSAGE, ColumnarBatch
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup.
+    orjson = None
+
+
+def convert_value(value: Any) -> Any:
+    """Converts a value JSON has no representation for.
+
+    Timestamps and datetimes become POSIX timestamps, numpy style scalars
+    become plain numbers and columnar batches are turned into their rows.
+    """
+    if isinstance(value, ColumnarBatch):
+        return value.to_rows()
+    # Timestamp and datetime are not valid json. Convert to POSIX timestamp instead.
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+        return value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def check_finite(parameters: Any):
+    """Raises a ValueError if `parameters` hold NaN or Infinity floats.
+
+    Columnar batches are not looked into, their columns were checked by
+    `convert_column` as the batch was built.
+    """
+    stack = [parameters]
+    pop, extend = stack.pop, stack.extend
+    while stack:
+        value = pop()
+        kind = type(value)
+        if kind is dict:
+            extend(value.values())
+        elif kind is list or kind is tuple:
+            extend(value)
+        elif kind is str or kind is int or kind is bool or value is None:
+            continue
+        elif isinstance(value, (float, numpy.floating)):
+            if not math.isfinite(value):
+                raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+        elif isinstance(value, numpy.ndarray):
+            if value.dtype.kind in "fc" and not numpy.isfinite(value).all():
+                raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+
+
+_encoder = json.JSONEncoder(
+    default=convert_value, allow_nan=False, separators=(",", ":")
+)
+
+
+def dumps_with_json(parameters: Any) -> str:
+    """Encodes query parameters with the standard library's C accelerated encoder."""
+    try:
+        return _encoder.encode(parameters)
+    except ValueError as error:
+        if str(error).startswith("Out of range float values"):
+            raise ValueError(NON_FINITE_FLOAT_MESSAGE) from error
+        raise
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_SERIALIZE_NUMPY
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+    def dumps_with_orjson(parameters: Any) -> str:
+        """Encodes query parameters with orjson, falling back to `dumps_with_json`.
+
+        orjson silently encodes NaN and Infinity as `null`, so parameters whose
+        output holds a `null` are looked through with `check_finite`, which is
+        much cheaper than encoding them again. Values orjson cannot encode,
+        like integers wider than 64 bits, fall back to the standard library.
+        """
+        try:
+            encoded = orjson.dumps(
+                parameters, default=convert_value, option=_ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return dumps_with_json(parameters)
+        if b"null" in encoded:
+            check_finite(parameters)
+        return encoded.decode("utf-8")
+
+    serialize_parameters = dumps_with_orjson
+else:  # pragma: no cover
+    serialize_parameters = dumps_with_json
+
+
+def convert_parameters(parameters: Any) -> Any:
+    """Returns a copy of `parameters` holding only values JSON can represent.
+
+    Used where the parameters are handed to botocore as a document rather
+    than a string, so that botocore's own encoder can take them.
+    """
+    if isinstance(parameters, (str, bool, int)) or parameters is None:
+        return parameters
+    if isinstance(parameters, float):
+        if not math.isfinite(parameters):
+            raise ValueError(NON_FINITE_FLOAT_MESSAGE)
+        return parameters
+    if isinstance(parameters, dict):
+        return {key: convert_parameters(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple, ColumnarBatch)):
+        return [convert_parameters(value) for value in parameters]
+    return convert_value(parameters)
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+DEFAULT_STATEMENT_CACHE_SIZE = 10_000
+
+
+@dataclass(slots=True, frozen=True)
+class StatementCacheInfo:
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    max_size: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class StatementCache:
+    """Keeps up to `max_size` rendered query statements, evicting the least recently used.
+
+    Keys are hashable descriptions of what a statement was rendered from, e.g.
+    the settings of the builder and the shape of the operation, so builders
+    with the same settings can share a cache.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_STATEMENT_CACHE_SIZE) -> None:
+        if max_size < 1:
+            raise ValueError("`statement_cache_size` must be at least 1")
+        self.max_size = max_size
+        self.statements: OrderedDict[Hashable, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        statement = self.statements.get(key)
+        if statement is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.statements.move_to_end(key)
+        return statement
+
+    def put(self, key: Hashable, statement: str):
+        self.statements[key] = statement
+        self.statements.move_to_end(key)
+        if len(self.statements) > self.max_size:
+            self.statements.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.statements
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def clear(self):
+        self.statements.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> StatementCacheInfo:
+        return StatementCacheInfo(
+            self.hits, self.misses, self.evictions, len(self), self.max_size
+        )
+
+
+# Used by every builder not given a cache of its own.
+SHARED_STATEMENT_CACHE = StatementCache()
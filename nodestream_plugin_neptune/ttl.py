@@ -0,0 +1,194 @@
+import asyncio
+from dataclasses import dataclass
+from functools import partial
+from logging import getLogger
+from typing import List, Optional
+
+from nodestream.model import TimeToLiveConfiguration
+
+from .ingest_query_builder import NeptuneIngestQueryBuilder
+from .neptune_connection import NeptuneConnection, QueryFailedError
+from .query import Query
+
+DEFAULT_TTL_BATCH_SIZE = 10000
+
+
+@dataclass(slots=True)
+class TimeToLiveSettings:
+    batch_size: int = DEFAULT_TTL_BATCH_SIZE
+    # Seconds waited between batches, leaving room for concurrent ingestion.
+    pause: float = 0.0
+    concurrency: int = 1
+
+    def __post_init__(self):
+        if self.batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if self.concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if self.pause < 0:
+            raise ValueError("pause must not be negative")
+
+
+class BatchedTimeToLive:
+    """Deletes the expired objects of a type in batches of at most `batch_size` objects.
+
+    A single statement deleting millions of objects times out and holds locks
+    that block ingestion for as long as it runs. Each batch is instead its own
+    request, followed by a `pause`. With a `concurrency` above one, the ids of
+    expired objects are read page by page and up to `concurrency` pages, which
+    never overlap, are deleted at the same time.
+    """
+
+    def __init__(
+        self,
+        connection: NeptuneConnection,
+        ingest_query_builder: NeptuneIngestQueryBuilder,
+        settings: TimeToLiveSettings = None,
+    ) -> None:
+        self.connection = connection
+        self.ingest_query_builder = ingest_query_builder
+        self.settings = settings or TimeToLiveSettings()
+        self.logger = getLogger(self.__class__.__name__)
+
+    def statements(self, config: TimeToLiveConfiguration) -> List[str]:
+        """Returns the statements `expire` runs for `config`."""
+        builder = self.ingest_query_builder
+        batch_size = self.settings.batch_size
+        if self.settings.concurrency > 1:
+            queries = (
+                builder.generate_ttl_id_scan_query_from_configuration(
+                    config, batch_size
+                ),
+                builder.generate_ttl_delete_by_ids_query_from_configuration(config),
+            )
+        else:
+            queries = (
+                builder.generate_ttl_batch_query_from_configuration(config, batch_size),
+            )
+        return [query.query_statement for query in queries]
+
+    async def expire(self, config: TimeToLiveConfiguration) -> int:
+        """Deletes the expired objects of `config`, returning how many were deleted."""
+        if self.settings.concurrency > 1:
+            deleted = await self._expire_by_id_pages(config)
+        else:
+            deleted = await self._expire_in_batches(config)
+        self.logger.info(
+            "Deleted expired objects",
+            extra=dict(object_type=config.object_type, deleted=deleted),
+        )
+        return deleted
+
+    async def _expire_in_batches(self, config: TimeToLiveConfiguration) -> int:
+        batch_size = self.settings.batch_size
+        query = self.ingest_query_builder.generate_ttl_batch_query_from_configuration(
+            config, batch_size
+        )
+        total = 0
+        batch = 0
+        while True:
+            deleted = await self._delete(query)
+            if deleted is None:
+                self._report_failure(config, total)
+                break
+            batch += 1
+            total += deleted
+            self._report_batch(config, batch, deleted)
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(self.settings.pause)
+        return total
+
+    async def _expire_by_id_pages(self, config: TimeToLiveConfiguration) -> int:
+        batch_size = self.settings.batch_size
+        builder = self.ingest_query_builder
+        scan = builder.generate_ttl_id_scan_query_from_configuration(config, batch_size)
+        delete = builder.generate_ttl_delete_by_ids_query_from_configuration(config)
+        # Every query of the operation expires objects against the same time.
+        delete.parameters.update(
+            earliest_allowed_time=scan.parameters["earliest_allowed_time"]
+        )
+        last_id = ""
+        total = 0
+        batch = 0
+        while True:
+            pages = []
+            scan_failed = False
+            while len(pages) < self.settings.concurrency:
+                try:
+                    ids = await self._scan(scan, last_id)
+                except QueryFailedError:
+                    # The pages scanned so far are still deleted, but the
+                    # rest of the expired objects were not found.
+                    scan_failed = True
+                    break
+                if ids:
+                    pages.append(ids)
+                    last_id = ids[-1]
+                if len(ids) < batch_size:
+                    break
+            if not pages and not scan_failed:
+                break
+
+            results = await asyncio.gather(
+                *(
+                    self._delete(
+                        Query(delete.query_statement, {**delete.parameters, "ids": ids})
+                    )
+                    for ids in pages
+                )
+            )
+            for deleted in results:
+                if deleted is not None:
+                    batch += 1
+                    total += deleted
+                    self._report_batch(config, batch, deleted)
+            if scan_failed or None in results:
+                self._report_failure(config, total)
+                break
+            if len(pages[-1]) < batch_size:
+                break
+            await asyncio.sleep(self.settings.pause)
+        return total
+
+    async def _scan(self, scan: Query, last_id: str) -> List[str]:
+        parameters = {**scan.parameters, "last_id": last_id}
+        return [
+            record["id"]
+            async for record in self.connection.stream(
+                scan.query_statement, parameters, read_only=True, raise_errors=True
+            )
+        ]
+
+    async def _delete(self, query: Query) -> Optional[int]:
+        """Runs a delete batch, returning how many objects it deleted or None if it failed."""
+        response = await self.connection.scheduler.run(
+            object(),
+            partial(
+                self.connection.execute,
+                query.query_statement,
+                query.parameters,
+                keep_payload=True,
+            ),
+        )
+        if response is None:
+            return None
+        deleted = 0
+        async for record in self.connection.records(response):
+            deleted += record.get("deleted", 0)
+        return deleted
+
+    def _report_batch(self, config: TimeToLiveConfiguration, batch: int, deleted: int):
+        self.connection.metrics.increment(
+            "ttl_deleted_objects", deleted, {"object_type": config.object_type}
+        )
+        self.logger.info(
+            "Deleted a batch of expired objects",
+            extra=dict(object_type=config.object_type, batch=batch, deleted=deleted),
+        )
+
+    def _report_failure(self, config: TimeToLiveConfiguration, deleted: int):
+        self.logger.error(
+            "Stopped deleting expired objects after a batch failed",
+            extra=dict(object_type=config.object_type, deleted=deleted),
+        )
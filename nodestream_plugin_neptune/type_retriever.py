@@ -1,4 +1,7 @@
-from typing import AsyncGenerator
+import asyncio
+import math
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, List
 
 from nodestream.databases.copy import TypeRetriever
 from nodestream.model import PropertySet, RelationshipWithNodes
@@ -7,20 +10,162 @@ from nodestream.model.graph_objects import Node, Relationship
 from .extractor import NeptuneDBExtractor
 from .neptune_connector import NeptuneConnector
 
+CURSOR_KEY = "cursor"
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_PREFETCH_DEPTH = 2
+DEFAULT_PARALLELISM = 4
+
 FETCH_ALL_NODES_BY_TYPE_QUERY_FORMAT = """
 MATCH (n:{type})
-RETURN n SKIP $offset LIMIT $limit
+WHERE id(n) > $last_id
+RETURN n, id(n) AS cursor ORDER BY id(n) LIMIT $limit
 """
 
 FETCH_ALL_RELATIONSHIPS_BY_TYPE_QUERY_FORMAT = """
 MATCH (a)-[r:{type}]->(b)
+WHERE id(r) > $last_id
+RETURN a, r, b, id(r) AS cursor ORDER BY id(r) LIMIT $limit
+"""
+
+FETCH_NODES_BY_TYPE_IN_RANGE_QUERY_FORMAT = """
+MATCH (n:{type})
+WHERE id(n) > $last_id AND id(n) <= $upper_id
+RETURN n, id(n) AS cursor ORDER BY id(n) LIMIT $limit
+"""
+
+FETCH_RELATIONSHIPS_BY_TYPE_IN_RANGE_QUERY_FORMAT = """
+MATCH (a)-[r:{type}]->(b)
+WHERE id(r) > $last_id AND id(r) <= $upper_id
+RETURN a, r, b, id(r) AS cursor ORDER BY id(r) LIMIT $limit
+"""
+
+COUNT_NODES_OF_TYPE_QUERY_FORMAT = "MATCH (n:{type}) RETURN count(n) AS count"
+COUNT_RELATIONSHIPS_OF_TYPE_QUERY_FORMAT = (
+    "MATCH ()-[r:{type}]->() RETURN count(r) AS count"
+)
+
+NTH_NODE_ID_OF_TYPE_QUERY_FORMAT = (
+    "MATCH (n:{type}) RETURN id(n) AS cursor ORDER BY id(n) SKIP $offset LIMIT 1"
+)
+NTH_RELATIONSHIP_ID_OF_TYPE_QUERY_FORMAT = (
+    "MATCH ()-[r:{type}]->() RETURN id(r) AS cursor ORDER BY id(r) SKIP $offset LIMIT 1"
+)
+
+FETCH_ALL_NODES_BY_TYPE_OFFSET_QUERY_FORMAT = """
+MATCH (n:{type})
+RETURN n SKIP $offset LIMIT $limit
+"""
+
+FETCH_ALL_RELATIONSHIPS_BY_TYPE_OFFSET_QUERY_FORMAT = """
+MATCH (a)-[r:{type}]->(b)
 RETURN a, r, b SKIP $offset LIMIT $limit
 """
 
 
+@dataclass(slots=True, frozen=True)
+class TypeQueryFormats:
+    keyset: str
+    keyset_in_range: str
+    offset: str
+    count: str
+    nth_id: str
+
+
+NODE_QUERY_FORMATS = TypeQueryFormats(
+    keyset=FETCH_ALL_NODES_BY_TYPE_QUERY_FORMAT,
+    keyset_in_range=FETCH_NODES_BY_TYPE_IN_RANGE_QUERY_FORMAT,
+    offset=FETCH_ALL_NODES_BY_TYPE_OFFSET_QUERY_FORMAT,
+    count=COUNT_NODES_OF_TYPE_QUERY_FORMAT,
+    nth_id=NTH_NODE_ID_OF_TYPE_QUERY_FORMAT,
+)
+
+RELATIONSHIP_QUERY_FORMATS = TypeQueryFormats(
+    keyset=FETCH_ALL_RELATIONSHIPS_BY_TYPE_QUERY_FORMAT,
+    keyset_in_range=FETCH_RELATIONSHIPS_BY_TYPE_IN_RANGE_QUERY_FORMAT,
+    offset=FETCH_ALL_RELATIONSHIPS_BY_TYPE_OFFSET_QUERY_FORMAT,
+    count=COUNT_RELATIONSHIPS_OF_TYPE_QUERY_FORMAT,
+    nth_id=NTH_RELATIONSHIP_ID_OF_TYPE_QUERY_FORMAT,
+)
+
+
+async def merge_async_iterators(
+    iterators: List[AsyncIterator[Any]], buffer_size: int = 1000
+) -> AsyncIterator[Any]:
+    """Yields the items of all `iterators` as soon as any of them produces one.
+
+    The iterators are closed once the merge ends, early or not.
+    """
+    if len(iterators) == 1:
+        try:
+            async for item in iterators[0]:
+                yield item
+        finally:
+            await _aclose(iterators[0])
+        return
+
+    done = object()
+    queue = asyncio.Queue(maxsize=buffer_size)
+
+    async def pump(iterator: AsyncIterator[Any]):
+        try:
+            async for item in iterator:
+                await queue.put(item)
+        except Exception as error:
+            await queue.put(error)
+            return
+        await queue.put(done)
+
+    pumps = [asyncio.create_task(pump(iterator)) for iterator in iterators]
+    try:
+        remaining = len(pumps)
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in pumps:
+            task.cancel()
+        # An iterator cannot be closed while a pump is still running it.
+        await asyncio.gather(*pumps, return_exceptions=True)
+        for iterator in iterators:
+            await _aclose(iterator)
+
+
+async def _aclose(iterator: AsyncIterator[Any]):
+    # Closing async generators stops their cursors and prefetch tasks.
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
 class NeptuneDBTypeRetriever(TypeRetriever):
-    def __init__(self, connector: NeptuneConnector) -> None:
+    """Reads every node or relationship of a type out of a Neptune graph.
+
+    With keyset pagination, large types are split into up to `parallelism`
+    disjoint `~id` ranges of roughly equal size which are read concurrently.
+    The range boundaries are found by counting the objects of the type and
+    looking up the id at each boundary position once.
+    """
+
+    def __init__(
+        self,
+        connector: NeptuneConnector,
+        keyset_pagination: bool = True,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        prefetch_depth: int = DEFAULT_PREFETCH_DEPTH,
+        parallelism: int = DEFAULT_PARALLELISM,
+    ) -> None:
+        if parallelism < 1:
+            raise ValueError("`parallelism` must be at least 1.")
         self.connector = connector
+        self.keyset_pagination = keyset_pagination
+        self.page_size = page_size
+        self.prefetch_depth = prefetch_depth
+        self.parallelism = parallelism
 
     def map_neptune_node_to_nodestream_node(self, node: Node, type: str = None) -> Node:
         # NOTE: I don't think this will work in all cases.
@@ -40,27 +185,104 @@ class NeptuneDBTypeRetriever(TypeRetriever):
             properties=PropertySet(relationship),
         )
 
-    def get_node_type_extractor(self, type: str) -> NeptuneDBExtractor:
+    def make_extractor(
+        self, formats: TypeQueryFormats, type: str
+    ) -> NeptuneDBExtractor:
+        if self.keyset_pagination:
+            query, cursor_key = formats.keyset.format(type=type), CURSOR_KEY
+        else:
+            query, cursor_key = formats.offset.format(type=type), None
         return NeptuneDBExtractor(
-            FETCH_ALL_NODES_BY_TYPE_QUERY_FORMAT.format(type=type), self.connector
+            query,
+            self.connector,
+            limit=self.page_size,
+            cursor_key=cursor_key,
+            prefetch_depth=self.prefetch_depth,
         )
 
-    def get_relationship_type_extractor(self, type: str) -> NeptuneDBExtractor:
+    def make_range_extractor(
+        self, formats: TypeQueryFormats, type: str, lower_id: Any, upper_id: Any
+    ) -> NeptuneDBExtractor:
+        if upper_id is None:
+            query, parameters = formats.keyset.format(type=type), {}
+        else:
+            query = formats.keyset_in_range.format(type=type)
+            parameters = {"upper_id": upper_id}
         return NeptuneDBExtractor(
-            FETCH_ALL_RELATIONSHIPS_BY_TYPE_QUERY_FORMAT.format(type=type),
+            query,
             self.connector,
+            parameters=parameters,
+            limit=self.page_size,
+            cursor_key=CURSOR_KEY,
+            prefetch_depth=self.prefetch_depth,
+            initial_cursor=lower_id,
         )
 
+    def get_node_type_extractor(self, type: str) -> NeptuneDBExtractor:
+        return self.make_extractor(NODE_QUERY_FORMATS, type)
+
+    def get_relationship_type_extractor(self, type: str) -> NeptuneDBExtractor:
+        return self.make_extractor(RELATIONSHIP_QUERY_FORMATS, type)
+
+    async def fetch_single(self, query: str, parameters: dict) -> dict | None:
+        """Returns the first record of `query`, raising `QueryFailedError` if it failed."""
+        async for record in self.connector.connection.stream(
+            query, parameters, read_only=True, raise_errors=True
+        ):
+            return record
+        return None
+
+    async def get_id_range_boundaries(
+        self, formats: TypeQueryFormats, type: str
+    ) -> List[Any]:
+        """Returns the ids splitting a type into ranges of about the same size.
+
+        Range `i` covers ids greater than boundary `i - 1` and up to boundary
+        `i`, the last range having no upper bound.
+        """
+        counted = await self.fetch_single(formats.count.format(type=type), {})
+        total = counted["count"] if counted else 0
+        ranges = min(self.parallelism, math.ceil(total / self.page_size))
+        if ranges <= 1:
+            return []
+
+        nth_id_query = formats.nth_id.format(type=type)
+        records = await asyncio.gather(
+            *(
+                self.fetch_single(nth_id_query, {"offset": i * total // ranges - 1})
+                for i in range(1, ranges)
+            )
+        )
+        boundaries = [record[CURSOR_KEY] for record in records if record]
+        return sorted(set(boundaries))
+
+    async def extract_type(
+        self, formats: TypeQueryFormats, type: str
+    ) -> AsyncIterator[dict]:
+        if not self.keyset_pagination or self.parallelism == 1:
+            extractors = [self.make_extractor(formats, type)]
+        else:
+            boundaries = await self.get_id_range_boundaries(formats, type)
+            lower_ids = [None, *boundaries]
+            upper_ids = [*boundaries, None]
+            extractors = [
+                self.make_range_extractor(formats, type, lower_id, upper_id)
+                for lower_id, upper_id in zip(lower_ids, upper_ids)
+            ]
+
+        async for row in merge_async_iterators(
+            [extractor.extract_records() for extractor in extractors]
+        ):
+            yield row
+
     async def get_nodes_of_type(self, type: str) -> AsyncGenerator[Node, None]:
-        extractor = self.get_node_type_extractor(type)
-        async for row in extractor.extract_records():
+        async for row in self.extract_type(NODE_QUERY_FORMATS, type):
             yield self.map_neptune_node_to_nodestream_node(row["n"], type=type)
 
     async def get_relationships_of_type(
         self, type: str
     ) -> AsyncGenerator[RelationshipWithNodes, None]:
-        extractor = self.get_relationship_type_extractor(type)
-        async for row in extractor.extract_records():
+        async for row in self.extract_type(RELATIONSHIP_QUERY_FORMATS, type):
             yield RelationshipWithNodes(
                 from_node=self.map_neptune_node_to_nodestream_node(row["a"]),
                 to_node=self.map_neptune_node_to_nodestream_node(row["b"]),
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .columnar import concat_batches
+from .partition_sizer import estimate_payload_bytes
+from .query import QueryBatch
+
+DEFAULT_BUFFER_MAX_ROWS = 5000
+DEFAULT_BUFFER_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_BUFFER_MAX_LATENCY = 1.0
+
+# Writes a batch, merging the rows sharing the given key names when there are any.
+WriteBatch = Callable[[QueryBatch, Optional[tuple]], Awaitable]
+
+
+@dataclass(slots=True)
+class WriteBufferSettings:
+    max_rows: int = DEFAULT_BUFFER_MAX_ROWS
+    max_bytes: int = DEFAULT_BUFFER_MAX_BYTES
+    max_latency: float = DEFAULT_BUFFER_MAX_LATENCY
+
+
+@dataclass(slots=True)
+class BufferedStatement:
+    query_statement: str
+    key_names: Optional[tuple]
+    is_relationship: bool
+    first_added_at: float
+    batches: List[Sequence] = field(default_factory=list)
+    rows: int = 0
+    payload_bytes: int = 0
+
+    def as_query_batch(self) -> QueryBatch:
+        return QueryBatch(self.query_statement, concat_batches(self.batches))
+
+
+class WriteBuffer:
+    """Collects the rows of many upserts per query statement before writing them.
+
+    The rows of a statement are written once `max_rows` rows or about
+    `max_bytes` bytes of them are buffered, once the oldest of them has waited
+    `max_latency` seconds, or when the buffer is flushed. Relationships are
+    matched to nodes that must already exist, so buffered nodes are always
+    written before any relationships are.
+    """
+
+    def __init__(self, write: WriteBatch, settings: WriteBufferSettings = None) -> None:
+        self.write = write
+        self.settings = settings or WriteBufferSettings()
+        self.entries: Dict[str, BufferedStatement] = {}
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+        self.error: Optional[Exception] = None
+        self.logger = getLogger(self.__class__.__name__)
+
+    async def add(
+        self,
+        query_batch: QueryBatch,
+        key_names: Optional[tuple],
+        is_relationship: bool = False,
+    ):
+        self.raise_background_error()
+        rows = query_batch.parameters
+        if not rows:
+            return
+
+        entry = self.entries.get(query_batch.query_statement)
+        if entry is None:
+            entry = BufferedStatement(
+                query_batch.query_statement,
+                key_names,
+                is_relationship,
+                first_added_at=time.monotonic(),
+            )
+            self.entries[entry.query_statement] = entry
+        entry.batches.append(rows)
+        entry.rows += len(rows)
+        entry.payload_bytes += estimate_payload_bytes(rows)
+
+        settings = self.settings
+        if entry.rows >= settings.max_rows or entry.payload_bytes >= settings.max_bytes:
+            await self.flush_entries([entry])
+        elif self.timer is None or self.timer.done():
+            self.timer = asyncio.create_task(self.flush_on_timer())
+
+    def in_write_order(self, entries: List[BufferedStatement]):
+        """Orders entries to write nodes first, adding every buffered node entry
+        when relationships are written."""
+        if any(entry.is_relationship for entry in entries):
+            entries = [*self.entries.values(), *entries]
+        entries = list({id(entry): entry for entry in entries}.values())
+        return sorted(entries, key=lambda entry: entry.is_relationship)
+
+    async def flush_entries(self, entries: List[BufferedStatement]):
+        async with self.lock:
+            for entry in self.in_write_order(entries):
+                # Entries are taken out before being written so that rows
+                # added meanwhile start a new entry.
+                if self.entries.get(entry.query_statement) is not entry:
+                    continue
+                del self.entries[entry.query_statement]
+                await self.write(entry.as_query_batch(), entry.key_names)
+
+    async def flush(self):
+        """Writes every buffered row."""
+        await self.flush_entries(list(self.entries.values()))
+        self.raise_background_error()
+
+    async def flush_on_timer(self):
+        max_latency = self.settings.max_latency
+        try:
+            while self.entries:
+                oldest = min(entry.first_added_at for entry in self.entries.values())
+                await asyncio.sleep(max(0.0, oldest + max_latency - time.monotonic()))
+                now = time.monotonic()
+                expired = [
+                    entry
+                    for entry in self.entries.values()
+                    if now - entry.first_added_at >= max_latency
+                ]
+                await self.flush_entries(expired)
+        except Exception as error:
+            self.logger.exception("Failed to flush buffered writes")
+            self.error = error
+
+    def raise_background_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    async def close(self):
+        # Flush before stopping the timer, which could be writing rows itself.
+        await self.flush()
+        if self.timer is not None:
+            self.timer.cancel()
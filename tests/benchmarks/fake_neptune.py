@@ -0,0 +1,181 @@
+import asyncio
+import csv
+import gzip
+import json
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from aiohttp import web
+
+STATS_PATH = "/__stats"
+
+
+@dataclass(slots=True)
+class FakeNeptuneSettings:
+    """How the fake endpoint behaves.
+
+    Every request waits `latency` seconds plus `latency_per_row` seconds for
+    each row of its `params`, then fails with a `ConcurrentModificationException`
+    with probability `conflict_rate` or a `TooManyRequestsException` with
+    probability `throttle_rate`.
+    """
+
+    latency: float = 0.005
+    latency_per_row: float = 0.0
+    conflict_rate: float = 0.0
+    throttle_rate: float = 0.0
+    load_polls: int = 1
+    seed: int = 0
+
+
+@dataclass(slots=True)
+class FakeNeptuneStats:
+    requests: int = 0
+    rows: int = 0
+    bytes_received: int = 0
+    conflicts: int = 0
+    throttles: int = 0
+    loads: int = 0
+    statements: dict = field(default_factory=dict)
+
+
+class FakeNeptune:
+    """A local stand-in for the `neptunedata` openCypher and loader endpoints.
+
+    It speaks just enough of the REST protocol for a real botocore client to
+    talk to it, so benchmarks include the cost of signing, serializing and
+    sending requests. Bulk loads read the CSV files of a local directory and
+    count their rows as written.
+    """
+
+    def __init__(self, settings: FakeNeptuneSettings = None) -> None:
+        self.settings = settings or FakeNeptuneSettings()
+        self.stats = FakeNeptuneStats()
+        self.random = random.Random(self.settings.seed)
+        self.loads = {}
+        self.runner = None
+        self.port = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/opencypher", self.handle_query)
+        app.router.add_post("/loader", self.handle_start_load)
+        app.router.add_get("/loader/{load_id}", self.handle_load_status)
+        app.router.add_get(STATS_PATH, self.handle_stats)
+        return app
+
+    async def handle_query(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        document = json.loads(body)
+        parameters = json.loads(document.get("parameters") or "{}")
+        rows = len(parameters.get("params", ())) if isinstance(parameters, dict) else 0
+
+        stats = self.stats
+        stats.requests += 1
+        stats.bytes_received += len(body)
+        query = document["query"]
+        stats.statements[query] = stats.statements.get(query, 0) + 1
+
+        settings = self.settings
+        await asyncio.sleep(settings.latency + settings.latency_per_row * rows)
+
+        roll = self.random.random()
+        if roll < settings.conflict_rate:
+            stats.conflicts += 1
+            return self.error(500, "ConcurrentModificationException")
+        if roll < settings.conflict_rate + settings.throttle_rate:
+            stats.throttles += 1
+            return self.error(429, "TooManyRequestsException")
+
+        stats.rows += rows
+        return web.json_response({"results": []})
+
+    async def handle_start_load(self, request: web.Request) -> web.Response:
+        document = await request.json()
+        if document.get("format") != "opencypher":
+            return self.error(400, "BadRequestException")
+        rows = await asyncio.to_thread(count_csv_rows, Path(document["source"]))
+        load_id = f"load-{len(self.loads)}"
+        self.loads[load_id] = {"rows": rows, "polls": 0, "source": document}
+        self.stats.loads += 1
+        return web.json_response({"status": "200 OK", "payload": {"loadId": load_id}})
+
+    async def handle_load_status(self, request: web.Request) -> web.Response:
+        load = self.loads.get(request.match_info["load_id"])
+        if load is None:
+            return self.error(404, "LoadUrlAccessDeniedException")
+        load["polls"] += 1
+        if load["polls"] <= self.settings.load_polls:
+            status = "LOAD_IN_PROGRESS"
+        else:
+            status = "LOAD_COMPLETED"
+            if not load.get("counted"):
+                load["counted"] = True
+                self.stats.rows += load["rows"]
+        overall_status = {"status": status, "totalRecords": load["rows"]}
+        return web.json_response(
+            {"status": "200 OK", "payload": {"overallStatus": overall_status}}
+        )
+
+    async def handle_stats(self, _: web.Request) -> web.Response:
+        stats = self.stats
+        return web.json_response(
+            {
+                "requests": stats.requests,
+                "rows": stats.rows,
+                "bytes_received": stats.bytes_received,
+                "conflicts": stats.conflicts,
+                "throttles": stats.throttles,
+                "loads": stats.loads,
+                "statements": len(stats.statements),
+            }
+        )
+
+    def error(self, status: int, code: str) -> web.Response:
+        return web.json_response(
+            {"code": code, "message": f"Simulated {code}"},
+            status=status,
+            headers={"x-amzn-ErrorType": code},
+        )
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, port: int = 0) -> str:
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.endpoint
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+def count_csv_rows(directory: Path) -> int:
+    rows = 0
+    for path in sorted(directory.iterdir()):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8", newline="") as file:
+            # Every file starts with its header.
+            rows += sum(1 for _ in csv.reader(file)) - 1
+    return rows
+
+
+def serve_forever(settings: FakeNeptuneSettings, ports):
+    """Runs a fake endpoint until the process is terminated.
+
+    The port it listens on is put on the `ports` queue. Running the endpoint in
+    its own process keeps its CPU time out of the measurements of the client.
+    """
+
+    async def main():
+        fake = FakeNeptune(settings)
+        ports.put(await fake.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""Measures ingestion throughput against a local stand-in for Neptune.
+
+    python -m tests.benchmarks --rows 10000 100000 --conflict-rate 0.01
+
+Each scenario writes synthetic nodes or relationships through a
+`NeptuneQueryExecutor` talking to a `FakeNeptune` endpoint running in its own
+process, and reports rows per second, CPU time per row, peak memory and
+request counts. Only the time spent in the executor is measured, building the
+synthetic nodestream objects is not.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+import aiohttp
+from aiobotocore.config import AioConfig
+
+from nodestream_plugin_neptune import NeptuneConnector
+
+from .fake_neptune import STATS_PATH, FakeNeptuneSettings, serve_forever
+from .workloads import node_batches, relationship_batches
+
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+DEFAULT_BATCH_SIZE = 1000
+WORKLOADS = ("nodes", "relationships")
+
+
+@dataclass(slots=True)
+class BenchmarkResult:
+    workload: str
+    rows: int
+    seconds: float
+    rows_per_second: float
+    cpu_us_per_row: float
+    peak_memory_mib: float
+    requests: int
+    rows_written: int
+    retries: int
+    conflicts: int
+    throttles: int
+
+
+def make_connector(endpoint: str, connector_settings: dict) -> NeptuneConnector:
+    return NeptuneConnector.from_file_data(
+        mode="database",
+        host=endpoint,
+        region="us-east-1",
+        aws_access_key_id="benchmark",
+        aws_secret_access_key="benchmark",
+        # Leave retries to the plugin's retry policy.
+        config=AioConfig(retries={"total_max_attempts": 1}),
+        **connector_settings,
+    )
+
+
+async def fetch_stats(endpoint: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(endpoint + STATS_PATH) as response:
+            return await response.json()
+
+
+async def run_scenario(
+    workload: str,
+    rows: int,
+    endpoint: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    connector_settings: dict = None,
+) -> BenchmarkResult:
+    connector = make_connector(endpoint, connector_settings or {})
+    executor = connector.make_query_executor()
+    if workload == "nodes":
+        batches, write = node_batches, executor.upsert_nodes_in_bulk_with_same_operation
+    else:
+        batches = relationship_batches
+        write = executor.upsert_relationships_in_bulk_of_same_operation
+
+    before = await fetch_stats(endpoint)
+    tracemalloc.start()
+    seconds = cpu_seconds = 0.0
+    try:
+        for operation, items in batches(rows, batch_size):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            await write(operation, items)
+            seconds += time.perf_counter() - wall_start
+            cpu_seconds += time.process_time() - cpu_start
+        # Buffered rows and bulk loads are only written when the executor finishes.
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await executor.finish()
+        seconds += time.perf_counter() - wall_start
+        cpu_seconds += time.process_time() - cpu_start
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    after = await fetch_stats(endpoint)
+
+    def delta(key):
+        return after[key] - before[key]
+
+    registry = connector.connection.metrics.registry
+    retries = sum(
+        value for (name, _), value in registry.counters.items() if name == "retries"
+    )
+    return BenchmarkResult(
+        workload=workload,
+        rows=rows,
+        seconds=round(seconds, 3),
+        rows_per_second=round(rows / seconds, 1) if seconds else 0.0,
+        cpu_us_per_row=round(cpu_seconds / rows * 1e6, 2),
+        peak_memory_mib=round(peak_memory / 2**20, 2),
+        requests=delta("requests"),
+        rows_written=delta("rows"),
+        retries=int(retries),
+        conflicts=delta("conflicts"),
+        throttles=delta("throttles"),
+    )
+
+
+def print_results(results):
+    columns = list(BenchmarkResult.__dataclass_fields__)
+    rows = [[str(getattr(result, column)) for column in columns] for result in results]
+    widths = [max(len(c), *(len(r[i]) for r in rows)) for i, c in enumerate(columns)]
+    for line in [columns, *rows]:
+        print("  ".join(value.rjust(width) for value, width in zip(line, widths)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument("--rows", nargs="+", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--latency-per-row", type=float, default=0.0)
+    parser.add_argument("--conflict-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--connector-settings",
+        type=json.loads,
+        default={},
+        help="JSON object of extra `NeptuneConnector.from_file_data` arguments.",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = FakeNeptuneSettings(
+        latency=args.latency,
+        latency_per_row=args.latency_per_row,
+        conflict_rate=args.conflict_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    server = context.Process(target=serve_forever, args=(settings, ports), daemon=True)
+    server.start()
+    try:
+        endpoint = ports.get(timeout=30)
+        results = [
+            asyncio.run(
+                run_scenario(
+                    workload, rows, endpoint, args.batch_size, args.connector_settings
+                )
+            )
+            for workload in args.workloads
+            for rows in args.rows
+        ]
+    finally:
+        server.terminate()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump([asdict(result) for result in results], output, indent=2)
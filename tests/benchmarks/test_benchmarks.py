@@ -0,0 +1,54 @@
+import pytest
+import pytest_asyncio
+from hamcrest import assert_that, equal_to, greater_than
+
+from .fake_neptune import FakeNeptune, FakeNeptuneSettings
+from .run import run_scenario
+
+
+@pytest_asyncio.fixture
+async def fake_neptune():
+    fake = FakeNeptune(FakeNeptuneSettings(latency=0, conflict_rate=0.2, seed=1))
+    await fake.start()
+    yield fake
+    await fake.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workload", ["nodes", "relationships"])
+async def test_scenario_writes_every_row(fake_neptune, workload):
+    result = await run_scenario(
+        workload,
+        rows=300,
+        endpoint=fake_neptune.endpoint,
+        batch_size=100,
+        connector_settings={
+            "retry_policy": {"max_attempts": 10, "base_delay": 0, "max_delay": 0},
+        },
+    )
+    assert_that(result.rows_written, equal_to(300))
+    assert_that(result.conflicts, greater_than(0))
+    assert_that(result.retries, equal_to(result.conflicts))
+    assert_that(result.requests, equal_to(fake_neptune.stats.requests))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workload", ["nodes", "relationships"])
+async def test_bulk_load_scenario_loads_every_row(fake_neptune, workload, tmp_path):
+    result = await run_scenario(
+        workload,
+        rows=300,
+        endpoint=fake_neptune.endpoint,
+        batch_size=100,
+        connector_settings={
+            "bulk_load": {
+                "source": str(tmp_path / "source"),
+                "iam_role_arn": "arn:aws:iam::123456789012:role/NeptuneLoadFromS3",
+                "rows_per_file": 128,
+                "poll_interval": 0,
+            },
+        },
+    )
+    assert_that(result.rows_written, equal_to(300))
+    assert_that(result.requests, equal_to(0))
+    assert_that(fake_neptune.stats.loads, equal_to(1))
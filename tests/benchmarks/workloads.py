@@ -0,0 +1,82 @@
+from typing import Iterator, List, Tuple
+
+from nodestream.databases.query_executor import (
+    OperationOnNodeIdentity,
+    OperationOnRelationshipIdentity,
+)
+from nodestream.model import (
+    Node,
+    NodeCreationRule,
+    PropertySet,
+    Relationship,
+    RelationshipCreationRule,
+    RelationshipWithNodes,
+)
+from pandas import Timestamp
+
+NODE_TYPE = "BenchmarkPerson"
+RELATIONSHIP_TYPE = "BENCHMARK_KNOWS"
+UPDATED_AT = Timestamp(2024, 1, 1)
+
+NodeBatch = Tuple[OperationOnNodeIdentity, List[Node]]
+RelationshipBatch = Tuple[OperationOnRelationshipIdentity, List[RelationshipWithNodes]]
+
+
+def make_node(index: int) -> Node:
+    return Node(
+        NODE_TYPE,
+        PropertySet({"id": f"person-{index}"}),
+        PropertySet(
+            {
+                "name": f"Person {index}",
+                "score": index * 0.5,
+                "active": index % 2 == 0,
+                "updated_at": UPDATED_AT,
+            }
+        ),
+    )
+
+
+def node_batches(rows: int, batch_size: int) -> Iterator[NodeBatch]:
+    """Yields `rows` nodes of a single type in batches of `batch_size`."""
+    operation = OperationOnNodeIdentity(
+        make_node(0).identity_shape, NodeCreationRule.EAGER
+    )
+    for start in range(0, rows, batch_size):
+        end = min(rows, start + batch_size)
+        yield operation, [make_node(i) for i in range(start, end)]
+
+
+def make_relationship(index: int, rows: int) -> RelationshipWithNodes:
+    # About ten relationships per node, spread over the nodes by a multiplicative
+    # hash so that neighbouring rows rarely share a vertex.
+    nodes = max(1, rows // 10)
+    return RelationshipWithNodes(
+        from_node=make_node(index % nodes),
+        to_node=make_node((index * 7919) % nodes),
+        relationship=Relationship(
+            RELATIONSHIP_TYPE,
+            PropertySet({"index": index}),
+            PropertySet({"weight": index % 100, "updated_at": UPDATED_AT}),
+        ),
+        to_side_node_creation_rule=NodeCreationRule.MATCH_ONLY,
+        from_side_node_creation_rule=NodeCreationRule.MATCH_ONLY,
+    )
+
+
+def relationship_batches(rows: int, batch_size: int) -> Iterator[RelationshipBatch]:
+    """Yields `rows` relationships between `rows / 10` nodes in batches of `batch_size`."""
+    first = make_relationship(0, rows)
+    operation = OperationOnRelationshipIdentity(
+        OperationOnNodeIdentity(
+            first.from_node.identity_shape, NodeCreationRule.MATCH_ONLY
+        ),
+        OperationOnNodeIdentity(
+            first.to_node.identity_shape, NodeCreationRule.MATCH_ONLY
+        ),
+        first.relationship.identity_shape,
+        RelationshipCreationRule.EAGER,
+    )
+    for start in range(0, rows, batch_size):
+        end = min(rows, start + batch_size)
+        yield operation, [make_relationship(i, rows) for i in range(start, end)]
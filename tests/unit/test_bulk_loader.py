@@ -0,0 +1,291 @@
+import csv
+import gzip
+
+import pytest
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    has_length,
+    not_none,
+    raises,
+    same_instance,
+)
+from nodestream.databases.query_executor import OperationOnNodeIdentity
+from nodestream.model import (
+    Node,
+    NodeCreationRule,
+    TimeToLiveConfiguration,
+)
+from nodestream.schema.state import GraphObjectType
+from pandas import Timestamp
+
+from nodestream_plugin_neptune import NeptuneConnector
+from nodestream_plugin_neptune.bulk_loader import (
+    BulkLoader,
+    BulkLoadError,
+    BulkLoadFileWriter,
+    BulkLoadTrigger,
+    LocalDirectoryUploader,
+    column_type,
+    format_cell,
+    relationship_rows,
+)
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
+from nodestream_plugin_neptune.metrics import Metrics
+from nodestream_plugin_neptune.neptune_query_executor import (
+    NeptuneBulkLoadQueryExecutor,
+)
+
+
+class FakeTrigger(BulkLoadTrigger):
+    def __init__(self, statuses=("LOAD_IN_PROGRESS", "LOAD_COMPLETED")):
+        self.statuses = statuses
+        self.sources = []
+        self.polls = 0
+
+    async def start(self, source):
+        self.sources.append(source)
+        self.polls = 0
+        return f"load-{len(self.sources)}"
+
+    async def status(self, load_id):
+        status = self.statuses[min(self.polls, len(self.statuses) - 1)]
+        self.polls += 1
+        return {"status": status}
+
+
+def read_csv(path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8", newline="") as file:
+        return list(csv.reader(file))
+
+
+@pytest.mark.parametrize(
+    "values,expected",
+    [
+        (["a", None], "String"),
+        ([1, 2], "Long"),
+        ([1, 2.5], "Double"),
+        ([True, False], "Bool"),
+        ([1, "a"], "String"),
+        ([["a", "b"], "c"], "String[]"),
+    ],
+)
+def test_column_type(values, expected):
+    assert_that(column_type(values), equal_to(expected))
+
+
+def test_format_cell():
+    assert_that(format_cell(True, "Bool"), equal_to("true"))
+    assert_that(format_cell(2, "Double"), equal_to("2.0"))
+    assert_that(format_cell(None, "Long"), equal_to(""))
+    assert_that(format_cell(["a;b", "c"], "String[]"), equal_to(r"a\;b;c"))
+
+
+def test_relationship_ids_are_stable_unless_relationships_are_created():
+    parameters = ColumnarBatch.from_rows(
+        [{"__from_node_id": "a", "__to_node_id": "b", "since": 2020}] * 2
+    )
+    merged = relationship_rows("KNOWS", ("since",), parameters)
+    created = relationship_rows("KNOWS", None, parameters)
+    assert_that(merged[0][":ID"], equal_to(merged[1][":ID"]))
+    assert_that(created[0][":ID"] == created[1][":ID"], equal_to(False))
+    assert_that(merged[0][":START_ID"], equal_to("a"))
+    assert_that(merged[0]["since"], equal_to(2020))
+
+
+def test_relationship_ids_do_not_collide_on_ambiguous_key_values():
+    parameters = ColumnarBatch.from_rows(
+        [
+            {"__from_node_id": "a_KNOWS", "__to_node_id": "b", "k": "x"},
+            {"__from_node_id": "a", "__to_node_id": "b", "k": "KNOWS_x"},
+            {"__from_node_id": "a", "__to_node_id": "b", "k": None},
+            {"__from_node_id": "a", "__to_node_id": "b", "k": ""},
+        ]
+    )
+    rows = relationship_rows("KNOWS", ("k",), parameters)
+    assert_that(len({row[":ID"] for row in rows}), equal_to(4))
+
+
+@pytest.mark.asyncio
+async def test_writer_chunks_rows_into_typed_compressed_files(tmp_path):
+    writer = BulkLoadFileWriter(tmp_path, rows_per_file=2)
+    rows = ColumnarBatch.from_rows(
+        [
+            {":ID": "1", ":LABEL": "Person", "name": "a", "at": Timestamp(0)},
+            {":ID": "2", ":LABEL": "Person", "b:c": "d"},
+            {":ID": "3", ":LABEL": "Person", "age": 3},
+        ]
+    )
+    await writer.add("nodes", "Person", rows)
+    files = await writer.close()
+    assert_that(files["nodes"], has_length(2))
+    assert_that(
+        read_csv(files["nodes"][0]),
+        equal_to(
+            [
+                [":ID", ":LABEL", "name:String", "at:Double", r"b\:c:String"],
+                ["1", "Person", "a", "0.0", ""],
+                ["2", "Person", "", "", "d"],
+            ]
+        ),
+    )
+    assert_that(read_csv(files["nodes"][1])[0], equal_to([":ID", ":LABEL", "age:Long"]))
+    assert_that(writer.rows_written, equal_to(3))
+
+
+@pytest.mark.asyncio
+async def test_loader_loads_nodes_before_relationships(tmp_path):
+    trigger = FakeTrigger()
+    loader = BulkLoader(
+        BulkLoadFileWriter(tmp_path / "staging", compress=False),
+        LocalDirectoryUploader(tmp_path / "source"),
+        trigger,
+        poll_interval=0,
+    )
+    await loader.add_relationships(
+        "KNOWS",
+        None,
+        ColumnarBatch.from_rows([{"__from_node_id": "a", "__to_node_id": "b"}]),
+    )
+    await loader.add_nodes(("Person",), ColumnarBatch.from_rows([{"__node_id": "a"}]))
+    statuses = await loader.load()
+    assert_that(statuses, equal_to([{"status": "LOAD_COMPLETED"}] * 2))
+    assert_that(
+        [source.rsplit("/", 1)[-1] for source in trigger.sources],
+        equal_to(["nodes", "relationships"]),
+    )
+    (node_file,) = (tmp_path / "source" / loader.run_id / "nodes").iterdir()
+    assert_that(read_csv(node_file), equal_to([[":ID", ":LABEL"], ["a", "Person"]]))
+
+
+@pytest.mark.asyncio
+async def test_loader_raises_when_a_load_fails(tmp_path):
+    loader = BulkLoader(
+        BulkLoadFileWriter(tmp_path),
+        LocalDirectoryUploader(tmp_path / "source"),
+        FakeTrigger(("LOAD_IN_QUEUE", "LOAD_FAILED")),
+        poll_interval=0,
+    )
+    await loader.add_nodes(("Person",), ColumnarBatch.from_rows([{"__node_id": "a"}]))
+    with pytest.raises(BulkLoadError):
+        await loader.load()
+
+
+@pytest.mark.asyncio
+async def test_loader_gives_up_after_timeout(tmp_path):
+    loader = BulkLoader(
+        BulkLoadFileWriter(tmp_path),
+        LocalDirectoryUploader(tmp_path / "source"),
+        FakeTrigger(("LOAD_IN_PROGRESS",)),
+        poll_interval=0,
+        timeout=0,
+    )
+    with pytest.raises(BulkLoadError):
+        await loader.wait("load-1")
+
+
+@pytest.mark.asyncio
+async def test_bulk_load_executor_defers_ttl_until_loaded(mocker, tmp_path):
+    connection = mocker.AsyncMock()
+    connection.metrics = Metrics()
+    trigger = FakeTrigger()
+    loader = BulkLoader(
+        BulkLoadFileWriter(tmp_path),
+        LocalDirectoryUploader(tmp_path / "source"),
+        trigger,
+        poll_interval=0,
+    )
+    executor = NeptuneBulkLoadQueryExecutor(
+        connection, NeptuneIngestQueryBuilder(), loader
+    )
+    executor.time_to_live.expire = mocker.AsyncMock()
+    operation = OperationOnNodeIdentity(
+        Node("Person", {"id": "1"}).identity_shape, NodeCreationRule.EAGER
+    )
+    await executor.upsert_nodes_in_bulk_with_same_operation(
+        operation, [Node("Person", {"id": "1"}, {"name": "a"})]
+    )
+    await executor.perform_ttl_op(
+        TimeToLiveConfiguration(GraphObjectType.NODE, "Person", expiry_in_hours=1)
+    )
+    executor.time_to_live.expire.assert_not_awaited()
+    connection.execute.assert_not_awaited()
+
+    await executor.finish()
+    assert_that(trigger.sources, has_length(1))
+    executor.time_to_live.expire.assert_awaited_once()
+    connection.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rule", [NodeCreationRule.MATCH_ONLY, NodeCreationRule.FUZZY])
+async def test_bulk_load_executor_updates_non_eager_nodes_with_queries(
+    mocker, tmp_path, rule
+):
+    connection = mocker.AsyncMock()
+    connection.metrics = Metrics()
+    trigger = FakeTrigger()
+    loader = BulkLoader(
+        BulkLoadFileWriter(tmp_path),
+        LocalDirectoryUploader(tmp_path / "source"),
+        trigger,
+        poll_interval=0,
+    )
+    executor = NeptuneBulkLoadQueryExecutor(
+        connection, NeptuneIngestQueryBuilder(), loader
+    )
+    upsert = mocker.patch(
+        "nodestream_plugin_neptune.neptune_query_executor."
+        "NeptuneQueryExecutor.upsert_nodes_in_bulk_with_same_operation"
+    )
+    node = Node("Person", {"id": "1"}, {"name": "a"})
+    operation = OperationOnNodeIdentity(node.identity_shape, rule)
+    await executor.upsert_nodes_in_bulk_with_same_operation(operation, iter([node]))
+    upsert.assert_not_awaited()
+
+    await executor.finish()
+    assert_that(trigger.sources, has_length(0))
+    upsert.assert_awaited_once_with(operation, [node])
+
+
+def test_connector_bulk_load_mode(tmp_path):
+    connector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        region="us-west-2",
+        bulk_load={"source": "s3://bucket/backfill", "iam_role_arn": "arn"},
+    )
+    executor = connector.make_query_executor()
+    assert_that(isinstance(executor, NeptuneBulkLoadQueryExecutor), equal_to(True))
+    assert_that(executor.bulk_loader.uploader.bucket, equal_to("bucket"))
+    assert_that(executor.bulk_loader.uploader.prefix, equal_to("backfill"))
+    assert_that(executor.bulk_loader.trigger.s3_bucket_region, equal_to("us-west-2"))
+
+
+def test_connector_bulk_load_executor_uses_the_query_settings(tmp_path):
+    connector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        region="us-west-2",
+        bulk_load={"source": "s3://bucket/backfill", "iam_role_arn": "arn"},
+        batch_timeout=30,
+        dead_letters={"directory": str(tmp_path)},
+        conflict_aware_partitioning=False,
+    )
+    executor = connector.make_query_executor()
+    assert_that(executor.batch_timeout, equal_to(30))
+    assert_that(executor.dead_letters, not_none())
+    assert_that(executor.conflict_aware_partitioning, equal_to(False))
+    assert_that(executor.partition_sizer, same_instance(connector.partition_sizer))
+
+
+def test_connector_bulk_load_mode_requires_database():
+    assert_that(
+        calling(NeptuneConnector.from_file_data).with_args(
+            mode="analytics", graph_id="g", bulk_load={"source": "s3://bucket"}
+        ),
+        raises(ValueError),
+    )
@@ -0,0 +1,114 @@
+import pytest
+from hamcrest import assert_that, equal_to, instance_of, is_not
+
+from nodestream_plugin_neptune import NeptuneConnector
+from nodestream_plugin_neptune.change_detection import (
+    ChangeDetectionSettings,
+    FingerprintCache,
+    fingerprint,
+    fingerprints,
+)
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+from nodestream_plugin_neptune.query import QueryBatch
+
+KEY_NAMES = ("__node_id",)
+
+
+def rows(*names, **extra):
+    return [
+        {"__node_id": str(i), "name": name, **extra} for i, name in enumerate(names)
+    ]
+
+
+def write(cache, batch):
+    """Filters `batch` and records every row left as written, returning them."""
+    filtered, pending = cache.filter(batch, KEY_NAMES)
+    cache.record(batch.query_statement, [filtered.parameters], KEY_NAMES, pending)
+    return list(filtered.parameters)
+
+
+def test_fingerprint_ignores_ingestion_timestamps():
+    assert_that(
+        fingerprint({"a": 1, "last_ingested_at": 1, "last_ingested_by_p_at": 1}),
+        equal_to(fingerprint({"last_ingested_at": 2, "a": 1})),
+    )
+    assert_that(fingerprint({"a": 1}), is_not(equal_to(fingerprint({"a": 2}))))
+
+
+def test_columnar_fingerprints_match_row_fingerprints():
+    batch = [{"__node_id": "0", "a": 1, "last_ingested_at": 1}, {"__node_id": "1"}]
+    assert_that(
+        list(fingerprints(ColumnarBatch.from_rows(batch))),
+        equal_to([fingerprint(row) for row in batch]),
+    )
+
+
+def test_columnar_batches_are_filtered_without_building_rows(mocker):
+    cache = FingerprintCache()
+    write(cache, QueryBatch("q", rows("a", "b")))
+    batch = ColumnarBatch.from_rows(rows("a", "c"))
+    mocker.patch.object(ColumnarBatch, "__iter__", side_effect=AssertionError)
+    filtered, _ = cache.filter(QueryBatch("q", batch), KEY_NAMES)
+    assert_that(filtered.parameters.columns["name"], equal_to(["c"]))
+
+
+def test_unchanged_rows_are_dropped_once_written():
+    cache = FingerprintCache()
+    assert_that(write(cache, QueryBatch("q", rows("a", "b"))), equal_to(rows("a", "b")))
+    assert_that(
+        write(cache, QueryBatch("q", rows("a", "b", last_ingested_at=5))),
+        equal_to([]),
+    )
+    assert_that(
+        write(cache, QueryBatch("q", rows("a", "c"))),
+        equal_to([{"__node_id": "1", "name": "c"}]),
+    )
+    # Other statements write the same objects differently.
+    assert_that(write(cache, QueryBatch("other", rows("a"))), equal_to(rows("a")))
+
+
+def test_rows_are_only_remembered_once_written():
+    cache = FingerprintCache()
+    batch = QueryBatch("q", ColumnarBatch.from_rows(rows("a", "b")))
+    filtered, pending = cache.filter(batch, KEY_NAMES)
+    cache.record("q", [filtered.parameters[:1]], KEY_NAMES, pending)
+    filtered, _ = cache.filter(batch, KEY_NAMES)
+    assert_that(filtered.parameters, instance_of(ColumnarBatch))
+    assert_that(list(filtered.parameters), equal_to([{"__node_id": "1", "name": "b"}]))
+
+
+def test_unchanged_rows_are_refreshed_after_a_while():
+    cache = FingerprintCache(ChangeDetectionSettings(refresh_after=0))
+    write(cache, QueryBatch("q", rows("a")))
+    assert_that(write(cache, QueryBatch("q", rows("a"))), equal_to(rows("a")))
+
+
+def test_least_recently_written_objects_are_forgotten():
+    cache = FingerprintCache(ChangeDetectionSettings(cache_size=1))
+    write(cache, QueryBatch("q", rows("a", "b")))
+    assert_that(len(cache), equal_to(1))
+    assert_that(
+        write(cache, QueryBatch("q", rows("a", "b"))),
+        equal_to([{"__node_id": "0", "name": "a"}]),
+    )
+
+
+def test_change_detection_settings_are_validated():
+    with pytest.raises(ValueError):
+        ChangeDetectionSettings(mode="magic")
+
+
+@pytest.mark.parametrize("mode", ["fingerprint", "query"])
+def test_connector_change_detection_modes(mode):
+    connector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        region="us-west-2",
+        change_detection={"mode": mode},
+    )
+    executor = connector.make_query_executor()
+    assert_that(
+        connector.ingest_query_builder.compare_properties, equal_to(mode == "query")
+    )
+    assert_that(executor.fingerprints is not None, equal_to(mode == "fingerprint"))
+    assert_that(executor.fingerprints, equal_to(connector.fingerprints))
@@ -0,0 +1,48 @@
+import pytest
+from hamcrest import assert_that, equal_to, has_length
+from nodestream_plugin_neptune.client_pool import ClientPool
+
+
+@pytest.fixture
+def context_managers():
+    return []
+
+
+@pytest.fixture
+def pool(mocker, context_managers):
+    def create_client(index):
+        context_manager = mocker.AsyncMock()
+        context_manager.__aenter__.return_value = f"client-{index}"
+        context_managers.append(context_manager)
+        return context_manager
+
+    return ClientPool(create_client, size=3)
+
+
+@pytest.mark.asyncio
+async def test_pool_is_opened_lazily(pool, context_managers):
+    assert_that(context_managers, has_length(0))
+    await pool.get()
+    assert_that(context_managers, has_length(3))
+    await pool.get()
+    assert_that(context_managers, has_length(3))
+
+
+@pytest.mark.asyncio
+async def test_pool_round_robins_clients(pool):
+    clients = [await pool.get() for _ in range(4)]
+    assert_that(clients, equal_to(["client-0", "client-1", "client-2", "client-0"]))
+
+
+@pytest.mark.asyncio
+async def test_pool_closes_every_client_once(pool, context_managers):
+    await pool.get()
+    await pool.close()
+    await pool.close()
+    for context_manager in context_managers:
+        context_manager.__aexit__.assert_awaited_once()
+
+
+def test_pool_must_not_be_empty():
+    with pytest.raises(ValueError):
+        ClientPool(lambda _: None, size=0)
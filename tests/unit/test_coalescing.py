@@ -0,0 +1,43 @@
+import pytest
+from hamcrest import assert_that, equal_to, same_instance
+
+from nodestream_plugin_neptune.coalescing import coalesce_rows
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+
+ROWS = [
+    {"__node_id": "a", "name": "first", "age": 1},
+    {"__node_id": "b", "name": "other"},
+    {"__node_id": "a", "name": "second", "city": "x"},
+    {"__node_id": "a", "age": None},
+]
+COALESCED = [
+    {"__node_id": "a", "name": "second", "age": None, "city": "x"},
+    {"__node_id": "b", "name": "other"},
+]
+
+
+@pytest.mark.parametrize("make_rows", [list, ColumnarBatch.from_rows])
+def test_last_writer_wins_per_property(make_rows):
+    assert_that(coalesce_rows(make_rows(ROWS), ("__node_id",)), equal_to(COALESCED))
+
+
+@pytest.mark.parametrize("make_rows", [list, ColumnarBatch.from_rows])
+def test_relationships_are_merged_by_endpoints_and_keys(make_rows):
+    rows = [
+        {"__from_node_id": "a", "__to_node_id": "b", "since": 1, "w": 1},
+        {"__from_node_id": "a", "__to_node_id": "b", "since": 2, "w": 2},
+        {"__from_node_id": "a", "__to_node_id": "b", "since": 1, "w": 3},
+    ]
+    keys = ("__from_node_id", "__to_node_id", "since")
+    assert_that(coalesce_rows(make_rows(rows), keys), equal_to(rows[2:0:-1]))
+
+
+@pytest.mark.parametrize("make_rows", [list, ColumnarBatch.from_rows])
+def test_rows_without_a_key_are_kept(make_rows):
+    rows = make_rows([{"name": "a"}, {"name": "b"}, {"__node_id": "x"}])
+    assert_that(coalesce_rows(rows, ("__node_id",)), same_instance(rows))
+
+
+def test_unhashable_keys_are_left_alone():
+    rows = [{"k": [1]}, {"k": [1]}]
+    assert_that(coalesce_rows(rows, ("k",)), same_instance(rows))
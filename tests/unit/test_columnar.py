@@ -0,0 +1,70 @@
+import json
+import math
+from datetime import datetime
+
+import pytest
+from hamcrest import assert_that, equal_to
+from pandas import Timestamp
+
+from nodestream_plugin_neptune.columnar import (
+    MISSING,
+    ColumnarBatch,
+    ColumnarBatchBuilder,
+    convert_column,
+)
+from nodestream_plugin_neptune.serialization import dumps_with_json
+
+ROWS = [
+    {"__node_id": "a", "name": "A", "score": 1.5},
+    {"__node_id": "b", "score": 2.0},
+    {"__node_id": "c", "name": "C", "extra": None},
+]
+
+
+def test_round_trips_rows_keeping_missing_properties_missing():
+    batch = ColumnarBatch.from_rows(ROWS)
+    assert_that(batch.to_rows(), equal_to(ROWS))
+    assert_that(batch.column("name"), equal_to(["A", MISSING, "C"]))
+    assert_that(batch.sparse, equal_to(True))
+
+
+def test_slices_and_takes_without_building_rows():
+    batch = ColumnarBatch.from_rows(ROWS)
+    assert_that(batch[1:], equal_to(ROWS[1:]))
+    assert_that(batch.take([2, 0]), equal_to([ROWS[2], ROWS[0]]))
+    assert_that(batch[-1], equal_to(ROWS[-1]))
+    assert_that(len(batch[:2]), equal_to(2))
+
+
+def test_later_values_replace_earlier_ones():
+    builder = ColumnarBatchBuilder()
+    builder.add_row({"id": 1, "name": "key"}, {"name": "property"})
+    assert_that(builder.build().to_rows(), equal_to([{"id": 1, "name": "property"}]))
+
+
+def test_converts_timestamp_columns_at_once():
+    timestamps = [Timestamp(1998, 3, 25, 2, 0, 1), Timestamp("2024-01-01 10:00:00.5")]
+    assert_that(
+        convert_column(timestamps), equal_to([ts.timestamp() for ts in timestamps])
+    )
+
+
+def test_converts_mixed_columns_value_by_value():
+    day = datetime(2024, 1, 1)
+    assert_that(
+        convert_column([day, MISSING, "text"]),
+        equal_to([day.timestamp(), MISSING, "text"]),
+    )
+
+
+@pytest.mark.parametrize("column", [[1.0, math.nan], [1, "a", math.inf]])
+def test_rejects_non_finite_floats(column):
+    with pytest.raises(ValueError):
+        convert_column(column)
+
+
+def test_serializes_as_a_list_of_rows():
+    batch = ColumnarBatch.from_rows(ROWS)
+    assert_that(
+        json.loads(dumps_with_json({"params": batch})), equal_to({"params": ROWS})
+    )
@@ -0,0 +1,77 @@
+from hamcrest import assert_that, equal_to
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+from nodestream_plugin_neptune.conflict_partitioner import (
+    group_rows_by_hub,
+    partition_by_conflicts,
+)
+
+
+def rel(from_id, to_id):
+    return {"__from_node_id": from_id, "__to_node_id": to_id}
+
+
+def test_groups_rows_by_their_busiest_vertex():
+    rows = [rel("a", "b"), rel("c", "d"), rel("b", "e"), rel("e", "f")]
+    groups = group_rows_by_hub(rows)
+    assert_that(groups, equal_to([[rows[0], rows[2]], [rows[1]], [rows[3]]]))
+
+
+def test_groups_duplicate_nodes():
+    rows = [{"__node_id": "a", "v": 1}, {"__node_id": "b"}, {"__node_id": "a", "v": 2}]
+    groups = group_rows_by_hub(rows)
+    assert_that(groups, equal_to([[rows[0], rows[2]], [rows[1]]]))
+
+
+def test_rows_without_ids_are_independent():
+    rows = [{"v": 1}, {"v": 1}]
+    assert_that(group_rows_by_hub(rows), equal_to([[rows[0]], [rows[1]]]))
+
+
+def test_independent_rows_are_packed_into_parallel_partitions():
+    rows = [rel(f"from-{i}", f"to-{i}") for i in range(5)]
+    lanes = partition_by_conflicts(rows, partition_size=2)
+    assert_that(lanes, equal_to([[rows[0:2]], [rows[2:4]], [rows[4:5]]]))
+
+
+def test_hub_rows_are_serialized_in_one_lane():
+    hub_rows = [rel("hub", f"to-{i}") for i in range(5)]
+    other_rows = [rel("x", "y")]
+    lanes = partition_by_conflicts(hub_rows + other_rows, partition_size=2)
+    assert_that(
+        lanes,
+        equal_to([[hub_rows[0:2], hub_rows[2:4], hub_rows[4:5]], [other_rows]]),
+    )
+
+
+def test_rows_of_a_hub_never_span_lanes():
+    rows = [rel(f"n{i % 7}", f"hub{i % 3}") for i in range(60)]
+    lanes = partition_by_conflicts(rows, partition_size=4)
+    hubs_by_lane = [
+        {row["__to_node_id"] for part in lane for row in part} for lane in lanes
+    ]
+    for i, first in enumerate(hubs_by_lane):
+        for second in hubs_by_lane[i + 1 :]:
+            assert_that(first & second, equal_to(set()))
+    assert_that(sum(len(p) for lane in lanes for p in lane), equal_to(60))
+
+
+def test_densely_connected_rows_still_run_in_parallel():
+    # Every person works for two of five companies, so all rows are connected.
+    rows = [
+        rel(f"person-{i}", f"company-{(i + j) % 5}") for i in range(20) for j in (0, 1)
+    ]
+    lanes = partition_by_conflicts(rows, partition_size=4)
+    assert_that(len(lanes), equal_to(5))
+    assert_that(sum(len(p) for lane in lanes for p in lane), equal_to(40))
+
+
+def test_partitions_columnar_batches_without_building_rows():
+    rows = [{"__from_node_id": "hub", "__to_node_id": str(i)} for i in range(4)]
+    rows.append({"__node_id": "other"})
+    batch = ColumnarBatch.from_rows(rows)
+    lanes = partition_by_conflicts(batch, 2)
+    assert_that(
+        all(isinstance(p, ColumnarBatch) for lane in lanes for p in lane),
+        equal_to(True),
+    )
+    assert_that(lanes, equal_to([[rows[0:2], rows[2:4]], [rows[4:5]]]))
@@ -0,0 +1,120 @@
+import pytest
+from cleo.testers.command_tester import CommandTester
+from hamcrest import assert_that, equal_to, has_length
+from pandas import Timestamp
+
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+from nodestream_plugin_neptune.commands import NeptuneReplay
+from nodestream_plugin_neptune.dead_letters import (
+    DeadLetter,
+    JsonlDeadLetterSink,
+    dead_letter_files,
+    read_dead_letters,
+    replay_dead_letters,
+)
+from nodestream_plugin_neptune.deadline import DeadlineExceededError
+from nodestream_plugin_neptune.metrics import Metrics, statement_tag
+from nodestream_plugin_neptune.neptune_connection import NeptuneConnection
+from nodestream_plugin_neptune.neptune_query_executor import NeptuneQueryExecutor
+from nodestream_plugin_neptune.query import QueryBatch
+from nodestream_plugin_neptune.request_scheduler import RequestScheduler
+from nodestream_plugin_neptune.retry_policy import RetryPolicy
+
+
+def write_dead_letters(directory, compress=False):
+    sink = JsonlDeadLetterSink(directory, compress)
+    rows = ColumnarBatch.from_rows(
+        [{"__node_id": "a", "at": Timestamp(0)}, {"__node_id": "b"}]
+    )
+    sink.write(DeadLetter.for_failure("query", rows, DeadlineExceededError("late")))
+    sink.write(DeadLetter.for_failure("other", [{"id": 1}], None))
+    sink.close()
+    return sink
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_sink_writes_dead_letters_that_can_be_read_back(tmp_path, compress):
+    sink = write_dead_letters(tmp_path, compress)
+    assert_that(sink.path.name.endswith(".gz"), equal_to(compress))
+    first, second = read_dead_letters(sink.path)
+    assert_that(
+        first.rows, equal_to([{"__node_id": "a", "at": 0.0}, {"__node_id": "b"}])
+    )
+    assert_that(first.error, equal_to("DeadlineExceededError: late"))
+    assert_that(first.error_category, equal_to("deadline_exceeded"))
+    assert_that(
+        first.statement,
+        equal_to(statement_tag(QueryBatch("query", []).as_query().query_statement)),
+    )
+    assert_that(second.error_category, equal_to("unknown"))
+
+
+def test_sink_without_failures_writes_no_file(tmp_path):
+    sink = JsonlDeadLetterSink(tmp_path)
+    sink.close()
+    assert_that(list(tmp_path.iterdir()), equal_to([]))
+
+
+def test_dead_letter_files_looks_into_directories(tmp_path):
+    sink = write_dead_letters(tmp_path)
+    (tmp_path / "unrelated.txt").write_text("")
+    assert_that(dead_letter_files([str(tmp_path)]), equal_to([sink.path]))
+
+
+@pytest.mark.asyncio
+async def test_replay_sends_dead_letters_through_executor(tmp_path, mocker):
+    write_dead_letters(tmp_path)
+    executor = mocker.AsyncMock()
+    rows = await replay_dead_letters(executor, [str(tmp_path)])
+    assert_that(rows, equal_to(3))
+    (first,), _ = executor.execute_batch.await_args_list[0]
+    assert_that(
+        first,
+        equal_to(
+            QueryBatch("query", [{"__node_id": "a", "at": 0.0}, {"__node_id": "b"}])
+        ),
+    )
+
+
+def test_replay_command(tmp_path, mocker):
+    write_dead_letters(tmp_path)
+    executor = mocker.AsyncMock()
+    executor.dead_letters = None
+    target = mocker.Mock()
+    target.name = "neptune"
+    target.connector.make_query_executor.return_value = executor
+    project = mocker.Mock()
+    project.get_target_by_name.return_value = target
+    mocker.patch.object(NeptuneReplay, "get_project", return_value=project)
+    mocker.patch("nodestream.cli.operations.InitializeLogger.perform")
+
+    tester = CommandTester(NeptuneReplay())
+    status = tester.execute(f"{tmp_path} --target neptune")
+    assert_that(status, equal_to(0))
+    assert_that(executor.execute_batch.await_args_list, has_length(2))
+    executor.finish.assert_awaited_once()
+    assert_that(tester.io.fetch_output(), equal_to("Replayed 3 rows to neptune\n"))
+
+
+@pytest.mark.asyncio
+async def test_failed_writes_are_replayed_with_the_statement_they_were_sent_with(
+    tmp_path, mocker
+):
+    connection = mocker.AsyncMock(NeptuneConnection)
+    connection.scheduler = RequestScheduler()
+    connection.metrics = Metrics()
+    connection.retry_policy = RetryPolicy(split_on=[])
+    connection.execute.return_value = None
+    executor = NeptuneQueryExecutor(
+        connection, mocker.Mock(), dead_letters=JsonlDeadLetterSink(tmp_path)
+    )
+    batch = QueryBatch("MERGE (node {`~id`: param.__node_id})", [{"__node_id": "a"}])
+    await executor.execute_batch(batch)
+    executor.dead_letters.close()
+
+    connection.execute.reset_mock(return_value=True)
+    executor.dead_letters = None
+    assert_that(await replay_dead_letters(executor, [str(tmp_path)]), equal_to(1))
+    (query_stmt, parameters), _ = connection.execute.await_args
+    assert_that(query_stmt, equal_to(batch.as_query().query_statement))
+    assert_that(list(parameters["params"]), equal_to([{"__node_id": "a"}]))
@@ -0,0 +1,81 @@
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream_plugin_neptune.extractor import NeptuneDBExtractor
+from nodestream_plugin_neptune.neptune_connection import QueryFailedError
+
+
+class FakeConnection:
+    def __init__(self, rows, cursor_key=None, fail_on_call=None):
+        self.rows = rows
+        self.cursor_key = cursor_key
+        self.fail_on_call = fail_on_call
+        self.calls = []
+
+    async def stream(self, query, params, read_only=False, raise_errors=False):
+        self.calls.append(params)
+        if len(self.calls) == self.fail_on_call:
+            if not raise_errors:
+                return
+            raise QueryFailedError("boom")
+        if "offset" in params:
+            page = self.rows[params["offset"] : params["offset"] + params["limit"]]
+        else:
+            after = [r for r in self.rows if r[self.cursor_key] > params["last_id"]]
+            page = after[: params["limit"]]
+        for row in page:
+            yield row
+
+
+def make_extractor(mocker, connection, **kwargs):
+    connector = mocker.Mock()
+    connector.connection = connection
+    return NeptuneDBExtractor("QUERY", connector, **kwargs)
+
+
+async def collect(extractor):
+    return [record async for record in extractor.extract_records()]
+
+
+ROWS = [{"cursor": f"id-{i:02}", "value": i} for i in range(25)]
+
+
+@pytest.mark.asyncio
+async def test_offset_pagination_reads_every_page(mocker):
+    connection = FakeConnection(ROWS)
+    extractor = make_extractor(mocker, connection, limit=10)
+    assert_that(await collect(extractor), equal_to(ROWS))
+    assert_that([c["offset"] for c in connection.calls], equal_to([0, 10, 20]))
+
+
+@pytest.mark.asyncio
+async def test_keyset_pagination_follows_the_cursor(mocker):
+    connection = FakeConnection(ROWS, cursor_key="cursor")
+    extractor = make_extractor(mocker, connection, limit=10, cursor_key="cursor")
+    assert_that(await collect(extractor), equal_to(ROWS))
+    assert_that(
+        [c["last_id"] for c in connection.calls], equal_to(["", "id-09", "id-19"])
+    )
+
+
+@pytest.mark.asyncio
+async def test_next_page_is_prefetched(mocker):
+    connection = FakeConnection(ROWS)
+    extractor = make_extractor(mocker, connection, limit=10, prefetch_depth=1)
+    records = extractor.extract_records()
+    await records.__anext__()
+    # While the first page is being consumed, the following pages are fetched.
+    assert_that(len(connection.calls) >= 2, equal_to(True))
+    await records.aclose()
+
+
+@pytest.mark.asyncio
+async def test_errors_are_raised_to_the_consumer(mocker):
+    connection = FakeConnection(ROWS, fail_on_call=2)
+    extractor = make_extractor(mocker, connection, limit=10)
+    with pytest.raises(QueryFailedError):
+        await collect(extractor)
+
+
+def test_page_size_must_be_positive(mocker):
+    with pytest.raises(ValueError):
+        make_extractor(mocker, FakeConnection([]), limit=0)
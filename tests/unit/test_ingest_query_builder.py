@@ -18,6 +18,7 @@ from nodestream.model import (
 from nodestream.schema import GraphObjectType
 from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
 from nodestream_plugin_neptune.query import Query, QueryBatch
+from nodestream_plugin_neptune.statement_cache import StatementCache
 from pandas import Timestamp
 
 
@@ -26,9 +27,9 @@ def query_builder():
     return NeptuneIngestQueryBuilder()
 
 
-GREATEST_DAY = Timestamp(
-    1998, 3, 25, 2, 0, 1
-).timestamp()  # The Neptune plugin loads stores datetime's as epoch time.
+GREATEST_DAY_TIMESTAMP = Timestamp(1998, 3, 25, 2, 0, 1)
+# The Neptune plugin loads stores datetime's as epoch time.
+GREATEST_DAY = GREATEST_DAY_TIMESTAMP.timestamp()
 
 BASIC_NODE_TTL = TimeToLiveConfiguration(
     graph_object_type=GraphObjectType.NODE,
@@ -72,6 +73,30 @@ def test_generates_expected_queries(mocked_utcnow, query_builder, ttl, expected_
     assert_that(resultant_query, equal_to(expected_query))
 
 
+@patch("pandas.Timestamp.utcnow")
+def test_generates_ttl_batch_queries(mocked_utcnow, query_builder):
+    mocked_utcnow.return_value = Timestamp(1998, 3, 25, 12, 0, 1)
+    assert_that(
+        query_builder.generate_ttl_batch_query_from_configuration(BASIC_REL_TTL, 100),
+        equal_to(
+            Query(
+                "MATCH ()-[x: IS_RELATED_TO]->() WHERE x.last_ingested_at <= $earliest_allowed_time "
+                "WITH x LIMIT $batch_size DELETE x RETURN count(*) AS deleted",
+                {"earliest_allowed_time": GREATEST_DAY, "batch_size": 100},
+            )
+        ),
+    )
+    assert_that(
+        query_builder.generate_ttl_delete_by_ids_query_from_configuration(
+            BASIC_NODE_TTL
+        ).query_statement,
+        equal_to(
+            "UNWIND $ids AS expired_id MATCH (x: TestNodeType) WHERE x.last_ingested_at <= $earliest_allowed_time "
+            "AND id(x) = expired_id DETACH DELETE x RETURN count(*) AS deleted"
+        ),
+    )
+
+
 def convert_timestamps(properties: PropertySet):
     for k, v in properties.items():
         if isinstance(v, Timestamp):
@@ -339,3 +364,80 @@ def test_generate_params_null_value():
         key_params,
         equal_to(expected),
     )
+
+
+def test_node_batch_converts_timestamps_by_column(query_builder):
+    nodes = [
+        Node("TestType", {"id": str(i)}, {"seen_at": GREATEST_DAY_TIMESTAMP})
+        for i in range(3)
+    ]
+    operation = OperationOnNodeIdentity(nodes[0].identity_shape, NodeCreationRule.EAGER)
+    batch = query_builder.generate_batch_update_node_operation_batch(operation, nodes)
+    assert_that(
+        batch.parameters,
+        equal_to(
+            [
+                {"__node_id": f"TestType_id:{i}", "seen_at": GREATEST_DAY}
+                for i in range(3)
+            ]
+        ),
+    )
+
+
+def test_node_batch_rejects_non_finite_floats(query_builder):
+    node = Node("TestType", {"id": "foo"}, {"score": float("nan")})
+    operation = OperationOnNodeIdentity(node.identity_shape, NodeCreationRule.EAGER)
+    with pytest.raises(ValueError):
+        query_builder.generate_batch_update_node_operation_batch(operation, [node])
+
+
+def test_hashed_node_ids_keep_key_values_as_properties():
+    query_builder = NeptuneIngestQueryBuilder(node_id_mode="hashed")
+    node = Node("TestType", {"id": "foo"}, {"name": "bar"})
+    operation = OperationOnNodeIdentity(node.identity_shape, NodeCreationRule.EAGER)
+    batch = query_builder.generate_batch_update_node_operation_batch(operation, [node])
+    (row,) = batch.parameters
+    assert_that(len(row["__node_id"]), equal_to(32))
+    assert_that(
+        {k: row[k] for k in ("id", "name")}, equal_to({"id": "foo", "name": "bar"})
+    )
+
+
+def test_node_update_escapes_names_that_are_not_identifiers(query_builder):
+    node = Node("My Type", {"id": "1"}, additional_types=("Other Type",))
+    operation = OperationOnNodeIdentity(node.identity_shape, NodeCreationRule.EAGER)
+    assert_that(
+        query_builder.generate_update_node_operation_query_statement(operation),
+        equal_to(
+            'MERGE (node: `My Type` {`~id` : param.__node_id}) ON CREATE SET node = removeKeyFromMap(param, "__node_id") '
+            'ON MATCH SET node += removeKeyFromMap(param, "__node_id") SET node:`Other Type`'
+        ),
+    )
+
+
+def test_node_update_comparing_properties_only_sets_changes():
+    builder = NeptuneIngestQueryBuilder(
+        statement_cache=StatementCache(), compare_properties=True
+    )
+    operation = OperationOnNodeIdentity(
+        Node("Person", {"id": "1"}).identity_shape, NodeCreationRule.MATCH_ONLY
+    )
+    assert_that(
+        builder.generate_update_node_operation_query_statement(operation),
+        equal_to(
+            "MATCH (node: Person {`~id` : param.__node_id}) SET node.last_ingested_at = coalesce(param.last_ingested_at, node.last_ingested_at) "
+            'WITH node, removeKeyFromMap(param, "__node_id") AS props '
+            "WHERE any(key IN keys(props) WHERE NOT key STARTS WITH 'last_ingested_' AND "
+            "coalesce(properties(node)[key] <> props[key], (properties(node)[key] IS NULL) <> (props[key] IS NULL))) "
+            "SET node += props"
+        ),
+    )
+    # Builders comparing properties do not share statements with those that do not.
+    assert_that(
+        NeptuneIngestQueryBuilder(
+            statement_cache=builder.statement_cache
+        ).generate_update_node_operation_query_statement(operation),
+        equal_to(
+            'MATCH (node: Person {`~id` : param.__node_id}) SET node += removeKeyFromMap(param, "__node_id")'
+        ),
+    )
@@ -0,0 +1,100 @@
+import logging
+
+from hamcrest import assert_that, equal_to
+
+from nodestream_plugin_neptune import metrics as metrics_module
+from nodestream_plugin_neptune.metrics import (
+    Histogram,
+    Metrics,
+    MetricsSink,
+    StatsdSink,
+    statement_tag,
+)
+from nodestream_plugin_neptune.statement_cache import StatementCache
+
+
+def test_statement_tag_is_short_and_stable():
+    assert_that(len(statement_tag("MATCH (n) RETURN n")), equal_to(12))
+    assert_that(
+        statement_tag("MATCH (n) RETURN n"),
+        equal_to(statement_tag("MATCH (n) RETURN n")),
+    )
+
+
+def test_histogram_summary():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.observe(value)
+    summary = histogram.summary()
+    assert_that(summary["count"], equal_to(100))
+    assert_that(summary["mean"], equal_to(50.5))
+    assert_that(summary["min"], equal_to(1))
+    assert_that(summary["p50"], equal_to(51))
+    assert_that(summary["max"], equal_to(100))
+
+
+def test_metrics_are_kept_by_name_and_tags():
+    metrics = Metrics()
+    metrics.increment("retries", tags={"category": "conflict"})
+    metrics.increment("retries", tags={"category": "conflict"})
+    metrics.increment("retries", tags={"category": "throttling"})
+    registry = metrics.registry
+    assert_that(
+        registry.counter_value("retries", {"category": "conflict"}), equal_to(2)
+    )
+    assert_that(
+        registry.counter_value("retries", {"category": "throttling"}), equal_to(1)
+    )
+
+
+def test_metrics_are_forwarded_to_sinks(mocker):
+    sink = mocker.Mock(MetricsSink)
+    metrics = Metrics(sinks=[sink])
+    with metrics.timer("query_build"):
+        pass
+    metrics.gauge("in_flight_requests", 3)
+    sink.timing.assert_called_once()
+    sink.gauge.assert_called_once_with("in_flight_requests", 3, None)
+    metrics.close()
+    sink.close.assert_called_once()
+
+
+def test_summary_is_logged_on_close(caplog):
+    metrics = Metrics(log_summary=True)
+    metrics.histogram("rows_per_request", 10)
+    with caplog.at_level(logging.INFO):
+        metrics.close()
+    (record,) = caplog.records
+    assert_that(record.histograms["rows_per_request"]["count"], equal_to(1))
+
+
+def test_statsd_line_format():
+    sink = StatsdSink(prefix="ingest")
+    line = sink.format("request_latency", 12.5, "ms", {"statement": "abc"})
+    assert_that(line, equal_to(b"ingest.request_latency:12.5|ms|#statement:abc"))
+    sink.close()
+
+
+def test_from_settings_adds_statsd_sink():
+    metrics = Metrics.from_settings(log_summary=True, statsd={"port": 9125})
+    (statsd,) = [sink for sink in metrics.sinks if isinstance(sink, StatsdSink)]
+    assert_that(statsd.address, equal_to(("localhost", 9125)))
+    metrics.close()
+
+
+def test_statement_tags_are_cached_in_a_bounded_cache(mocker):
+    mocker.patch.object(metrics_module, "_STATEMENT_TAGS", StatementCache(2))
+    tags = [statement_tag(f"MATCH (n) RETURN n LIMIT {i}") for i in range(3)]
+    assert_that(len(metrics_module._STATEMENT_TAGS), equal_to(2))
+    assert_that(statement_tag("MATCH (n) RETURN n LIMIT 2"), equal_to(tags[2]))
+
+
+def test_shared_metrics_are_closed_by_their_last_user(mocker):
+    sink = mocker.Mock(MetricsSink)
+    metrics = Metrics(sinks=[sink])
+    metrics.acquire()
+    metrics.acquire()
+    metrics.close()
+    sink.close.assert_not_called()
+    metrics.close()
+    sink.close.assert_called_once()
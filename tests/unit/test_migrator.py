@@ -1,4 +1,5 @@
 import pytest
+from hamcrest import assert_that, equal_to, has_length
 from nodestream.schema.migrations.operations import (
     AddNodeProperty,
     AddRelationshipProperty,
@@ -15,13 +16,52 @@ from nodestream.schema.migrations.operations import (
     RenameRelationshipProperty,
     RenameRelationshipType,
 )
-from nodestream_plugin_neptune.neptune_connection import NeptuneDBConnection
-from nodestream_plugin_neptune.neptune_migrator import NeptuneMigrator
+from nodestream_plugin_neptune.neptune_connection import (
+    NeptuneDBConnection,
+    QueryFailedError,
+)
+from nodestream_plugin_neptune.neptune_migrator import (
+    CLEAR_CHECKPOINTS_QUERY,
+    LOAD_CHECKPOINT_QUERY,
+    SAVE_CHECKPOINT_QUERY,
+    MigrationChunkError,
+    NeptuneMigrator,
+)
+
+
+IDS = ["a", "b", "c"]
+
+
+class FakeGraph:
+    """Answers id scans with `ids` and checkpoint lookups with `checkpoint`."""
+
+    def __init__(self, ids=IDS, checkpoint=None, fail_on_scan=None):
+        self.ids = ids
+        self.checkpoint = checkpoint
+        self.fail_on_scan = fail_on_scan
+        self.scans = 0
+
+    async def stream(self, query, parameters, raise_errors=False):
+        if query == LOAD_CHECKPOINT_QUERY:
+            if self.checkpoint is not None:
+                yield self.checkpoint
+            return
+        self.scans += 1
+        if self.scans == self.fail_on_scan:
+            if raise_errors:
+                raise QueryFailedError(query)
+            return
+        ids = [id for id in self.ids if id > parameters["last_id"]]
+        for id in ids[: parameters["limit"]]:
+            yield {"id": id}
 
 
 @pytest.fixture
 def database_connection(mocker):
-    return mocker.Mock(NeptuneDBConnection)
+    connection = mocker.Mock(NeptuneDBConnection)
+    connection.execute = mocker.AsyncMock(return_value={"results": []})
+    connection.stream = FakeGraph().stream
+    return connection
 
 
 @pytest.fixture
@@ -29,6 +69,21 @@ def migrator(database_connection):
     return NeptuneMigrator(database_connection)
 
 
+def chunks_sent(migrator):
+    return [
+        call.args
+        for call in migrator.database_connection.execute.await_args_list
+        if call.args[0].startswith("UNWIND $ids")
+    ]
+
+
+def assert_ran_in_one_chunk(migrator, query, parameters=None):
+    assert_that(
+        chunks_sent(migrator),
+        equal_to([(query, {**(parameters or {}), "ids": IDS})]),
+    )
+
+
 @pytest.mark.asyncio
 async def test_execute_relationship_key_part_renamed(migrator):
     operation = RelationshipKeyPartRenamed(
@@ -37,8 +92,8 @@ async def test_execute_relationship_key_part_renamed(migrator):
         relationship_type="RELATIONSHIP_TYPE",
     )
     await migrator.execute_operation(operation)
-    expected_query = "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() SET r.`new_key` = r.`old_key` REMOVE r.`old_key`"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id AND r.`old_key` IS NOT NULL SET r.`new_key` = r.`old_key` REMOVE r.`old_key`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -49,8 +104,8 @@ async def test_execute_relationship_property_renamed(migrator):
         relationship_type="RELATIONSHIP_TYPE",
     )
     await migrator.execute_operation(operation)
-    expected_query = "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() SET r.`new_prop` = r.`old_prop` REMOVE r.`old_prop`"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id AND r.`old_prop` IS NOT NULL SET r.`new_prop` = r.`old_prop` REMOVE r.`old_prop`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -59,12 +114,8 @@ async def test_execute_relationship_key_extended(migrator):
         added_key_property="key", relationship_type="RELATIONSHIP_TYPE", default="foo"
     )
     await migrator.execute_operation(operation)
-    expected_query = (
-        "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() SET r.`key` = coalesce(r.`key`, $value)"
-    )
-    migrator.database_connection.execute.assert_called_with(
-        expected_query, {"value": "foo"}
-    )
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id AND r.`key` IS NULL SET r.`key` = $value"
+    assert_ran_in_one_chunk(migrator, expected_query, {"value": "foo"})
 
 
 @pytest.mark.asyncio
@@ -73,12 +124,8 @@ async def test_execute_relationship_property_added(migrator):
         property_name="prop", relationship_type="RELATIONSHIP_TYPE", default="foo"
     )
     await migrator.execute_operation(operation)
-    expected_query = (
-        "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() SET r.`prop` = coalesce(r.`prop`, $value)"
-    )
-    migrator.database_connection.execute.assert_called_with(
-        expected_query, {"value": "foo"}
-    )
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id AND r.`prop` IS NULL SET r.`prop` = $value"
+    assert_ran_in_one_chunk(migrator, expected_query, {"value": "foo"})
 
 
 @pytest.mark.asyncio
@@ -87,16 +134,16 @@ async def test_execute_relationship_property_dropped(migrator):
         property_name="prop", relationship_type="RELATIONSHIP_TYPE"
     )
     await migrator.execute_operation(operation)
-    expected_query = "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() REMOVE r.`prop`"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id AND r.`prop` IS NOT NULL REMOVE r.`prop`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
 async def test_execute_relationship_type_renamed(migrator):
     operation = RenameRelationshipType(old_type="OLD_TYPE", new_type="NEW_TYPE")
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n)-[r:`OLD_TYPE`]->(m) CREATE (n)-[r2:`NEW_TYPE`]->(m) SET r2 += r WITH r DELETE r"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`OLD_TYPE`]->(m) WHERE id(r) = chunk_id CREATE (n)-[r2:`NEW_TYPE`]->(m) SET r2 += r WITH r DELETE r"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -109,16 +156,16 @@ async def test_execute_relationship_type_created(migrator):
 async def test_execute_relationship_type_dropped(migrator):
     operation = DropRelationshipType(name="RELATIONSHIP_TYPE")
     await migrator.execute_operation(operation)
-    expected_query = "MATCH ()-[r:`RELATIONSHIP_TYPE`]->() DELETE r"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n)-[r:`RELATIONSHIP_TYPE`]->(m) WHERE id(r) = chunk_id DELETE r"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
 async def test_execute_node_type_dropped(migrator):
     operation = DropNodeType(name="NodeType")
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n:`NodeType`) DETACH DELETE n"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id DETACH DELETE n"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -147,18 +194,16 @@ async def test_rename_node_property(migrator):
         old_property_name="old_prop", new_property_name="new_prop", node_type="NodeType"
     )
     await migrator.execute_operation(operation)
-    expected_query = (
-        "MATCH (n:`NodeType`) SET n.`new_prop` = n.`old_prop` REMOVE n.`old_prop`"
-    )
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id AND n.`old_prop` IS NOT NULL SET n.`new_prop` = n.`old_prop` REMOVE n.`old_prop`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
 async def test_rename_node_type(migrator):
     operation = RenameNodeType(old_type="OLD_TYPE", new_type="NEW_TYPE")
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n:`OLD_TYPE`) SET n:`NEW_TYPE` REMOVE n:`OLD_TYPE`"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`OLD_TYPE`) WHERE id(n) = chunk_id SET n:`NEW_TYPE` REMOVE n:`OLD_TYPE`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -172,18 +217,16 @@ async def test_add_node_property(migrator):
         property_name="prop", node_type="NodeType", default="foo"
     )
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n:`NodeType`) SET n.`prop` = coalesce(n.`prop`, $value)"
-    migrator.database_connection.execute.assert_called_with(
-        expected_query, {"value": "foo"}
-    )
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id AND n.`prop` IS NULL SET n.`prop` = $value"
+    assert_ran_in_one_chunk(migrator, expected_query, {"value": "foo"})
 
 
 @pytest.mark.asyncio
 async def test_drop_node_property(migrator):
     operation = DropNodeProperty(property_name="prop", node_type="NodeType")
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n:`NodeType`) REMOVE n.`prop`"
-    migrator.database_connection.execute.assert_called_with(expected_query, {})
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id AND n.`prop` IS NOT NULL REMOVE n.`prop`"
+    assert_ran_in_one_chunk(migrator, expected_query)
 
 
 @pytest.mark.asyncio
@@ -192,10 +235,8 @@ async def test_node_key_extended_with_default(migrator):
         added_key_property="key", node_type="NodeType", default="foo"
     )
     await migrator.execute_operation(operation)
-    expected_query = "MATCH (n:`NodeType`) SET n.`key` = coalesce(n.`key`, $value)"
-    migrator.database_connection.execute.assert_called_with(
-        expected_query, {"value": "foo"}
-    )
+    expected_query = "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id AND n.`key` IS NULL SET n.`key` = $value"
+    assert_ran_in_one_chunk(migrator, expected_query, {"value": "foo"})
 
 
 @pytest.mark.asyncio
@@ -205,6 +246,134 @@ async def test_node_key_renamed(migrator, mocker):
         new_key_part_name="key", node_type="NodeType", old_key_part_name="foo"
     )
     await migrator.execute_operation(operation)
-    migrator.database_connection.execute.assert_called_with(
-        "MATCH (n:`NodeType`) SET n.`key` = n.`foo` REMOVE n.`foo`", {}
+    assert_ran_in_one_chunk(
+        migrator,
+        "UNWIND $ids AS chunk_id MATCH (n:`NodeType`) WHERE id(n) = chunk_id AND n.`foo` IS NOT NULL SET n.`key` = n.`foo` REMOVE n.`foo`",
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_completed_migrations(migrator, mocker):
+    async def stream(query, parameters):
+        for name in ("first", "second"):
+            yield {"name": name}
+
+    migrator.database_connection.stream = stream
+    graph = mocker.Mock()
+    graph.get_migration.side_effect = lambda name: f"migration-{name}"
+    completed = await migrator.get_completed_migrations(graph)
+    assert completed == ["migration-first", "migration-second"]
+
+
+@pytest.mark.asyncio
+async def test_operations_run_in_concurrent_chunks_with_checkpoints(migrator):
+    migrator.chunk_size = 2
+    migrator.concurrency = 2
+    await migrator.execute_operation(DropNodeType(name="NodeType"))
+    assert_that(
+        [parameters["ids"] for _, parameters in chunks_sent(migrator)],
+        equal_to([["a", "b"], ["c"]]),
     )
+    checkpoints = [
+        (call.args[1]["last_id"], call.args[1]["done"])
+        for call in migrator.database_connection.execute.await_args_list
+        if call.args[0] == SAVE_CHECKPOINT_QUERY
+    ]
+    assert_that(checkpoints, equal_to([("b", False), ("c", False), ("c", True)]))
+    migrator.database_connection.execute.assert_awaited_with(
+        CLEAR_CHECKPOINTS_QUERY,
+        {"prefix": migrator.checkpoint_key(DropNodeType("NodeType"))},
+    )
+
+
+@pytest.mark.asyncio
+async def test_operations_resume_after_their_checkpoint(migrator):
+    migrator.database_connection.stream = FakeGraph(
+        checkpoint={"last_id": "a", "done": False}
+    ).stream
+    await migrator.execute_operation(DropNodeType(name="NodeType"))
+    assert_that(chunks_sent(migrator)[0][1]["ids"], equal_to(["b", "c"]))
+
+
+@pytest.mark.asyncio
+async def test_completed_operations_are_skipped(migrator):
+    migrator.database_connection.stream = FakeGraph(
+        checkpoint={"last_id": "c", "done": True}
+    ).stream
+    await migrator.execute_operation(DropNodeType(name="NodeType"))
+    assert_that(chunks_sent(migrator), equal_to([]))
+
+
+@pytest.mark.asyncio
+async def test_failed_chunks_stop_the_operation_at_the_last_checkpoint(migrator):
+    migrator.chunk_size = 1
+    migrator.concurrency = 1
+    responses = [{"results": []}, None]
+    migrator.database_connection.execute.side_effect = (
+        lambda query, parameters: responses.pop(0)
+        if query.startswith("UNWIND")
+        else {"results": []}
+    )
+    with pytest.raises(MigrationChunkError):
+        await migrator.execute_operation(DropNodeType(name="NodeType"))
+    saved = [
+        call.args[1]
+        for call in migrator.database_connection.execute.await_args_list
+        if call.args[0] == SAVE_CHECKPOINT_QUERY
+    ]
+    assert_that(saved[-1]["last_id"], equal_to("a"))
+    assert_that(saved[-1]["done"], equal_to(False))
+
+
+@pytest.mark.asyncio
+async def test_failed_scans_stop_the_operation_at_the_last_checkpoint(migrator):
+    migrator.chunk_size = 1
+    migrator.concurrency = 1
+    migrator.database_connection.stream = FakeGraph(fail_on_scan=2).stream
+    with pytest.raises(MigrationChunkError):
+        await migrator.execute_operation(DropNodeType(name="NodeType"))
+    saved = [
+        call.args[1]
+        for call in migrator.database_connection.execute.await_args_list
+        if call.args[0] == SAVE_CHECKPOINT_QUERY
+    ]
+    assert_that(
+        saved,
+        equal_to([{"operation": saved[0]["operation"], "last_id": "a", "done": False}]),
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failing_save", [1, 3])
+async def test_failed_checkpoint_saves_stop_the_operation(migrator, failing_save):
+    migrator.chunk_size = 2
+    migrator.concurrency = 1
+    saves = []
+
+    async def execute(query, parameters):
+        if query == SAVE_CHECKPOINT_QUERY:
+            saves.append(parameters)
+            if len(saves) == failing_save:
+                return None
+        return {"results": []}
+
+    migrator.database_connection.execute.side_effect = execute
+    with pytest.raises(MigrationChunkError):
+        await migrator.execute_operation(DropNodeType(name="NodeType"))
+    assert_that(saves, has_length(failing_save))
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_are_cleared_once_the_migration_is_executed(migrator, mocker):
+    migration = mocker.Mock()
+    migration.name = "0001"
+    await migrator.mark_migration_as_executed(migration)
+    migrator.database_connection.execute.assert_awaited_with(
+        CLEAR_CHECKPOINTS_QUERY, {"prefix": "0001/"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_adding_properties_without_default_does_nothing(migrator):
+    await migrator.execute_operation(AddNodeProperty("NodeType", "prop", None))
+    migrator.database_connection.execute.assert_not_awaited()
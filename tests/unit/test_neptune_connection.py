@@ -1,9 +1,21 @@
+import asyncio
+
 import pytest
+from botocore.exceptions import ClientError
 from hamcrest import assert_that, equal_to
 from nodestream_plugin_neptune.neptune_connection import (
     NeptuneAnalyticsConnection,
     NeptuneDBConnection,
+    QueryFailedError,
+)
+from nodestream_plugin_neptune.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    RequestTimeoutError,
 )
+from nodestream_plugin_neptune.metrics import statement_tag
+from nodestream_plugin_neptune.request_scheduler import RequestScheduler
+from nodestream_plugin_neptune.retry_policy import RetryPolicy
 
 
 @pytest.mark.asyncio
@@ -24,9 +36,21 @@ async def test_client_has_region_registered_analytics():
         assert_that(client.meta.region_name, equal_to("test-region"))
 
 
+OK_RESPONSE = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+def client_context(mocker, *_):
+    """Returns a mocked client context manager whose queries succeed."""
+    context_manager = mocker.AsyncMock()
+    client = context_manager.__aenter__.return_value
+    client.execute_open_cypher_query.return_value = OK_RESPONSE
+    client.execute_query.return_value = OK_RESPONSE
+    return context_manager
+
+
 @pytest.mark.asyncio
 async def test_client_open_close_once_db(mocker):
-    context_manager = mocker.AsyncMock()
+    context_manager = client_context(mocker)
     connection: NeptuneDBConnection = NeptuneDBConnection(
         host="https://test-endpoint.com", region="test-region"
     )
@@ -40,7 +64,7 @@ async def test_client_open_close_once_db(mocker):
 
 @pytest.mark.asyncio
 async def test_client_open_close_once_analytics(mocker):
-    context_manager = mocker.AsyncMock()
+    context_manager = client_context(mocker)
     connection: NeptuneAnalyticsConnection = NeptuneAnalyticsConnection(
         graph_id="test_id", region="test-region"
     )
@@ -96,3 +120,299 @@ async def test_same_clients_analytics():
     og_client = connection.client
     await connection.execute("test_query", "test_params")
     assert_that(og_client, equal_to(connection.client))
+
+
+@pytest.mark.asyncio
+async def test_client_pool_spreads_clients(mocker):
+    connection: NeptuneDBConnection = NeptuneDBConnection(
+        host="https://test-endpoint.com", region="test-region", client_pool_size=2
+    )
+    connection._create_boto_client = mocker.Mock(
+        side_effect=lambda *_: client_context(mocker)
+    )
+    await connection.execute("test_query", "test_params")
+    assert_that(connection._create_boto_client.call_count, equal_to(2))
+    await connection.close()
+    for context_manager in connection.client_pool.context_managers:
+        context_manager.__aexit__.assert_awaited_once()
+
+
+def test_client_connections_sized_to_share_of_in_flight_requests():
+    connection: NeptuneDBConnection = NeptuneDBConnection(
+        host="https://test-endpoint.com",
+        scheduler=RequestScheduler(max_in_flight=40),
+        client_pool_size=4,
+    )
+    assert_that(connection.client_config.max_pool_connections, equal_to(10))
+
+
+@pytest.mark.asyncio
+async def test_read_only_queries_use_reader_endpoints(mocker):
+    connection: NeptuneDBConnection = NeptuneDBConnection(
+        host="https://writer.com",
+        region="test-region",
+        reader_endpoints=["https://reader-1.com", "https://reader-2.com"],
+    )
+    connection._create_boto_client = mocker.Mock(
+        side_effect=lambda *_: client_context(mocker)
+    )
+    await connection.execute("test_query", "test_params", read_only=True)
+    endpoints = [c.args[0] for c in connection._create_boto_client.call_args_list]
+    assert_that(endpoints, equal_to(["https://reader-1.com", "https://reader-2.com"]))
+    assert_that(connection.client, equal_to(None))
+
+
+def test_reader_endpoints_not_supported_for_analytics():
+    with pytest.raises(ValueError):
+        NeptuneAnalyticsConnection.from_configuration(
+            graph_id="test_id", reader_endpoints=["https://reader-1.com"]
+        )
+
+
+class ConcurrentModificationException(ClientError):
+    pass
+
+
+def conflict_error():
+    return ConcurrentModificationException(
+        {
+            "Error": {"Code": "ConcurrentModificationException"},
+            "ResponseMetadata": {"HTTPStatusCode": 500},
+        },
+        "ExecuteOpenCypherQuery",
+    )
+
+
+@pytest.fixture
+def connection_with_client(mocker):
+    connection: NeptuneDBConnection = NeptuneDBConnection(
+        host="https://test-endpoint.com",
+        region="test-region",
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0, max_delay=0),
+    )
+    client = mocker.AsyncMock()
+    client.exceptions.ConcurrentModificationException = ConcurrentModificationException
+    client.exceptions.AccessDeniedException = PermissionError
+    connection._create_boto_client = mocker.Mock(return_value=mocker.AsyncMock())
+    connection._create_boto_client.return_value.__aenter__.return_value = client
+    return connection, client
+
+
+@pytest.mark.asyncio
+async def test_retries_conflicts_until_success(connection_with_client, mocker):
+    connection, client = connection_with_client
+    response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    client.execute_open_cypher_query.side_effect = [conflict_error(), response]
+    on_retry = mocker.Mock()
+    result = await connection.execute("test_query", {}, on_retry=on_retry)
+    assert_that(result, equal_to(response))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(2))
+    on_retry.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts(connection_with_client, mocker):
+    connection, client = connection_with_client
+    client.execute_open_cypher_query.side_effect = conflict_error()
+    on_error = mocker.Mock()
+    result = await connection.execute("test_query", {}, on_error=on_error)
+    assert_that(result, equal_to(None))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(3))
+    on_error.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_bad_requests(connection_with_client):
+    connection, client = connection_with_client
+    client.execute_open_cypher_query.side_effect = ClientError(
+        {
+            "Error": {"Code": "MalformedQueryException"},
+            "ResponseMetadata": {"HTTPStatusCode": 400},
+        },
+        "ExecuteOpenCypherQuery",
+    )
+    assert_that(await connection.execute("test_query", {}), equal_to(None))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(1))
+
+
+def responds_after(*delays):
+    delays = list(delays)
+
+    async def execute_open_cypher_query(**kwargs):
+        await asyncio.sleep(delays.pop(0))
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    return execute_open_cypher_query
+
+
+@pytest.mark.asyncio
+async def test_retries_attempts_exceeding_request_timeout(connection_with_client):
+    connection, client = connection_with_client
+    connection.request_timeout = 0.01
+    client.execute_open_cypher_query.side_effect = responds_after(10, 0)
+    errors = []
+    result = await connection.execute(
+        "test_query", {}, on_retry=errors.append, on_error=errors.append
+    )
+    assert_that(result["ResponseMetadata"]["HTTPStatusCode"], equal_to(200))
+    assert_that([type(error) for error in errors], equal_to([RequestTimeoutError]))
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_timed_out_creates(connection_with_client, mocker):
+    connection, client = connection_with_client
+    connection.request_timeout = 0.01
+    client.execute_open_cypher_query.side_effect = responds_after(10, 0)
+    on_error = mocker.Mock()
+    result = await connection.execute(
+        "MATCH (a), (b) CREATE (a)-[:R]->(b)", {}, on_error=on_error
+    )
+    assert_that(result, equal_to(None))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(1))
+    (error,), _ = on_error.call_args
+    assert_that(isinstance(error, RequestTimeoutError), equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_gives_up_at_deadline(connection_with_client, mocker):
+    connection, client = connection_with_client
+    connection.request_timeout = 0.02
+    client.execute_open_cypher_query.side_effect = responds_after(10, 10, 10)
+    on_error = mocker.Mock()
+    result = await connection.execute(
+        "test_query", {}, on_error=on_error, deadline=Deadline.after(0.03)
+    )
+    assert_that(result, equal_to(None))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(2))
+    (error,), _ = on_error.call_args
+    assert_that(isinstance(error, DeadlineExceededError), equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_does_not_wait_to_retry_past_deadline(connection_with_client, mocker):
+    connection, client = connection_with_client
+    connection.retry_policy = RetryPolicy(base_delay=10, max_delay=10)
+    client.execute_open_cypher_query.side_effect = conflict_error()
+    on_error = mocker.Mock()
+    result = await asyncio.wait_for(
+        connection.execute(
+            "test_query", {}, on_error=on_error, deadline=Deadline.after(1)
+        ),
+        timeout=1,
+    )
+    assert_that(result, equal_to(None))
+    assert_that(client.execute_open_cypher_query.await_count, equal_to(1))
+    (error,), _ = on_error.call_args
+    assert_that(isinstance(error, DeadlineExceededError), equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_analytics_payload(mocker):
+    connection = NeptuneAnalyticsConnection(graph_id="test_id", region="test-region")
+    payload = mocker.Mock()
+
+    async def iter_chunks():
+        yield b'{"results": [{"name": "a"},'
+        yield b' {"name": "b"}]}'
+
+    payload.iter_chunks = iter_chunks
+    client = mocker.AsyncMock()
+    client.execute_query.return_value = {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "payload": payload,
+    }
+    connection._create_boto_client = mocker.Mock(return_value=mocker.AsyncMock())
+    connection._create_boto_client.return_value.__aenter__.return_value = client
+
+    records = [record async for record in connection.stream("test_query", {})]
+    assert_that(records, equal_to([{"name": "a"}, {"name": "b"}]))
+    payload.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_records_bytes_sent_analytics(mocker):
+    connection = NeptuneAnalyticsConnection(graph_id="test_id", region="test-region")
+    client = mocker.AsyncMock()
+    client.execute_query.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    connection._create_boto_client = mocker.Mock(return_value=mocker.AsyncMock())
+    connection._create_boto_client.return_value.__aenter__.return_value = client
+    await connection.execute("test_query", {"params": [{"a": 1}]})
+    histogram = connection.metrics.registry.histogram_for("bytes_sent")
+    assert_that(histogram.count, equal_to(1))
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_database_results(connection_with_client):
+    connection, client = connection_with_client
+    client.execute_open_cypher_query.return_value = {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "results": [{"name": "a"}],
+    }
+    records = [record async for record in connection.stream("test_query", {})]
+    assert_that(records, equal_to([{"name": "a"}]))
+
+
+@pytest.mark.asyncio
+async def test_stream_raises_failed_queries_if_asked_to(connection_with_client):
+    connection, client = connection_with_client
+    client.execute_open_cypher_query.side_effect = ClientError(
+        {
+            "Error": {"Code": "MalformedQueryException"},
+            "ResponseMetadata": {"HTTPStatusCode": 400},
+        },
+        "ExecuteOpenCypherQuery",
+    )
+    records = [record async for record in connection.stream("test_query", {})]
+    assert_that(records, equal_to([]))
+    with pytest.raises(QueryFailedError) as error:
+        async for _ in connection.stream("test_query", {}, raise_errors=True):
+            pass
+    assert_that(isinstance(error.value.__cause__, ClientError), equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_records_request_metrics(connection_with_client):
+    connection, client = connection_with_client
+    response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    client.execute_open_cypher_query.side_effect = [conflict_error(), response]
+    await connection.execute("test_query", {"params": [1, 2]})
+    registry = connection.metrics.registry
+    tags = {"statement": statement_tag("test_query")}
+    assert_that(registry.histogram_for("request_latency", tags).count, equal_to(2))
+    assert_that(registry.histogram_for("bytes_sent").count, equal_to(2))
+    assert_that(
+        registry.counter_value("retries", {"category": "conflict"}), equal_to(1)
+    )
+    assert_that(connection.in_flight_requests, equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_parameters_that_cannot_be_serialized_fail_the_query(
+    connection_with_client, mocker
+):
+    connection, client = connection_with_client
+    on_error = mocker.Mock()
+    result = await connection.execute(
+        "test_query", {"params": [{"value": float("nan")}]}, on_error=on_error
+    )
+    assert_that(result, equal_to(None))
+    client.execute_open_cypher_query.assert_not_awaited()
+    (error,), _ = on_error.call_args
+    assert_that(isinstance(error, ValueError), equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_parameters_are_serialized_once_per_request(
+    connection_with_client, mocker
+):
+    connection, client = connection_with_client
+    response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    client.execute_open_cypher_query.side_effect = [conflict_error(), response]
+    serialize = mocker.patch(
+        "nodestream_plugin_neptune.neptune_connection.serialize_parameters",
+        return_value='{"params":[]}',
+    )
+    await connection.execute("test_query", {"params": []})
+    serialize.assert_called_once_with({"params": []})
+    sent = client.execute_open_cypher_query.await_args.kwargs["parameters"]
+    assert_that(sent, equal_to('{"params":[]}'))
@@ -43,6 +43,17 @@ def test_make_type_retriever(mocker):
     assert_that(retriever.connector, equal_to(connector))
 
 
+def test_from_file_data_type_retrieval_settings():
+    connector: NeptuneConnector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        type_retrieval={"page_size": 200, "parallelism": 8},
+    )
+    retriever: NeptuneDBTypeRetriever = connector.make_type_retriever()
+    assert_that(retriever.page_size, equal_to(200))
+    assert_that(retriever.parallelism, equal_to(8))
+
+
 def test_from_file_data_host():
     connector: NeptuneConnector = NeptuneConnector.from_file_data(
         mode="database",
@@ -110,6 +121,13 @@ def test_include_label_in_id():
     assert_that(connector.ingest_query_builder.include_label_in_id, equal_to(False))
 
 
+def test_node_id_mode():
+    connector: NeptuneConnector = NeptuneConnector.from_file_data(
+        mode="database", host="testEndpoint.com", node_id_mode="hashed"
+    )
+    assert_that(connector.ingest_query_builder.node_ids.mode, equal_to("hashed"))
+
+
 def test_include_label_in_id_default_true():
     connector: NeptuneConnector = NeptuneConnector.from_file_data(
         mode="database", host="testEndpoint.com"
@@ -147,3 +165,38 @@ def test_default_region_analytics():
     )
     assert_that(connector.connection.region, equal_to(None))
     assert_that(connector.region, equal_to(None))
+
+
+def test_partition_sizing_passed_to_executor():
+    connector: NeptuneConnector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        partition_sizing={"initial_size": 500, "max_size": 1000},
+    )
+    executor: NeptuneQueryExecutor = connector.make_query_executor()
+    assert_that(executor.partition_sizer, equal_to(connector.partition_sizer))
+    assert_that(executor.partition_sizer.partition_size("query"), equal_to(500))
+
+
+def test_request_limits_passed_to_connection():
+    connector: NeptuneConnector = NeptuneConnector.from_file_data(
+        mode="analytics",
+        graph_id="graph_identifier",
+        max_in_flight_requests=4,
+        max_queued_requests=8,
+    )
+    assert_that(connector.connection.scheduler.max_in_flight, equal_to(4))
+    assert_that(connector.connection.scheduler.max_queued, equal_to(8))
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_closed_once_every_executor_finished(mocker):
+    connector = NeptuneConnector.from_file_data(
+        mode="database", host="testEndpoint.com", region="us-west-2"
+    )
+    close = mocker.patch.object(connector.connection.metrics.registry, "close")
+    first, second = connector.make_query_executor(), connector.make_query_executor()
+    await first.finish()
+    close.assert_not_called()
+    await second.finish()
+    close.assert_called_once()
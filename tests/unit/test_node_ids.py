@@ -0,0 +1,101 @@
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream.model import Node
+
+from nodestream_plugin_neptune.node_ids import NodeIdGenerator
+
+
+@pytest.fixture
+def generator():
+    return NodeIdGenerator()
+
+
+def test_ids_use_sorted_keys_and_type(generator):
+    node = Node("Person", {"last": "Doe", "first": "Jane"})
+    assert_that(generator.generate_id(node), equal_to("Person_first:Jane_last:Doe"))
+
+
+def test_label_can_be_left_out_of_ids():
+    generator = NodeIdGenerator(include_label_in_id=False)
+    assert_that(generator.generate_id(Node("Person", {"id": 1})), equal_to("id:1"))
+
+
+def test_falsy_key_values_are_left_empty(generator):
+    node = Node("Person", {"id": None, "rank": 0})
+    assert_that(generator.generate_id(node), equal_to("Person_id:_rank:"))
+
+
+def test_nodes_without_keys_get_the_type_prefix(generator):
+    assert_that(generator.generate_id(Node("Person", {})), equal_to("Person_"))
+
+
+def test_generates_ids_of_mixed_batches(generator):
+    nodes = [
+        Node("Person", {"id": 1}),
+        Node("Person", {"name": "a"}),
+        Node("Company", {"name": "a"}),
+        Node("Person", {"id": True}),
+        Node("Person", {"id": [1, 2]}),
+        Node("Odd{Type}", {"k{e}y": "v"}),
+    ]
+    assert_that(
+        generator.generate_ids(nodes),
+        equal_to(
+            [
+                "Person_id:1",
+                "Person_name:a",
+                "Company_name:a",
+                "Person_id:True",
+                "Person_id:[1, 2]",
+                "Odd{Type}_k{e}y:v",
+            ]
+        ),
+    )
+
+
+def test_repeated_nodes_come_from_the_cache(generator):
+    nodes = [Node("Person", {"id": i % 10}) for i in range(100)]
+    generator.generate_ids(nodes)
+    info = generator.cache_info()
+    assert_that((info.hits, info.misses), equal_to((90, 10)))
+
+
+def test_cache_is_bounded():
+    generator = NodeIdGenerator(cache_size=5)
+    generator.generate_ids(Node("Person", {"id": i}) for i in range(100))
+    assert_that(generator.cache_info().currsize, equal_to(5))
+
+
+def test_hashed_ids_are_stable_and_fixed_length():
+    generator = NodeIdGenerator(mode="hashed")
+    short = generator.generate_id(Node("Person", {"id": 1}))
+    long = generator.generate_id(Node("Person", {"id": "x" * 1000}))
+    assert_that((len(short), len(long)), equal_to((32, 32)))
+    assert_that(
+        short,
+        equal_to(NodeIdGenerator(mode="hashed").generate_id(Node("Person", {"id": 1}))),
+    )
+    assert_that(
+        short == generator.generate_id(Node("Company", {"id": 1})), equal_to(False)
+    )
+
+
+def test_hashed_ids_do_not_collide_on_ambiguous_key_values():
+    generator = NodeIdGenerator(mode="hashed")
+    nodes = [
+        Node("Person", {"a": "x_b:y"}),
+        Node("Person", {"a": "x", "b": "y"}),
+        Node("Person_a:x", {"b": "y"}),
+        Node("Person", {"id": None}),
+        Node("Person", {"id": ""}),
+        Node("Person", {"id": 0}),
+        Node("Person", {"id": False}),
+        Node("Person", {"id": "0"}),
+    ]
+    ids = generator.generate_ids(nodes)
+    assert_that(len(set(ids)), equal_to(len(nodes)))
+
+
+def test_rejects_unknown_id_modes():
+    with pytest.raises(ValueError):
+        NodeIdGenerator(mode="short")
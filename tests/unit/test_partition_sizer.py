@@ -0,0 +1,97 @@
+import pytest
+from hamcrest import assert_that, equal_to, greater_than, less_than
+from nodestream_plugin_neptune.partition_sizer import (
+    AdaptivePartitionSizer,
+    estimate_parameter_bytes,
+    estimate_payload_bytes,
+)
+
+QUERY = "UNWIND $params as param MERGE (n:Test {`~id`: param.__node_id})"
+OTHER_QUERY = "UNWIND $params as param MATCH (n:Other {`~id`: param.__node_id})"
+
+
+@pytest.fixture
+def sizer():
+    return AdaptivePartitionSizer(
+        initial_size=100,
+        min_size=10,
+        max_size=400,
+        target_latency=1.0,
+        max_payload_bytes=100_000,
+        growth_step=50,
+    )
+
+
+def test_starts_at_initial_size(sizer):
+    assert_that(sizer.partition_size(QUERY), equal_to(100))
+
+
+def test_grows_on_fast_full_requests(sizer):
+    sizer.record_success(QUERY, rows=100, latency=0.1, payload_bytes=1_000)
+    assert_that(sizer.partition_size(QUERY), equal_to(150))
+
+
+def test_does_not_grow_on_partial_requests(sizer):
+    sizer.record_success(QUERY, rows=20, latency=0.1, payload_bytes=200)
+    assert_that(sizer.partition_size(QUERY), equal_to(100))
+
+
+def test_growth_is_capped_at_max_size(sizer):
+    for _ in range(20):
+        size = sizer.partition_size(QUERY)
+        sizer.record_success(QUERY, rows=size, latency=0.1, payload_bytes=size)
+    assert_that(sizer.partition_size(QUERY), equal_to(400))
+
+
+def test_shrinks_on_slow_requests(sizer):
+    sizer.record_success(QUERY, rows=100, latency=4.0, payload_bytes=1_000)
+    assert_that(sizer.partition_size(QUERY), equal_to(50))
+
+
+def test_shrinks_on_conflicts_and_failures(sizer):
+    sizer.record_conflict(QUERY)
+    assert_that(sizer.partition_size(QUERY), equal_to(50))
+    sizer.record_failure(QUERY)
+    assert_that(sizer.partition_size(QUERY), equal_to(25))
+    for _ in range(10):
+        sizer.record_failure(QUERY)
+    assert_that(sizer.partition_size(QUERY), equal_to(10))
+
+
+def test_capped_by_payload_bytes(sizer):
+    # 2000 bytes per row allows at most 50 rows in 100_000 bytes.
+    sizer.record_success(QUERY, rows=100, latency=0.1, payload_bytes=200_000)
+    assert_that(sizer.partition_size(QUERY), equal_to(50))
+
+
+def test_sizes_are_tracked_per_statement(sizer):
+    sizer.record_conflict(QUERY)
+    sizer.record_success(OTHER_QUERY, rows=100, latency=0.1, payload_bytes=100)
+    assert_that(sizer.partition_size(QUERY), less_than(100))
+    assert_that(sizer.partition_size(OTHER_QUERY), greater_than(100))
+
+
+def test_non_adaptive_sizer_keeps_initial_size():
+    sizer = AdaptivePartitionSizer(initial_size=150, adaptive=False)
+    sizer.record_conflict(QUERY)
+    sizer.record_success(QUERY, rows=150, latency=0.1, payload_bytes=100)
+    assert_that(sizer.partition_size(QUERY), equal_to(150))
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        AdaptivePartitionSizer(initial_size=5, min_size=10)
+
+
+def test_estimate_payload_bytes():
+    rows = [{"a": 1}] * 10
+    assert_that(estimate_payload_bytes(rows), equal_to(len('{"a": 1}') * 10))
+    assert_that(estimate_payload_bytes([]), equal_to(0))
+
+
+def test_estimate_parameter_bytes():
+    parameters = {"params": [{"a": 1}] * 10, "limit": 5}
+    assert_that(
+        estimate_parameter_bytes(parameters),
+        equal_to(len("params") + len('{"a": 1}') * 10 + len("limit") + 1),
+    )
@@ -0,0 +1,94 @@
+import pytest
+from hamcrest import assert_that, equal_to, has_length
+from nodestream.schema import (
+    Adjacency,
+    AdjacencyCardinality,
+    GraphObjectSchema,
+    Schema,
+)
+
+from nodestream_plugin_neptune import NeptuneConnector
+from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
+from nodestream_plugin_neptune.precompilation import (
+    MalformedStatementError,
+    check_statement,
+    precompile_statements,
+)
+from nodestream_plugin_neptune.statement_cache import StatementCache
+from nodestream_plugin_neptune.ttl import BatchedTimeToLive
+
+
+SCHEMA_FILE = """
+nodes:
+  - name: Person
+    properties:
+      id: {type: STRING, is_key: true}
+relationships:
+  - name: KNOWS
+    properties:
+      since: {type: STRING, is_key: true}
+cardinalities:
+  - adjacency: {from_node_type: Person, to_node_type: Person, relationship_type: KNOWS}
+    cardinality: {from_side_cardinality: SINGLE, to_side_cardinality: MANY}
+"""
+
+
+@pytest.fixture
+def schema():
+    schema = Schema()
+    person = GraphObjectSchema("Person")
+    person.add_key("id")
+    knows = GraphObjectSchema("KNOWS")
+    knows.add_key("since")
+    schema.put_node_type(person)
+    schema.put_relationship_type(knows)
+    schema.add_adjacency(Adjacency("Person", "Person", "KNOWS"), AdjacencyCardinality())
+    return schema
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "MATCH (n: `Odd (type``` {`~id` : param.id}) RETURN n",
+        'MATCH (n) WHERE n.name = "a ) \\" [" RETURN n',
+        "RETURN [1, {a: (2)}]",
+    ],
+)
+def test_check_statement_accepts_balanced_statements(statement):
+    check_statement(statement)
+
+
+@pytest.mark.parametrize(
+    "statement",
+    ["MATCH (n RETURN n", "MATCH (n)] RETURN n", "MATCH (n: `Person) RETURN n"],
+)
+def test_check_statement_rejects_malformed_statements(statement):
+    with pytest.raises(MalformedStatementError):
+        check_statement(statement)
+
+
+def test_precompile_statements_renders_upserts_and_ttls(schema):
+    builder = NeptuneIngestQueryBuilder(statement_cache=StatementCache())
+    precompiled = precompile_statements(
+        schema, builder, BatchedTimeToLive(None, builder)
+    )
+    # Fuzzy and match only nodes share their statement.
+    assert_that(precompiled.upserts, has_length(4))
+    assert_that(precompiled.ttls, has_length(2))
+    assert_that(len(builder.statement_cache), equal_to(5))
+    assert_that(builder.statement_cache.info().hit_rate, equal_to(0.0))
+
+
+def test_connector_precompiles_the_schema_file(tmp_path):
+    path = tmp_path / "schema.yaml"
+    path.write_text(SCHEMA_FILE)
+    connector = NeptuneConnector.from_file_data(
+        mode="database",
+        host="testEndpoint.com",
+        region="us-west-2",
+        statement_cache_size=100,
+        precompile={"schema": str(path), "warm_plan_cache": True},
+    )
+    assert_that(len(connector.precompiled), equal_to(6))
+    executor = connector.make_query_executor()
+    assert_that(executor.plan_cache_statements, equal_to(connector.precompiled.upserts))
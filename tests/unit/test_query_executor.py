@@ -1,10 +1,36 @@
+import asyncio
+
 import pytest
-from hamcrest import assert_that
-from nodestream.model import TimeToLiveConfiguration
+from botocore.exceptions import ClientError, ReadTimeoutError
+from hamcrest import assert_that, equal_to
+from nodestream.databases.query_executor import (
+    OperationOnNodeIdentity,
+    OperationOnRelationshipIdentity,
+)
+from nodestream.model import (
+    Node,
+    NodeCreationRule,
+    Relationship,
+    RelationshipCreationRule,
+    RelationshipWithNodes,
+    TimeToLiveConfiguration,
+)
 from nodestream.schema import GraphObjectType
+from nodestream_plugin_neptune.change_detection import FingerprintCache
+from nodestream_plugin_neptune.deadline import (
+    DeadlineExceededError,
+    RequestTimeoutError,
+)
+from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
 from nodestream_plugin_neptune.neptune_connection import NeptuneConnection
 from nodestream_plugin_neptune.neptune_query_executor import NeptuneQueryExecutor
+from nodestream_plugin_neptune.partition_sizer import AdaptivePartitionSizer
+from nodestream_plugin_neptune.precompilation import MalformedStatementError
 from nodestream_plugin_neptune.query import Query, QueryBatch
+from nodestream_plugin_neptune.metrics import Metrics, statement_tag
+from nodestream_plugin_neptune.request_scheduler import RequestScheduler
+from nodestream_plugin_neptune.retry_policy import RetryPolicy
+from nodestream_plugin_neptune.write_buffer import WriteBuffer, WriteBufferSettings
 
 from .matchers import ran_query
 
@@ -23,6 +49,8 @@ def some_query_batch(some_query):
 def query_executor(mocker):
     ingest_query_builder_mock = mocker.Mock()
     database_connection = mocker.AsyncMock(NeptuneConnection)
+    database_connection.scheduler = RequestScheduler()
+    database_connection.metrics = Metrics()
     return NeptuneQueryExecutor(database_connection, ingest_query_builder_mock)
 
 
@@ -58,8 +86,10 @@ async def test_upsert_rel_in_bulk_of_same_shape(
 
 
 @pytest.mark.asyncio
-async def test_perform_ttl_op(query_executor, some_query):
-    ttl_config = TimeToLiveConfiguration(GraphObjectType.NODE, "NodeType")
+async def test_perform_ttl_op_with_custom_query(query_executor, some_query):
+    ttl_config = TimeToLiveConfiguration(
+        GraphObjectType.NODE, "NodeType", custom_query=some_query.query_statement
+    )
     query_generator = (
         query_executor.ingest_query_builder.generate_ttl_query_from_configuration
     )
@@ -69,6 +99,15 @@ async def test_perform_ttl_op(query_executor, some_query):
     assert_that(query_executor, ran_query(some_query))
 
 
+@pytest.mark.asyncio
+async def test_perform_ttl_op_deletes_in_batches(query_executor, mocker):
+    ttl_config = TimeToLiveConfiguration(GraphObjectType.NODE, "NodeType")
+    query_executor.time_to_live.expire = mocker.AsyncMock(return_value=10)
+    await query_executor.perform_ttl_op(ttl_config)
+    query_executor.time_to_live.expire.assert_awaited_once_with(ttl_config)
+    query_executor.database_connection.execute.assert_not_awaited()
+
+
 @pytest.mark.asyncio
 async def test_execute_hook(query_executor, some_query, mocker):
     hook = mocker.Mock()
@@ -85,3 +124,341 @@ async def test_close_client_once(query_executor, mocker):
     query_executor.database_connection.close = mocker.AsyncMock()
     await query_executor.finish()
     query_executor.database_connection.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_splits_by_partition_size(query_executor):
+    query_executor.partition_sizer = AdaptivePartitionSizer(
+        initial_size=4, min_size=1, adaptive=False
+    )
+    batch = QueryBatch("MATCH (n) RETURN n", [{"id": i} for i in range(10)])
+    await query_executor.execute_batch(batch)
+
+    sent = [
+        c.args[1]["params"]
+        for c in query_executor.database_connection.execute.await_args_list
+    ]
+    assert_that([len(params) for params in sent], equal_to([4, 4, 2]))
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_feeds_partition_sizer(query_executor, some_query_batch):
+    query_executor.database_connection.retry_policy = RetryPolicy(split_on=[])
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        on_error(client_error("ThrottlingException", 429))
+
+    query_executor.database_connection.execute.side_effect = execute
+    await query_executor.execute_batch(some_query_batch)
+    query = some_query_batch.as_query().query_statement
+    assert_that(query_executor.partition_sizer.state_for(query).failures, equal_to(1))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error",
+    [
+        DeadlineExceededError(),
+        RequestTimeoutError(),
+        ReadTimeoutError(endpoint_url="https://test-endpoint.com"),
+    ],
+)
+async def test_client_side_failures_do_not_shrink_partitions(query_executor, error):
+    query_executor.database_connection.retry_policy = RetryPolicy(split_on=[])
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        on_error(error)
+
+    query_executor.database_connection.execute.side_effect = execute
+    batch = QueryBatch("query", [{"id": 0}])
+    await query_executor.execute_batch(batch)
+    state = query_executor.partition_sizer.state_for(batch.as_query().query_statement)
+    assert_that(state.failures, equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_records_rows_per_request(query_executor, some_query_batch):
+    await query_executor.execute_batch(some_query_batch)
+    registry = query_executor.database_connection.metrics.registry
+    rows_per_request = registry.histogram_for("rows_per_request")
+    assert_that(rows_per_request.total, equal_to(10))
+
+
+def client_error(code: str, status: int) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "ExecuteOpenCypherQuery",
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "code,status,conflicts,failures",
+    [
+        ("ThrottlingException", 429, 0, 1),
+        ("ConcurrentModificationException", 500, 3, 0),
+    ],
+)
+async def test_retried_failures_shrink_partitions_once_per_conflict(
+    query_executor, code, status, conflicts, failures
+):
+    query_executor.database_connection.retry_policy = RetryPolicy(split_on=[])
+    error = client_error(code, status)
+
+    async def execute(query_stmt, parameters, on_retry=None, on_error=None, **kwargs):
+        on_retry(error)
+        on_retry(error)
+        on_error(error)
+
+    query_executor.database_connection.execute.side_effect = execute
+    batch = QueryBatch("query", [{"id": 0}])
+    await query_executor.execute_batch(batch)
+    state = query_executor.partition_sizer.state_for(batch.as_query().query_statement)
+    assert_that(state.conflicts, equal_to(conflicts))
+    assert_that(state.failures, equal_to(failures))
+
+
+@pytest.mark.asyncio
+async def test_split_parameters_serializes_rows_of_the_same_vertex(query_executor):
+    query_executor.partition_sizer = AdaptivePartitionSizer(
+        initial_size=2, min_size=1, adaptive=False
+    )
+    rows = [{"__from_node_id": "hub", "__to_node_id": str(i)} for i in range(4)]
+    rows.append({"__from_node_id": "a", "__to_node_id": "b"})
+    lanes = list(query_executor._split_parameters_into_lanes("query", rows))
+    assert_that(
+        lanes,
+        equal_to(
+            [
+                [{"params": rows[0:2]}, {"params": rows[2:4]}],
+                [{"params": rows[4:5]}],
+            ]
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_partitions_are_split_to_isolate_failing_rows(query_executor):
+    query_executor.database_connection.retry_policy = RetryPolicy()
+    query_executor.conflict_aware_partitioning = False
+    bad_row = {"id": 2}
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        if bad_row in parameters["params"]:
+            on_error(client_error("MemoryLimitExceededException", 400))
+            return None
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    query_executor.database_connection.execute.side_effect = execute
+    await query_executor.execute_batch(
+        QueryBatch("query", [{"id": i} for i in range(4)])
+    )
+    sent = [
+        [row["id"] for row in c.args[1]["params"]]
+        for c in query_executor.database_connection.execute.await_args_list
+    ]
+    assert_that(sent, equal_to([[0, 1, 2, 3], [0, 1], [2, 3], [2], [3]]))
+
+
+@pytest.mark.asyncio
+async def test_bad_requests_are_dead_lettered_without_splitting(query_executor, mocker):
+    query_executor.database_connection.retry_policy = RetryPolicy()
+    query_executor.dead_letters = mocker.Mock()
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        on_error(client_error("MalformedQueryException", 400))
+
+    query_executor.database_connection.execute.side_effect = execute
+    await query_executor.execute_batch(QueryBatch("query", [{"id": 0}, {"id": 1}]))
+    query_executor.database_connection.execute.assert_awaited_once()
+    (dead_letter,), _ = query_executor.dead_letters.write.call_args
+    assert_that(dead_letter.rows, equal_to([{"id": 0}, {"id": 1}]))
+    assert_that(dead_letter.error_category, equal_to("bad_request"))
+
+
+@pytest.mark.asyncio
+async def test_rows_failing_for_good_are_dead_lettered(query_executor, mocker):
+    query_executor.database_connection.retry_policy = RetryPolicy()
+    query_executor.dead_letters = mocker.Mock()
+    error = ClientError(
+        {
+            "Error": {"Code": "ConcurrentModificationException"},
+            "ResponseMetadata": {"HTTPStatusCode": 500},
+        },
+        "ExecuteOpenCypherQuery",
+    )
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        on_error(error)
+
+    query_executor.database_connection.execute.side_effect = execute
+    batch = QueryBatch("query", [{"id": 0}, {"id": 1}])
+    await query_executor.execute_batch(batch)
+    (dead_letter,), _ = query_executor.dead_letters.write.call_args
+    assert_that(dead_letter.query_statement, equal_to(batch.query_statement))
+    assert_that(dead_letter.rows, equal_to([{"id": 0}, {"id": 1}]))
+    assert_that(dead_letter.error_category, equal_to("conflict"))
+
+    await query_executor.finish()
+    query_executor.dead_letters.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_partitions_missing_the_batch_deadline_are_reported(query_executor):
+    query_executor.database_connection.scheduler = RequestScheduler(max_in_flight=1)
+    query_executor.partition_sizer = AdaptivePartitionSizer(
+        initial_size=1, min_size=1, adaptive=False
+    )
+    query_executor.conflict_aware_partitioning = False
+    query_executor.batch_timeout = 0.05
+
+    async def execute(query_stmt, parameters, on_error=None, deadline=None, **kwargs):
+        await asyncio.sleep(0.03)
+        if deadline.expired:
+            on_error(DeadlineExceededError())
+            return None
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    query_executor.database_connection.execute.side_effect = execute
+    batch = QueryBatch("query", [{"id": i} for i in range(4)])
+    incomplete = await query_executor.execute_batch(batch)
+    assert_that(incomplete, equal_to([[{"id": 1}], [{"id": 2}], [{"id": 3}]]))
+    assert_that(query_executor.database_connection.execute.await_count, equal_to(2))
+    registry = query_executor.database_connection.metrics.registry
+    tags = {"statement": statement_tag(batch.as_query().query_statement)}
+    assert_that(registry.counter_value("incomplete_rows", tags), equal_to(3))
+
+
+@pytest.mark.asyncio
+async def test_execute_logs_streamed_results(query_executor, some_query, mocker):
+    async def stream(query_stmt, parameters):
+        yield {"n": 1}
+
+    query_executor.database_connection.stream = stream
+    query_executor.logger = mocker.Mock()
+    await query_executor.execute(some_query, log_result=True)
+    query_executor.logger.info.assert_called_once_with(
+        "Gathered Query Results",
+        extra=dict(n=1, query=some_query.query_statement),
+    )
+
+
+@pytest.mark.asyncio
+async def test_upserts_coalesce_rows_of_the_same_node(query_executor):
+    query_executor.ingest_query_builder = NeptuneIngestQueryBuilder()
+    nodes = [
+        Node("Person", {"id": "1"}, {"name": "a"}),
+        Node("Person", {"id": "1"}, {"name": "b"}),
+        Node("Person", {"id": "2"}, {"name": "c"}),
+    ]
+    operation = OperationOnNodeIdentity(nodes[0].identity_shape, NodeCreationRule.EAGER)
+    await query_executor.upsert_nodes_in_bulk_with_same_operation(operation, nodes)
+    (call,) = query_executor.database_connection.execute.await_args_list
+    assert_that(
+        call.args[1]["params"],
+        equal_to(
+            [
+                {"__node_id": "Person_id:1", "name": "b"},
+                {"__node_id": "Person_id:2", "name": "c"},
+            ]
+        ),
+    )
+    registry = query_executor.database_connection.metrics.registry
+    assert_that(registry.counter_value("coalesced_rows"), equal_to(1))
+
+
+@pytest.mark.asyncio
+async def test_created_relationships_are_not_coalesced(query_executor):
+    query_executor.ingest_query_builder = NeptuneIngestQueryBuilder()
+    rel = RelationshipWithNodes(
+        Node("Person", {"id": "1"}), Node("Person", {"id": "2"}), Relationship("KNOWS")
+    )
+    operation = OperationOnRelationshipIdentity(
+        OperationOnNodeIdentity(rel.from_node.identity_shape, NodeCreationRule.EAGER),
+        OperationOnNodeIdentity(rel.to_node.identity_shape, NodeCreationRule.EAGER),
+        rel.relationship.identity_shape,
+        RelationshipCreationRule.CREATE,
+    )
+    await query_executor.upsert_relationships_in_bulk_of_same_operation(
+        operation, [rel, rel]
+    )
+    (call,) = query_executor.database_connection.execute.await_args_list
+    assert_that(len(call.args[1]["params"]), equal_to(2))
+
+
+@pytest.mark.asyncio
+async def test_write_buffer_merges_upserts_across_calls(query_executor):
+    query_executor.ingest_query_builder = NeptuneIngestQueryBuilder()
+    query_executor.write_buffer = WriteBuffer(
+        query_executor._write_batch, WriteBufferSettings(max_latency=60)
+    )
+    operation = OperationOnNodeIdentity(
+        Node("Person", {"id": "1"}).identity_shape, NodeCreationRule.EAGER
+    )
+    for id in ("1", "2", "1"):
+        await query_executor.upsert_nodes_in_bulk_with_same_operation(
+            operation, [Node("Person", {"id": id})]
+        )
+    query_executor.database_connection.execute.assert_not_awaited()
+    await query_executor.finish()
+    (call,) = query_executor.database_connection.execute.await_args_list
+    assert_that(len(call.args[1]["params"]), equal_to(2))
+
+
+@pytest.mark.asyncio
+async def test_plan_cache_is_warmed_before_the_first_write(
+    query_executor, some_query_batch
+):
+    query_executor.plan_cache_statements = ["warm me"]
+    query_executor.ingest_query_builder.generate_batch_update_node_operation_batch.return_value = (
+        some_query_batch
+    )
+    await query_executor.upsert_nodes_in_bulk_with_same_operation(None, None)
+    await query_executor.upsert_nodes_in_bulk_with_same_operation(None, None)
+    warm_ups = [
+        call.args
+        for call in query_executor.database_connection.execute.await_args_list
+        if call.args[1] == {"params": []}
+    ]
+    assert_that(
+        warm_ups,
+        equal_to(
+            [(QueryBatch("warm me", []).as_query().query_statement, {"params": []})]
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_plan_cache_warm_up_surfaces_malformed_statements(query_executor):
+    error = ClientError(
+        {
+            "Error": {"Code": "MalformedQueryException"},
+            "ResponseMetadata": {"HTTPStatusCode": 400},
+        },
+        "ExecuteOpenCypherQuery",
+    )
+
+    async def execute(query_stmt, parameters, on_error=None, **kwargs):
+        on_error(error)
+
+    query_executor.database_connection.execute.side_effect = execute
+    with pytest.raises(MalformedStatementError):
+        await query_executor.warm_plan_cache(["MATCH (n"])
+
+
+@pytest.mark.asyncio
+async def test_unchanged_nodes_are_not_written_again(query_executor):
+    query_executor.fingerprints = FingerprintCache()
+    batch = QueryBatch("query", [{"__node_id": "a", "name": "a"}])
+    query_executor.ingest_query_builder.generate_batch_update_node_operation_batch.return_value = (
+        batch
+    )
+    await query_executor.upsert_nodes_in_bulk_with_same_operation(None, None)
+    await query_executor.upsert_nodes_in_bulk_with_same_operation(None, None)
+    query_executor.database_connection.execute.assert_awaited_once()
+    assert_that(
+        query_executor.database_connection.metrics.registry.counter_value(
+            "unchanged_rows", {"statement": statement_tag("query")}
+        ),
+        equal_to(1),
+    )
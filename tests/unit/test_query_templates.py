@@ -0,0 +1,49 @@
+import pytest
+from hamcrest import assert_that, equal_to
+
+from nodestream_plugin_neptune.query_templates import (
+    escape_name,
+    render_labels,
+    render_node,
+    render_parameter,
+    render_relationship,
+)
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("Person", "Person"),
+        ("_private1", "_private1"),
+        ("My Type", "`My Type`"),
+        ("~id", "`~id`"),
+        ("1st", "`1st`"),
+        ("Weird`Name", "`Weird``Name`"),
+    ],
+)
+def test_escape_name(name, expected):
+    assert_that(escape_name(name), equal_to(expected))
+
+
+def test_render_node():
+    assert_that(render_node("n"), equal_to("(n)"))
+    assert_that(
+        render_node("n", "My Type", {"~id": "param.__node_id"}),
+        equal_to("(n: `My Type` {`~id` : param.__node_id})"),
+    )
+
+
+def test_render_relationship():
+    assert_that(
+        render_relationship("r", "KNOWS", {"since": render_parameter("since")}),
+        equal_to("[r: KNOWS {since : param.since}]"),
+    )
+    assert_that(render_relationship("r", "IS A"), equal_to("[r: `IS A`]"))
+
+
+def test_render_labels():
+    assert_that(render_labels(["A", "B C"]), equal_to(":A:`B C`"))
+
+
+def test_render_parameter():
+    assert_that(render_parameter("other key"), equal_to("param.`other key`"))
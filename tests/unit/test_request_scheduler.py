@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream_plugin_neptune.request_scheduler import RequestScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.order = []
+        self.release = asyncio.Event()
+
+    def make(self, name):
+        async def request():
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.order.append(name)
+            await self.release.wait()
+            self.in_flight -= 1
+            return name
+
+        return request
+
+
+@pytest.mark.asyncio
+async def test_limits_requests_in_flight():
+    scheduler = RequestScheduler(max_in_flight=2, max_queued=10)
+    recorder = Recorder()
+    futures = [await scheduler.submit("a", recorder.make(i)) for i in range(5)]
+    await asyncio.sleep(0)
+    assert_that(recorder.in_flight, equal_to(2))
+    recorder.release.set()
+    results = await asyncio.gather(*futures)
+    assert_that(results, equal_to([0, 1, 2, 3, 4]))
+    assert_that(recorder.peak, equal_to(2))
+    assert_that(scheduler.in_flight, equal_to(0))
+    assert_that(scheduler.queued, equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_alternates_between_sources():
+    scheduler = RequestScheduler(max_in_flight=1, max_queued=10)
+    recorder = Recorder()
+    recorder.release.set()
+    futures = [await scheduler.submit("a", recorder.make(f"a{i}")) for i in range(3)]
+    futures += [await scheduler.submit("b", recorder.make(f"b{i}")) for i in range(3)]
+    await asyncio.gather(*futures)
+    assert_that(recorder.order, equal_to(["a0", "a1", "b0", "a2", "b1", "b2"]))
+
+
+@pytest.mark.asyncio
+async def test_submit_blocks_while_queue_is_full():
+    scheduler = RequestScheduler(max_in_flight=1, max_queued=1)
+    recorder = Recorder()
+    await scheduler.submit("a", recorder.make(0))
+    await scheduler.submit("a", recorder.make(1))
+
+    blocked = asyncio.ensure_future(scheduler.submit("a", recorder.make(2)))
+    await asyncio.sleep(0)
+    assert_that(blocked.done(), equal_to(False))
+
+    recorder.release.set()
+    third = await blocked
+    assert_that(await third, equal_to(2))
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_frees_its_slot():
+    scheduler = RequestScheduler(max_in_flight=1, max_queued=10)
+    recorder = Recorder()
+    first = await scheduler.submit("a", recorder.make(0))
+    second = await scheduler.submit("a", recorder.make(1))
+    second.cancel()
+    recorder.release.set()
+    assert_that(await first, equal_to(0))
+    assert_that(await scheduler.run("a", recorder.make(2)), equal_to(2))
+    assert_that(scheduler.queued, equal_to(0))
+    assert_that(scheduler.in_flight, equal_to(0))
+
+
+def test_rejects_non_positive_limits():
+    with pytest.raises(ValueError):
+        RequestScheduler(max_in_flight=0)
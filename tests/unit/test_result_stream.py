@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream_plugin_neptune.result_stream import (
+    ResultStreamError,
+    iter_json_array_items,
+    iter_records_from_payload,
+)
+
+RECORDS = [
+    {"n": {"~id": "a", "name": "Zoë"}},
+    {"n": {"~id": "b", "tags": ["x", "]", "{"]}},
+    {"count": 12345},
+    {"nested": {"list": [1, 2, {"deep": True}]}},
+]
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 10_000])
+async def test_yields_records_regardless_of_chunking(chunk_size):
+    body = json.dumps({"results": RECORDS}, ensure_ascii=False).encode()
+    items = await collect(iter_json_array_items(chunked(body, chunk_size)))
+    assert_that(items, equal_to(RECORDS))
+
+
+@pytest.mark.asyncio
+async def test_numbers_split_across_chunks_are_not_truncated():
+    body = b'{"results": [123456, 7]}'
+    items = await collect(iter_json_array_items(chunked(body, 16)))
+    assert_that(items, equal_to([123456, 7]))
+
+
+@pytest.mark.asyncio
+async def test_empty_results():
+    items = await collect(iter_json_array_items(chunked(b'{"results": []}', 3)))
+    assert_that(items, equal_to([]))
+
+
+@pytest.mark.asyncio
+async def test_missing_results_raises():
+    with pytest.raises(ResultStreamError):
+        await collect(iter_json_array_items(chunked(b'{"other": []}', 3)))
+
+
+@pytest.mark.asyncio
+async def test_truncated_payload_raises():
+    with pytest.raises(ResultStreamError):
+        await collect(iter_json_array_items(chunked(b'{"results": [{"a": 1}, {"b', 3)))
+
+
+@pytest.mark.asyncio
+async def test_payload_is_closed_after_reading(mocker):
+    payload = mocker.Mock()
+    payload.iter_chunks = lambda: chunked(b'{"results": [{"a": 1}]}', 4)
+    records = await collect(iter_records_from_payload(payload))
+    assert_that(records, equal_to([{"a": 1}]))
+    payload.close.assert_called_once()
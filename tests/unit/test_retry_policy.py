@@ -0,0 +1,138 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+from hamcrest import (
+    assert_that,
+    equal_to,
+    greater_than_or_equal_to,
+    less_than_or_equal_to,
+)
+from nodestream_plugin_neptune.deadline import (
+    DeadlineExceededError,
+    RequestTimeoutError,
+)
+from nodestream_plugin_neptune.retry_policy import (
+    ErrorCategory,
+    RetryBudget,
+    RetryPolicy,
+    classify_error,
+    get_retry_budget,
+    is_idempotent,
+)
+
+
+def client_error(code: str, status: int) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "ExecuteOpenCypherQuery",
+    )
+
+
+@pytest.mark.parametrize(
+    "error,category",
+    [
+        (client_error("ConcurrentModificationException", 500), ErrorCategory.CONFLICT),
+        (client_error("ConflictException", 409), ErrorCategory.CONFLICT),
+        (client_error("ThrottlingException", 500), ErrorCategory.THROTTLING),
+        (client_error("SomethingElse", 429), ErrorCategory.THROTTLING),
+        (client_error("TimeLimitExceededException", 500), ErrorCategory.TIMEOUT),
+        (
+            client_error("MemoryLimitExceededException", 500),
+            ErrorCategory.LIMIT_EXCEEDED,
+        ),
+        (client_error("InternalFailureException", 500), ErrorCategory.SERVER_ERROR),
+        (client_error("MalformedQueryException", 400), ErrorCategory.BAD_REQUEST),
+        (client_error("AccessDeniedException", 403), ErrorCategory.AUTH),
+        (ReadTimeoutError(endpoint_url="https://host"), ErrorCategory.READ_TIMEOUT),
+        (
+            EndpointConnectionError(endpoint_url="https://host"),
+            ErrorCategory.CONNECTION,
+        ),
+        (ValueError("nope"), ErrorCategory.UNKNOWN),
+    ],
+)
+def test_classify_error(error, category):
+    assert_that(classify_error(error), equal_to(category))
+
+
+def test_classify_error_with_conflict_exceptions():
+    class Conflict(Exception):
+        pass
+
+    assert_that(classify_error(Conflict(), (Conflict,)), equal_to("conflict"))
+
+
+def test_should_retry_respects_categories_and_attempts():
+    policy = RetryPolicy(max_attempts=3, retry_on=["throttling"])
+    assert_that(policy.should_retry(ErrorCategory.THROTTLING, 1), equal_to(True))
+    assert_that(policy.should_retry(ErrorCategory.THROTTLING, 3), equal_to(False))
+    assert_that(policy.should_retry(ErrorCategory.CONFLICT, 1), equal_to(False))
+
+
+def test_should_split():
+    policy = RetryPolicy(split_on=["bad_request"])
+    assert_that(
+        policy.should_split(client_error("ParsingException", 400)), equal_to(True)
+    )
+    assert_that(
+        policy.should_split(client_error("ThrottlingException", 500)), equal_to(False)
+    )
+
+
+def test_client_side_timeouts_are_only_retried_for_idempotent_statements():
+    policy = RetryPolicy(retry_on=["request_timeout"], split_on=["read_timeout"])
+    timeout = ReadTimeoutError(endpoint_url="https://host")
+    assert_that(policy.should_retry(ErrorCategory.REQUEST_TIMEOUT, 1), equal_to(True))
+    assert_that(
+        policy.should_retry(ErrorCategory.REQUEST_TIMEOUT, 1, idempotent=False),
+        equal_to(False),
+    )
+    assert_that(policy.should_split(timeout), equal_to(True))
+    assert_that(policy.should_split(timeout, idempotent=False), equal_to(False))
+
+
+def test_is_idempotent():
+    assert_that(
+        is_idempotent("MERGE (n {id: 1}) ON CREATE SET n.a = 1 SET n += {}"),
+        equal_to(True),
+    )
+    assert_that(is_idempotent("MATCH (a), (b) create (a)-[:R]->(b)"), equal_to(False))
+
+
+def test_next_delay_uses_decorrelated_jitter():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    delay = None
+    for _ in range(20):
+        previous = delay or 1.0
+        delay = policy.next_delay(delay)
+        assert_that(delay, greater_than_or_equal_to(1.0))
+        assert_that(delay, less_than_or_equal_to(min(5.0, previous * 3)))
+
+
+def test_retry_budget_is_exhausted_and_refilled_by_requests():
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=0, max_balance=10)
+    assert_that(budget.try_withdraw(), equal_to(False))
+    budget.record_request()
+    budget.record_request()
+    assert_that(budget.try_withdraw(), equal_to(True))
+    assert_that(budget.try_withdraw(), equal_to(False))
+
+
+def test_policy_stops_retrying_when_budget_is_empty():
+    policy = RetryPolicy(budget_ratio=0.0, budget_min_retries_per_second=0.0)
+    assert_that(policy.should_retry(ErrorCategory.CONFLICT, 1), equal_to(False))
+
+
+def test_retry_budget_is_shared_process_wide():
+    assert_that(RetryPolicy().budget, equal_to(RetryPolicy().budget))
+    assert_that(get_retry_budget(0.2, 1.0), equal_to(get_retry_budget(0.2, 1.0)))
+
+
+def test_classifies_request_timeouts_and_deadlines():
+    assert_that(
+        classify_error(RequestTimeoutError()), equal_to(ErrorCategory.REQUEST_TIMEOUT)
+    )
+    assert_that(
+        classify_error(DeadlineExceededError()),
+        equal_to(ErrorCategory.DEADLINE_EXCEEDED),
+    )
+    assert_that(ErrorCategory.REQUEST_TIMEOUT in RetryPolicy().retry_on, equal_to(True))
@@ -0,0 +1,107 @@
+import json
+import math
+
+import numpy
+import pytest
+from hamcrest import assert_that, equal_to
+from pandas import Timestamp
+
+from nodestream_plugin_neptune import serialization
+from nodestream_plugin_neptune.columnar import ColumnarBatch
+from nodestream_plugin_neptune.serialization import convert_parameters, dumps_with_json
+
+requires_orjson = pytest.mark.skipif(
+    serialization.orjson is None, reason="orjson is not installed"
+)
+BACKENDS = [
+    pytest.param(dumps_with_json, id="json"),
+    pytest.param(
+        getattr(serialization, "dumps_with_orjson", None),
+        id="orjson",
+        marks=requires_orjson,
+    ),
+]
+
+SOME_DAY = Timestamp(1998, 3, 25, 2, 0, 1)
+
+PARAMETERS = {
+    "params": [
+        {
+            "__node_id": "Person_id:1",
+            "name": "Zoë",
+            "updated_at": SOME_DAY,
+            "score": numpy.float64(1.5),
+            "rank": numpy.int64(3),
+            "tags": ["a", "b"],
+            "missing": None,
+        }
+    ]
+}
+EXPECTED = {
+    "params": [
+        {
+            "__node_id": "Person_id:1",
+            "name": "Zoë",
+            "updated_at": SOME_DAY.timestamp(),
+            "score": 1.5,
+            "rank": 3,
+            "tags": ["a", "b"],
+            "missing": None,
+        }
+    ]
+}
+
+
+@pytest.mark.parametrize("dumps", BACKENDS)
+def test_serializes_parameters_in_one_pass(dumps):
+    assert_that(json.loads(dumps(PARAMETERS)), equal_to(EXPECTED))
+
+
+@pytest.mark.parametrize("dumps", BACKENDS)
+@pytest.mark.parametrize("value", [math.nan, math.inf, numpy.float64("nan")])
+def test_rejects_non_finite_floats(dumps, value):
+    with pytest.raises(ValueError, match="NaN and Infinity"):
+        dumps({"params": [{"value": value}]})
+
+
+@requires_orjson
+def test_orjson_falls_back_on_values_it_cannot_encode():
+    assert_that(
+        serialization.dumps_with_orjson({"big": 2**70}),
+        equal_to('{"big":%d}' % 2**70),
+    )
+
+
+def test_convert_parameters():
+    assert_that(convert_parameters(PARAMETERS), equal_to(EXPECTED))
+    with pytest.raises(ValueError):
+        convert_parameters({"params": [{"value": math.nan}]})
+
+
+@requires_orjson
+def test_orjson_rejects_non_finite_floats_in_arrays():
+    with pytest.raises(ValueError, match="NaN and Infinity"):
+        serialization.dumps_with_orjson({"scores": numpy.array([1.0, math.inf])})
+
+
+@requires_orjson
+def test_orjson_encodes_nulls_once(mocker):
+    dumps_with_json = mocker.spy(serialization, "dumps_with_json")
+    assert_that(
+        serialization.dumps_with_orjson({"params": [{"name": "null", "v": None}]}),
+        equal_to('{"params":[{"name":"null","v":null}]}'),
+    )
+    dumps_with_json.assert_not_called()
+
+
+@pytest.mark.parametrize("dumps", BACKENDS)
+@pytest.mark.parametrize(
+    "make_params",
+    [
+        lambda: ColumnarBatch.from_rows([{"scores": [1.0, math.nan]}]),
+        lambda: [{"scores": [1.0, math.nan]}],
+    ],
+)
+def test_rejects_non_finite_floats_in_lists(dumps, make_params):
+    with pytest.raises(ValueError, match="NaN and Infinity"):
+        dumps({"params": make_params()})
@@ -0,0 +1,76 @@
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream.databases.query_executor import OperationOnNodeIdentity
+from nodestream.model import Node, NodeCreationRule
+from nodestream.schema import (
+    Adjacency,
+    AdjacencyCardinality,
+    GraphObjectSchema,
+    Schema,
+)
+
+from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
+from nodestream_plugin_neptune.statement_cache import StatementCache
+
+
+def test_statement_cache_evicts_least_recently_used():
+    cache = StatementCache(max_size=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert_that(cache.get("a"), equal_to("A"))
+    cache.put("c", "C")
+    assert_that("b" in cache, equal_to(False))
+    assert_that(cache.get("b"), equal_to(None))
+    info = cache.info()
+    assert_that(
+        (info.hits, info.misses, info.evictions, info.size),
+        equal_to((1, 1, 1, 2)),
+    )
+    assert_that(info.hit_rate, equal_to(0.5))
+
+
+def test_statement_cache_size_is_validated():
+    with pytest.raises(ValueError):
+        StatementCache(0)
+
+
+def test_builders_share_statements_for_the_same_node_type():
+    cache = StatementCache()
+    operations = [
+        OperationOnNodeIdentity(
+            Node("Person", key_values).identity_shape, NodeCreationRule.EAGER
+        )
+        for key_values in ({"id": "1"}, {"first": "a", "last": "b"})
+    ]
+    statements = [
+        NeptuneIngestQueryBuilder(
+            statement_cache=cache
+        ).generate_update_node_operation_query_statement(operation)
+        for operation in operations
+    ]
+    assert_that(statements[0], equal_to(statements[1]))
+    assert_that((cache.hits, cache.misses, len(cache)), equal_to((1, 1, 1)))
+
+
+def test_warm_statement_cache_renders_schema_statements():
+    schema = Schema()
+    person = GraphObjectSchema("Person")
+    person.add_key("id")
+    knows = GraphObjectSchema("KNOWS")
+    knows.add_key("since")
+    schema.put_node_type(person)
+    schema.put_relationship_type(knows)
+    schema.add_adjacency(Adjacency("Person", "Person", "KNOWS"), AdjacencyCardinality())
+
+    cache = StatementCache()
+    builder = NeptuneIngestQueryBuilder(statement_cache=cache)
+    # One statement per creation rule of nodes and of relationships.
+    assert_that(builder.warm_statement_cache(schema), equal_to(5))
+    assert_that((cache.hits, cache.misses), equal_to((0, 0)))
+    assert_that(builder.warm_statement_cache(schema), equal_to(0))
+
+    operation = OperationOnNodeIdentity(
+        Node("Person", {"id": "1"}).identity_shape, NodeCreationRule.MATCH_ONLY
+    )
+    builder.generate_update_node_operation_query_statement(operation)
+    assert_that((cache.hits, cache.misses), equal_to((1, 0)))
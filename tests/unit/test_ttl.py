@@ -0,0 +1,111 @@
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream.model import TimeToLiveConfiguration
+from nodestream.schema import GraphObjectType
+
+from nodestream_plugin_neptune.ingest_query_builder import NeptuneIngestQueryBuilder
+from nodestream_plugin_neptune.metrics import Metrics
+from nodestream_plugin_neptune.neptune_connection import QueryFailedError
+from nodestream_plugin_neptune.request_scheduler import RequestScheduler
+from nodestream_plugin_neptune.ttl import BatchedTimeToLive, TimeToLiveSettings
+
+NODE_TTL = TimeToLiveConfiguration(GraphObjectType.NODE, "NodeType")
+
+
+class FakeConnection:
+    """Deletes `expired` ids in the order batches ask for them."""
+
+    def __init__(self, expired, failing_batches=(), failing_scans=()):
+        self.expired = sorted(expired)
+        self.failing_batches = set(failing_batches)
+        self.failing_scans = set(failing_scans)
+        self.batches = []
+        self.scans = 0
+        self.scheduler = RequestScheduler()
+        self.metrics = Metrics()
+
+    async def execute(self, query_stmt, parameters, keep_payload=False):
+        self.batches.append(parameters)
+        if len(self.batches) in self.failing_batches:
+            return None
+        if "ids" in parameters:
+            deleted = [id for id in parameters["ids"] if id in self.expired]
+        else:
+            deleted = self.expired[: parameters["batch_size"]]
+        self.expired = [id for id in self.expired if id not in deleted]
+        return {"results": [{"deleted": len(deleted)}]}
+
+    async def records(self, response):
+        for record in response["results"]:
+            yield record
+
+    async def stream(self, query_stmt, parameters, read_only=False, raise_errors=False):
+        self.scans += 1
+        if self.scans in self.failing_scans:
+            if raise_errors:
+                raise QueryFailedError(query_stmt)
+            return
+        ids = [id for id in self.expired if id > parameters["last_id"]]
+        for id in ids[: parameters["batch_size"]]:
+            yield {"id": id}
+
+
+def make_time_to_live(connection, **settings):
+    return BatchedTimeToLive(
+        connection, NeptuneIngestQueryBuilder(), TimeToLiveSettings(**settings)
+    )
+
+
+@pytest.mark.asyncio
+async def test_expire_deletes_in_batches_until_one_is_not_full():
+    connection = FakeConnection(["a", "b", "c", "d", "e", "f", "g"])
+    deleted = await make_time_to_live(connection, batch_size=3).expire(NODE_TTL)
+    assert_that(deleted, equal_to(7))
+    assert_that(len(connection.batches), equal_to(3))
+    assert_that(
+        connection.metrics.registry.counter_value(
+            "ttl_deleted_objects", {"object_type": "NodeType"}
+        ),
+        equal_to(7),
+    )
+
+
+@pytest.mark.asyncio
+async def test_expire_stops_when_a_batch_fails():
+    connection = FakeConnection(["a", "b", "c", "d"], failing_batches=[2])
+    deleted = await make_time_to_live(connection, batch_size=2).expire(NODE_TTL)
+    assert_that(deleted, equal_to(2))
+    assert_that(len(connection.batches), equal_to(2))
+
+
+@pytest.mark.asyncio
+async def test_expire_deletes_disjoint_id_pages_concurrently():
+    connection = FakeConnection(["a", "b", "c", "d", "e"])
+    deleted = await make_time_to_live(connection, batch_size=2, concurrency=2).expire(
+        NODE_TTL
+    )
+    assert_that(deleted, equal_to(5))
+    assert_that(
+        [batch["ids"] for batch in connection.batches],
+        equal_to([["a", "b"], ["c", "d"], ["e"]]),
+    )
+
+
+@pytest.mark.asyncio
+async def test_expire_reports_a_failed_id_scan(mocker):
+    connection = FakeConnection(["a", "b", "c", "d", "e"], failing_scans=[2])
+    time_to_live = make_time_to_live(connection, batch_size=2, concurrency=2)
+    report_failure = mocker.spy(time_to_live, "_report_failure")
+    deleted = await time_to_live.expire(NODE_TTL)
+    assert_that(deleted, equal_to(2))
+    assert_that([batch["ids"] for batch in connection.batches], equal_to([["a", "b"]]))
+    report_failure.assert_called_once_with(NODE_TTL, 2)
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [{"batch_size": 0}, {"concurrency": 0}, {"pause": -1}],
+)
+def test_time_to_live_settings_are_validated(settings):
+    with pytest.raises(ValueError):
+        TimeToLiveSettings(**settings)
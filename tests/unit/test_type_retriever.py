@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+from nodestream_plugin_neptune.neptune_connection import QueryFailedError
+from nodestream_plugin_neptune.type_retriever import (
+    NODE_QUERY_FORMATS,
+    NeptuneDBTypeRetriever,
+    merge_async_iterators,
+)
+
+
+@pytest.fixture
+def connector(mocker):
+    return mocker.Mock()
+
+
+def test_extractors_use_keyset_pagination(connector):
+    retriever = NeptuneDBTypeRetriever(connector, page_size=500)
+    extractor = retriever.get_node_type_extractor("Person")
+    assert_that(extractor.cursor_key, equal_to("cursor"))
+    assert_that(extractor.limit, equal_to(500))
+    assert_that("WHERE id(n) > $last_id" in extractor.query, equal_to(True))
+
+
+def test_extractors_can_fall_back_to_offset_pagination(connector):
+    retriever = NeptuneDBTypeRetriever(connector, keyset_pagination=False)
+    extractor = retriever.get_relationship_type_extractor("KNOWS")
+    assert_that(extractor.cursor_key, equal_to(None))
+    assert_that("SKIP $offset" in extractor.query, equal_to(True))
+
+
+class FakeConnection:
+    """Answers type retrieval queries from a sorted list of node ids."""
+
+    def __init__(self, ids, failing=None):
+        self.ids = sorted(ids)
+        self.failing = failing
+        self.queries = []
+
+    async def stream(self, query, parameters, read_only=False, raise_errors=False):
+        self.queries.append((query, parameters))
+        if self.failing is not None and self.failing in query:
+            if raise_errors:
+                raise QueryFailedError(query)
+            return
+        if "count(" in query:
+            yield {"count": len(self.ids)}
+        elif "SKIP $offset LIMIT 1" in query:
+            if parameters["offset"] < len(self.ids):
+                yield {"cursor": self.ids[parameters["offset"]]}
+        else:
+            upper = parameters.get("upper_id")
+            matching = [
+                id
+                for id in self.ids
+                if id > parameters["last_id"] and (upper is None or id <= upper)
+            ]
+            for id in matching[: parameters["limit"]]:
+                yield {"n": {"~id": id}, "cursor": id}
+
+
+@pytest.fixture
+def fake_connector(mocker):
+    connector = mocker.Mock()
+    connector.connection = FakeConnection([f"id-{i:03}" for i in range(250)])
+    return connector
+
+
+@pytest.mark.asyncio
+async def test_ranges_cover_every_id_exactly_once(fake_connector):
+    retriever = NeptuneDBTypeRetriever(fake_connector, page_size=20, parallelism=4)
+    rows = [row async for row in retriever.extract_type(NODE_QUERY_FORMATS, "A")]
+    ids = [row["n"]["~id"] for row in rows]
+    assert_that(sorted(ids), equal_to(fake_connector.connection.ids))
+
+
+@pytest.mark.asyncio
+async def test_boundaries_split_type_evenly(fake_connector):
+    retriever = NeptuneDBTypeRetriever(fake_connector, page_size=20, parallelism=4)
+    boundaries = await retriever.get_id_range_boundaries(NODE_QUERY_FORMATS, "A")
+    assert_that(boundaries, equal_to(["id-061", "id-124", "id-186"]))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failing", ["count(", "SKIP $offset LIMIT 1"])
+async def test_failed_boundary_lookups_are_raised(fake_connector, failing):
+    fake_connector.connection.failing = failing
+    retriever = NeptuneDBTypeRetriever(fake_connector, page_size=20, parallelism=4)
+    with pytest.raises(QueryFailedError):
+        await retriever.get_id_range_boundaries(NODE_QUERY_FORMATS, "A")
+
+
+@pytest.mark.asyncio
+async def test_small_types_are_read_in_a_single_range(fake_connector):
+    retriever = NeptuneDBTypeRetriever(fake_connector, page_size=1000, parallelism=4)
+    boundaries = await retriever.get_id_range_boundaries(NODE_QUERY_FORMATS, "A")
+    assert_that(boundaries, equal_to([]))
+
+
+@pytest.mark.asyncio
+async def test_merge_async_iterators_propagates_errors():
+    async def failing():
+        yield 1
+        raise RuntimeError("boom")
+
+    async def endless():
+        while True:
+            yield 2
+            await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError):
+        async for _ in merge_async_iterators([failing(), endless()]):
+            pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sources", [1, 2])
+async def test_merge_async_iterators_closes_its_sources(sources):
+    closed = []
+
+    async def endless(name):
+        try:
+            while True:
+                yield name
+                await asyncio.sleep(0)
+        finally:
+            closed.append(name)
+
+    merged = merge_async_iterators([endless(i) for i in range(sources)])
+    async for _ in merged:
+        break
+    await merged.aclose()
+    assert_that(sorted(closed), equal_to(list(range(sources))))
+
+
+def test_parallelism_must_be_positive(connector):
+    with pytest.raises(ValueError):
+        NeptuneDBTypeRetriever(connector, parallelism=0)
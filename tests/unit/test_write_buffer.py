@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from nodestream_plugin_neptune.columnar import ColumnarBatch, concat_batches
+from nodestream_plugin_neptune.query import QueryBatch
+from nodestream_plugin_neptune.write_buffer import WriteBuffer, WriteBufferSettings
+
+
+class Recorder:
+    def __init__(self):
+        self.writes = []
+
+    async def __call__(self, query_batch, key_names):
+        self.writes.append((query_batch.query_statement, list(query_batch.parameters)))
+
+
+def rows(*ids):
+    return ColumnarBatch.from_rows({"__node_id": id} for id in ids)
+
+
+@pytest.mark.asyncio
+async def test_flushes_once_max_rows_are_buffered():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, WriteBufferSettings(max_rows=3, max_latency=60))
+    await buffer.add(QueryBatch("nodes", rows("a", "b")), None)
+    assert_that(recorder.writes, equal_to([]))
+    await buffer.add(QueryBatch("nodes", rows("c")), None)
+    assert_that(
+        recorder.writes,
+        equal_to([("nodes", [{"__node_id": id} for id in "abc"])]),
+    )
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flushes_once_max_bytes_are_buffered():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, WriteBufferSettings(max_bytes=10, max_latency=60))
+    await buffer.add(QueryBatch("nodes", rows("a")), None)
+    assert_that(len(recorder.writes), equal_to(1))
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_max_latency():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, WriteBufferSettings(max_latency=0.01))
+    await buffer.add(QueryBatch("nodes", rows("a")), None)
+    await asyncio.sleep(0.05)
+    assert_that(recorder.writes, equal_to([("nodes", [{"__node_id": "a"}])]))
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_nodes_are_written_before_relationships():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, WriteBufferSettings(max_rows=2, max_latency=60))
+    await buffer.add(QueryBatch("rels", rows("r1")), None, is_relationship=True)
+    await buffer.add(QueryBatch("nodes", rows("a")), None)
+    await buffer.add(QueryBatch("rels", rows("r2")), None, is_relationship=True)
+    assert_that([write[0] for write in recorder.writes], equal_to(["nodes", "rels"]))
+
+
+@pytest.mark.asyncio
+async def test_close_writes_everything_left():
+    recorder = Recorder()
+    buffer = WriteBuffer(recorder, WriteBufferSettings(max_latency=60))
+    await buffer.add(QueryBatch("rels", rows("r")), None, is_relationship=True)
+    await buffer.add(QueryBatch("nodes", rows("a")), None)
+    await buffer.close()
+    assert_that([write[0] for write in recorder.writes], equal_to(["nodes", "rels"]))
+    assert_that(buffer.entries, equal_to({}))
+
+
+def test_concat_batches_fills_missing_columns():
+    first = ColumnarBatch.from_rows([{"a": 1}])
+    second = ColumnarBatch.from_rows([{"b": 2}])
+    assert_that(concat_batches([first, second]), equal_to([{"a": 1}, {"b": 2}]))
+    assert_that(concat_batches([first, [{"c": 3}]]), equal_to([{"a": 1}, {"c": 3}]))